@@ -1,11 +1,66 @@
+from django.conf import settings
 from django.contrib import admin
+from django.http import HttpRequest, QueryDict
+from django.urls import reverse
 from django.utils.html import format_html
 
-from .models import Contact, Product, SalesNetworkCell
+from . import tasks
+from .cache import get_cache, get_tag_versions
+from .models import BulkOperation, Contact, Product, SalesNetworkCell
+from .paginators import EstimatedCountPaginator
+from .search import search
+
+
+class CachedAllValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """List filter whose choices, a DISTINCT over the whole related table, are cached
+    until one of the cache tags is bumped by the signal handlers."""
+
+    cache_tags = ()
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        versions = ",".join(get_tag_versions(self.cache_tags))
+        key = f"api-cache:admin-filter:{model._meta.label_lower}:{field_path}:{versions}"
+        cache = get_cache()
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(self.lookup_choices)
+            cache.set(key, choices, timeout=getattr(settings, "API_CACHE_TIMEOUT", 300))
+        self.lookup_choices = choices
+
+
+class ContactListFilter(CachedAllValuesFieldListFilter):
+    cache_tags = ("contact:all", "contact:list")
+
+
+class HierarchyLevelListFilter(admin.SimpleListFilter):
+    """Filter on the fixed hierarchy levels, without querying the distinct values of the column."""
+
+    title = "hierarchy level"
+    parameter_name = "hierarchy_level"
+
+    def lookups(self, request, model_admin):
+        return [(str(level), str(level)) for level in sorted(set(SalesNetworkCell.LEVEL_NAMES.values()))]
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(hierarchy_level=self.value())
+        return queryset
+
+
+class IndexedSearchMixin:
+    """Admin search on the model's SEARCH_FIELDS with api.search, which uses the full-text and trigram
+    indexes, instead of an unindexed 'icontains' scan of every search field."""
+
+    def get_search_fields(self, request):
+        return self.model.SEARCH_FIELDS
+
+    def get_search_results(self, request, queryset, search_term):
+        return search(queryset, search_term, rank=False), False
 
 
 @admin.register(SalesNetworkCell)
-class SalesNetworkCellAdmin(admin.ModelAdmin):
+class SalesNetworkCellAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "name",
@@ -17,10 +72,10 @@ class SalesNetworkCellAdmin(admin.ModelAdmin):
         "debt",
         "created_at",
     )
-    search_fields = ("name",)
+    list_select_related = ("supplier", "contact")
     list_filter = (
-        "contact__city",
-        "hierarchy_level",
+        ("contact__city", ContactListFilter),
+        HierarchyLevelListFilter,
     )
     ordering = (
         "hierarchy_level",
@@ -28,6 +83,13 @@ class SalesNetworkCellAdmin(admin.ModelAdmin):
     )
     actions = ["clear_debt"]
     exclude = ("hierarchy_level",)
+    # bounded page cost at any table size: estimated count, no unfiltered count and no facet counts
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("products")
 
     def supplier_link(self, obj):
         """Adding a link to the supplier in the admin interface."""
@@ -45,16 +107,39 @@ class SalesNetworkCellAdmin(admin.ModelAdmin):
 
     products_list.short_description = "Products"
 
+    def get_selection(self, request, queryset):
+        """Return the selection of an action as JSON: the filters and search of the changelist,
+        and the ids of the selected cells unless all the cells of the changelist were selected."""
+        selection = {"params": dict(request.GET.lists())}
+        if request.POST.get("select_across") != "1":
+            selection["ids"] = list(queryset.prefetch_related(None).values_list("id", flat=True))
+        return selection
+
+    def get_selection_queryset(self, selection, user):
+        """Return the cells of a selection from get_selection, as the changelist of the user shows them."""
+        request = HttpRequest()
+        request.method, request.user = "GET", user
+        request.GET = QueryDict(mutable=True)
+        for key, values in selection.get("params", {}).items():
+            request.GET.setlist(key, values)
+        queryset = self.get_changelist_instance(request).queryset
+        if "ids" in selection:
+            queryset = queryset.filter(id__in=selection["ids"])
+        return queryset
+
     def clear_debt(self, request, queryset):
-        """Admin action for clearing debt"""
-        queryset.update(debt=0)
-        self.message_user(request, "Debt successfully cleared")
+        """Admin action for clearing debt, run in chunks by a background worker."""
+        operation = tasks.enqueue("clear_debt", self.get_selection(request, queryset), request.user)
+        url = reverse("admin:api_bulkoperation_change", args=[operation.pk])
+        self.message_user(
+            request, format_html('Debt is being cleared in the background, see <a href="{}">its progress</a>', url)
+        )
 
     clear_debt.short_description = "Clear the debt for selected cells"
 
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "email",
@@ -63,19 +148,60 @@ class ContactAdmin(admin.ModelAdmin):
         "street",
         "house_number",
     )
-    search_fields = ("country", "city", "street", "house_number")
     list_filter = ("country", "city")
     ordering = ("country", "city", "street", "house_number")
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "name",
         "model",
         "release_date",
     )
-    search_fields = ("name", "model", "release_date")
     list_filter = ("release_date",)
     ordering = ("-release_date",)
+
+
+@admin.register(BulkOperation)
+class BulkOperationAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "action",
+        "status",
+        "progress_display",
+        "processed",
+        "total",
+        "created_by",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "action")
+    readonly_fields = tuple(field for field in list_display if field != "id") + (
+        "last_id",
+        "chunk_size",
+        "worker",
+        "heartbeat_at",
+        "error",
+    )
+    exclude = ("selection",)
+    actions = ["resume_operations"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_display(self, obj):
+        """Showing the progress of the operation in the admin interface."""
+        return "-" if obj.progress is None else f"{obj.progress}%"
+
+    progress_display.short_description = "Progress"
+
+    def resume_operations(self, request, queryset):
+        """Admin action for resuming failed operations after their last processed cell"""
+        for pk in queryset.filter(status="failed").values_list("pk", flat=True):
+            if tasks.resume(pk):
+                tasks.submit(pk)
+        self.message_user(request, "Failed operations resumed")
+
+    resume_operations.short_description = "Resume the selected failed operations"
@@ -0,0 +1,69 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework.response import Response
+
+
+class AsyncListMixin:
+    """Async counterpart of ListModelMixin: the page and its prefetched relations are fetched with the async ORM."""
+
+    async def aget(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = self.paginator
+        page = await paginator.apaginate_queryset(queryset, request, view=self) if paginator else None
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        objects = [obj async for obj in queryset.aiterator(chunk_size=2000)]
+        return Response(self.get_serializer(objects, many=True).data)
+
+
+class AsyncRetrieveMixin:
+    """Async counterpart of RetrieveModelMixin, the object is fetched with aget."""
+
+    async def aget(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        self.check_object_permissions(request, obj)
+        return Response(self.get_serializer(obj).data)
+
+
+class AsyncReadView(View):
+    """Natively async endpoint serving the GET requests of a DRF read view (view_class) through its 'aget'.
+    Content negotiation, authentication, permissions, filtering, serialization and rendering are those of the
+    DRF view. The checks of 'initial' (authentication, permissions and throttling, which read the database and
+    the cache) run together in a thread, the queries of the view are handed to the async ORM and the rest runs
+    in the event loop."""
+
+    view_class = None
+    http_method_names = ["get", "head", "options"]
+
+    async def get(self, request, *args, **kwargs):
+        view = self.view_class()
+        view.args, view.kwargs = args, kwargs
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        view.headers = view.default_response_headers
+        try:
+            await sync_to_async(view.initial)(request, *args, **kwargs)
+            response = await view.aget(request, *args, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        response = view.finalize_response(request, response, *args, **kwargs)
+        if not isinstance(response, Response):  # e.g. 304 Not Modified
+            return response
+        # rendered here, Django would render a TemplateResponse in a thread
+        response.render()
+        return HttpResponse(response.content, status=response.status_code, headers=dict(response.items()))
+
+
+def read_view(view_class):
+    """Return the view function of a DRF read view, natively async when ASYNC_READ_VIEWS is set (ASGI servers)."""
+    if getattr(settings, "ASYNC_READ_VIEWS", False):
+        return AsyncReadView.as_view(view_class=view_class)
+    return view_class.as_view()
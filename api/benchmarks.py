@@ -0,0 +1,149 @@
+import asyncio
+import io
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import CommandError
+from django.db import connections
+from django.urls import reverse
+
+from users.models import User
+from users.serializers import UserTokenObtainPairSerializer
+
+from .models import Contact, Product, SalesNetworkCell
+
+
+def get_paths():
+    """List and detail endpoints served by api.async_views.read_view, the details of the first rows."""
+    paths = [
+        reverse("api:product-list"),
+        reverse("api:contact-list"),
+        reverse("api:cell-list"),
+        reverse("users:users_list"),
+    ]
+    for model, name in (
+        (Product, "api:product-detail"),
+        (Contact, "api:contact-detail"),
+        (SalesNetworkCell, "api:cell-detail"),
+    ):
+        pk = model.objects.values_list("pk", flat=True).order_by("pk").first()
+        if pk is not None:
+            paths.append(reverse(name, kwargs={"pk": pk}))
+    return paths
+
+
+def get_authorization():
+    """Authorization header of an active staff employee, allowed on every read endpoint."""
+    user = User.objects.filter(is_active=True, is_employee=True, is_staff=True).first()
+    if user is None:
+        raise CommandError("An active staff employee is needed to authenticate the requests")
+    return f"Bearer {UserTokenObtainPairSerializer.get_token(user).access_token}"
+
+
+def summarize(statuses, latencies, seconds):
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else list(latencies) * 99
+    return {
+        "requests": len(latencies),
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "errors": sum(status >= 400 for status in statuses),
+    }
+
+
+def serve_wsgi(urls, authorization, concurrency, warm_up=True):
+    """Send GET requests for the urls to the WSGI handler from a pool of threads, like a threaded worker.
+    Return the statuses, the latencies and the total time, without the warm-up requests."""
+    handler = WSGIHandler()
+
+    def request(path):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "testserver",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": "testserver",
+            "HTTP_AUTHORIZATION": authorization,
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr,
+            "wsgi.url_scheme": "http",
+        }
+        status = []
+        before = time.perf_counter()
+        response = handler(environ, lambda line, headers, exc_info=None: status.append(line))
+        b"".join(response)
+        response.close()
+        return int(status[0].split()[0]), time.perf_counter() - before
+
+    barrier = threading.Barrier(concurrency)
+
+    def close_connections(_):
+        # once in each thread, the persistent connections would outlive the pool otherwise
+        barrier.wait()
+        connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if warm_up:
+            list(executor.map(request, urls[:concurrency]))
+        started = time.perf_counter()
+        results = list(executor.map(request, urls))
+        seconds = time.perf_counter() - started
+        list(executor.map(close_connections, range(concurrency)))
+    statuses, latencies = zip(*results)
+    return statuses, latencies, seconds
+
+
+async def serve_asgi(urls, authorization, concurrency):
+    """Send GET requests for the urls to the ASGI handler, at most 'concurrency' at the same time.
+    Return the statuses, the latencies and the total time, without the warm-up requests."""
+    handler = ASGIHandler()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(path):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"testserver"), (b"authorization", authorization.encode())],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # no disconnect until the response is sent
+            return await asyncio.Future()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        async with semaphore:
+            before = time.perf_counter()
+            await handler(scope, receive, send)
+            return status[0], time.perf_counter() - before
+
+    await asyncio.gather(*(request(path) for path in urls[:concurrency]))  # warm-up
+    started = time.perf_counter()
+    results = await asyncio.gather(*(request(path) for path in urls))
+    seconds = time.perf_counter() - started
+    statuses, latencies = zip(*results)
+    return statuses, latencies, seconds
@@ -0,0 +1,256 @@
+import hashlib
+import heapq
+import itertools
+import logging
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+HITS_KEY = "api-cache:hits"
+MISSES_KEY = "api-cache:misses"
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "default")]
+
+
+def tag_key(tag):
+    return f"api-cache:tag:{tag}"
+
+
+def get_tag_versions(tags):
+    """Return the current version of each tag. Tags missing from the cache (never bumped or evicted)
+    get a new unique version, so entries built with an evicted version can never be served again."""
+    cache = get_cache()
+    keys = [tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_tags(tags):
+    """Invalidate every cached response depending on one of the tags."""
+    if tags:
+        get_cache().set_many({tag_key(tag): uuid.uuid4().hex for tag in tags}, timeout=None)
+
+
+def invalidate(tags):
+    """Invalidate the tags now and again once the current transaction commits,
+    so a response cached from a concurrent read of the old rows is not kept."""
+    tags = set(tags)
+    bump_tags(tags)
+    transaction.on_commit(lambda: bump_tags_after_commit(tags))
+
+
+def bump_tags_after_commit(tags):
+    """Bump the tags, and with read replicas a last time once the commit has replicated
+    (after DATABASE_REPLICA_LAG), so a response cached from a replica still behind is not kept."""
+    bump_tags(tags)
+    if getattr(settings, "DATABASE_REPLICAS", []):
+        delayed_bumps.add(tags, getattr(settings, "DATABASE_REPLICA_LAG", 5))
+
+
+class DelayedBumps:
+    """Tags to bump again once their delay has passed, by a single daemon thread of the process started
+    with the first of them. The tags due at the same time are bumped together."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.pending = []  # heap of (due time, order, tags)
+        self.order = itertools.count()
+        self.thread = None
+
+    def add(self, tags, delay):
+        with self.condition:
+            heapq.heappush(self.pending, (time.monotonic() + delay, next(self.order), tags))
+            if self.thread is None or not self.thread.is_alive():  # not started, or started before a fork
+                self.thread = threading.Thread(target=self.run, name="api-cache-delayed-bumps", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def pop_due(self):
+        """Wait for the next due tags and return them with every other tag due by then."""
+        with self.condition:
+            while not self.pending or self.pending[0][0] > time.monotonic():
+                self.condition.wait(self.pending[0][0] - time.monotonic() if self.pending else None)
+            now, tags = time.monotonic(), set()
+            while self.pending and self.pending[0][0] <= now:
+                tags.update(heapq.heappop(self.pending)[2])
+            return tags
+
+    def run(self):
+        while True:
+            tags = self.pop_due()
+            try:
+                bump_tags(tags)
+            except Exception:
+                logger.exception("Delayed bump of the cache tags %s failed", sorted(tags))
+
+
+delayed_bumps = DelayedBumps()
+
+
+def deleted_key(model):
+    return f"api-cache:deleted:{model._meta.label_lower}"
+
+
+def mark_deleted(model):
+    """Record when a row of the model was last deleted, which changes its lists without bumping any updated_at."""
+    get_cache().set(deleted_key(model), timezone.now(), timeout=None)
+
+
+def get_last_deletion(model):
+    """Return when a row of the model was last deleted. If unknown (e.g. evicted), assume just now."""
+    cache = get_cache()
+    deleted_at = cache.get(deleted_key(model))
+    if deleted_at is None:
+        deleted_at = timezone.now()
+        cache.add(deleted_key(model), deleted_at, timeout=None)
+    return deleted_at
+
+
+def count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    """Return the hit and miss counters shared by all processes using the cache."""
+    stats = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": stats.get(HITS_KEY, 0), "misses": stats.get(MISSES_KEY, 0)}
+
+
+class CachedResponseMixin:
+    """Mixin for list and retrieve views caching the response data.
+    The key is built from the path, the query string, the permission classes and the versions
+    of the view's cache tags, which are bumped by the signal handlers when the rows change.
+    Authentication and permission checks still run before the cache is read."""
+
+    cache_name = None
+
+    def get_cache_tags(self):
+        if "pk" in self.kwargs:
+            return [f"{self.cache_name}:all", f"{self.cache_name}:{self.kwargs['pk']}"]
+        return [f"{self.cache_name}:all", f"{self.cache_name}:list"]
+
+    def get_cache_key(self, request):
+        permissions = ",".join(permission.__class__.__name__ for permission in self.get_permissions())
+        versions = ",".join(get_tag_versions(self.get_cache_tags()))
+        raw = f"{request.path}?{request.META.get('QUERY_STRING', '')}|{permissions}|{versions}"
+        return f"api-cache:response:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+
+    def get(self, request, *args, **kwargs):
+        key, response = self.get_cached_response(request)
+        if response is None:
+            response = self.cache_response(key, super().get(request, *args, **kwargs))
+        return response
+
+    async def aget(self, request, *args, **kwargs):
+        # the cache calls block, they run in a thread like the queries of the async ORM
+        key, response = await sync_to_async(self.get_cached_response)(request)
+        if response is None:
+            response = await sync_to_async(self.cache_response)(key, await super().aget(request, *args, **kwargs))
+        return response
+
+    def get_cached_response(self, request):
+        """Return the cache key and the cached response, or None on a miss."""
+        key = self.get_cache_key(request)
+        data = get_cache().get(key)
+        if data is None:
+            count(MISSES_KEY)
+            return key, None
+        count(HITS_KEY)
+        response = Response(data)
+        response["X-Cache"] = "HIT"
+        return key, response
+
+    def cache_response(self, key, response):
+        if response.status_code == 200:
+            get_cache().set(key, response.data, timeout=getattr(settings, "API_CACHE_TIMEOUT", 300))
+        response["X-Cache"] = "MISS"
+        return response
+
+
+class ConditionalGetMixin:
+    """Mixin for list and retrieve views answering If-None-Match and If-Modified-Since with 304
+    before anything is serialized. The ETag and Last-Modified come from the 'updated_at' version stamp
+    of the object for detail views. For lists they come from the latest stamp of the whole table
+    (an index lookup) and the time of the last deletion, so any filter or page stays correct."""
+
+    def get_version_queryset(self):
+        """Return the queryset of the object, or of the whole table for lists, to read 'updated_at' from."""
+        if "pk" in self.kwargs:
+            return self.get_queryset().prefetch_related(None).filter(pk=self.kwargs["pk"])
+        return self.get_queryset().model._default_manager.all()
+
+    def get_version_stamp(self):
+        """Return (etag, last_modified) or None if the object does not exist."""
+        queryset = self.get_version_queryset()
+        if "pk" in self.kwargs:
+            updated_at = queryset.values_list("updated_at", flat=True).first()
+        else:
+            updated_at = queryset.aggregate(updated_at=Max("updated_at"))["updated_at"]
+        return self.make_version_stamp(updated_at)
+
+    async def aget_version_stamp(self):
+        # the query and, for lists, the time of the last deletion read from the cache, in one thread
+        return await sync_to_async(self.get_version_stamp)()
+
+    def make_version_stamp(self, updated_at):
+        renderer = getattr(self.request, "accepted_renderer", None)
+        media = renderer.format if renderer else ""
+        if "pk" in self.kwargs:
+            if updated_at is None:
+                return None
+            return f'"{updated_at.timestamp():.6f}-{media}"', updated_at
+
+        last_modified = get_last_deletion(self.get_queryset().model)
+        if updated_at is not None:
+            last_modified = max(last_modified, updated_at)
+        return f'"{last_modified.timestamp():.6f}-{media}"', last_modified
+
+    def get(self, request, *args, **kwargs):
+        stamp = self.get_version_stamp()
+        response = self.get_conditional_response(request, stamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.set_validators(response, stamp)
+
+    async def aget(self, request, *args, **kwargs):
+        stamp = await self.aget_version_stamp()
+        response = self.get_conditional_response(request, stamp)
+        if response is None:
+            response = await super().aget(request, *args, **kwargs)
+        return self.set_validators(response, stamp)
+
+    def get_conditional_response(self, request, stamp):
+        if stamp is None:
+            return None
+        etag, last_modified = stamp
+        return get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+
+    def set_validators(self, response, stamp):
+        if stamp is not None and response.status_code in (200, 304):
+            etag, last_modified = stamp
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(int(last_modified.timestamp()))
+        return response
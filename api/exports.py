@@ -0,0 +1,110 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Contact, Product, SalesNetworkCell
+
+CHUNK_SIZE = 2000
+
+CONTACT_FIELDS = ("id", "email", "country", "city", "street", "house_number")
+PRODUCT_FIELDS = ("id", "name", "model", "release_date")
+CELL_FIELDS = (
+    "id",
+    "name",
+    "hierarchy_name",
+    "hierarchy_level",
+    "supplier_id",
+    "supplier_name",
+    "debt",
+    "subtree_debt",
+    "subtree_cells",
+    "created_at",
+    "updated_at",
+)
+
+OUTPUTS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def contact_record(contact):
+    return {field: getattr(contact, field) for field in CONTACT_FIELDS}
+
+
+def product_record(product):
+    return {field: getattr(product, field) for field in PRODUCT_FIELDS}
+
+
+def cell_record(cell):
+    record = {field: getattr(cell, field) for field in CELL_FIELDS if field != "supplier_name"}
+    record["supplier_name"] = cell.supplier.name if cell.supplier else None
+    record["contact"] = contact_record(cell.contact) if cell.contact else None
+    record["products"] = [product_record(product) for product in cell.products.all()]
+    return record
+
+
+RESOURCES = {
+    "cells": {
+        "queryset": lambda: SalesNetworkCell.objects.with_related(),
+        "record": cell_record,
+        "columns": (
+            *CELL_FIELDS,
+            *(f"contact_{field}" for field in CONTACT_FIELDS),
+            *(f"products_{field}" for field in PRODUCT_FIELDS),
+        ),
+    },
+    "contacts": {
+        "queryset": lambda: Contact.objects.all(),
+        "record": contact_record,
+        "columns": CONTACT_FIELDS,
+    },
+    "products": {
+        "queryset": lambda: Product.objects.all(),
+        "record": product_record,
+        "columns": PRODUCT_FIELDS,
+    },
+}
+
+
+def flatten(record):
+    """Flatten a record for CSV: nested objects become 'contact_email' columns
+    and lists of objects become 'products_name' columns joined with ';'."""
+    row = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            row.update({f"{key}_{name}": item for name, item in value.items()})
+        elif isinstance(value, list):
+            for name in value[0] if value else ():
+                row[f"{key}_{name}"] = ";".join("" if item[name] is None else str(item[name]) for item in value)
+        else:
+            row[key] = value
+    return row
+
+
+class Echo:
+    """File-like object returning what is written, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def iter_records(resource, queryset=None, chunk_size=CHUNK_SIZE):
+    """Iterate over the export records of a resource with a server-side cursor, ordered by id."""
+    config = RESOURCES[resource]
+    if queryset is None:
+        queryset = config["queryset"]()
+    for obj in queryset.order_by("id").iterator(chunk_size=chunk_size):
+        yield config["record"](obj)
+
+
+def iter_lines(resource, output, queryset=None, chunk_size=CHUNK_SIZE):
+    """Yield the export of a resource line by line as CSV (with a header) or NDJSON."""
+    records = iter_records(resource, queryset, chunk_size)
+    if output == "ndjson":
+        for record in records:
+            yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+        return
+
+    writer = csv.DictWriter(Echo(), fieldnames=RESOURCES[resource]["columns"], extrasaction="ignore")
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(flatten(record))
@@ -0,0 +1,219 @@
+import csv
+import json
+import os
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .exports import CONTACT_FIELDS, PRODUCT_FIELDS
+from .models import Contact, Product, SalesNetworkCell
+from .serializers import ContactSerializer, ProductSerializer, SalesNetworkCellSerializer
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return "ndjson" if extension in ("ndjson", "jsonl", "json") else "csv"
+
+
+def unflatten(row):
+    """Inverse of exports.flatten: 'contact_email' columns become a nested object and
+    ';' separated 'products_name' columns a list of objects. Empty values are dropped."""
+    record, contact, products = {}, {}, {}
+    for key, value in row.items():
+        if key is None or value in (None, ""):
+            continue
+        if key.startswith("contact_"):
+            contact[key.removeprefix("contact_")] = value
+        elif key.startswith("products_"):
+            products[key.removeprefix("products_")] = value.split(";")
+        else:
+            record[key] = value
+    record["contact"] = contact or None
+    count = max((len(values) for values in products.values()), default=0)
+    record["products"] = [
+        {name: values[i] or None for name, values in products.items() if i < len(values)} for i in range(count)
+    ]
+    return record
+
+
+def read_records(path, output):
+    """Yield (line number, record) for each row of a CSV or NDJSON file without loading it in memory."""
+    with open(path, newline="", encoding="utf-8") as file:
+        if output == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, unflatten(row)
+            return
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+
+
+def error_messages(exc):
+    if isinstance(exc, DjangoValidationError):
+        return {"non_field_errors": exc.messages}
+    return exc.detail
+
+
+class Importer:
+    """Validates records with the API serializer and inserts them with bulk_create.
+    Rows whose natural key ('key_fields') already exists are skipped, so a file can be imported again
+    after a failure. Subclasses set 'model', 'serializer_class', the imported 'fields' and 'key_fields'."""
+
+    model = None
+    serializer_class = None
+    fields = ()
+    key_fields = ()
+    cache_tags = ()
+
+    def __init__(self):
+        self.serializer = self.serializer_class()
+
+    def get_key(self, record):
+        return tuple(record.get(field) for field in self.key_fields)
+
+    def get_existing_keys(self, keys):
+        """Return the keys of the rows already in the table, looked up by the first key field."""
+        lookup = {f"{self.key_fields[0]}__in": {key[0] for key in keys}}
+        return set(self.model.objects.filter(**lookup).values_list(*self.key_fields))
+
+    def validate(self, record):
+        if not isinstance(record, dict):
+            raise ValidationError({"non_field_errors": ["Expected an object."]})
+        return self.serializer.run_validation({field: record[field] for field in self.fields if field in record})
+
+    def build(self, record):
+        return self.model(**self.validate(record))
+
+    def insert(self, instances, batch_size):
+        self.model.objects.bulk_create(instances, batch_size=batch_size)
+
+
+class ContactImporter(Importer):
+    model = Contact
+    serializer_class = ContactSerializer
+    fields = CONTACT_FIELDS[1:]
+    key_fields = ("email",)
+    cache_tags = ("contact:all",)
+
+
+class ProductImporter(Importer):
+    model = Product
+    serializer_class = ProductSerializer
+    fields = PRODUCT_FIELDS[1:]
+    key_fields = ("name", "model")
+    cache_tags = ("product:all",)
+
+
+class SalesNetworkCellImporter(Importer):
+    """Cells are inserted without supplier in a first pass, together with their contact and products
+    (looked up by name and model). Suppliers are resolved by cell name in a second pass (see link)."""
+
+    model = SalesNetworkCell
+    serializer_class = SalesNetworkCellSerializer
+    fields = ("name", "hierarchy_name", "debt")
+    key_fields = ("name",)
+    cache_tags = ("cell:all", "contact:all")
+
+    def __init__(self):
+        super().__init__()
+        self.contacts = ContactImporter()
+        self.products, self.products_by_name = {}, {}
+        for pk, name, model in Product.objects.order_by("id").values_list("id", "name", "model"):
+            self.products.setdefault((name, model), pk)
+            self.products_by_name.setdefault(name, pk)
+
+    def get_product_ids(self, products):
+        ids = []
+        for product in products or []:
+            if not isinstance(product, dict):
+                product = {"name": product}
+            if product.get("model"):
+                pk = self.products.get((product.get("name"), product["model"]))
+            else:
+                pk = self.products_by_name.get(product.get("name"))
+            if pk is None:
+                raise ValidationError({"products": [f"Product {product.get('name')!r} does not exist."]})
+            ids.append(pk)
+        return ids
+
+    def build(self, record):
+        cell = super().build(record)
+        if cell.hierarchy_name not in SalesNetworkCell.LEVEL_NAMES:
+            raise ValidationError({"hierarchy_name": ["This field is required."]})
+        cell.apply_hierarchy_rules()
+        cell.reset_rollups()
+        cell.contact = self.contacts.build(record["contact"]) if record.get("contact") else None
+        cell.product_ids = self.get_product_ids(record.get("products"))
+        return cell
+
+    def insert(self, instances, batch_size):
+        contacts = [cell.contact for cell in instances if cell.contact]
+        Contact.objects.bulk_create(contacts, batch_size=batch_size)
+        SalesNetworkCell.objects.bulk_create(instances, batch_size=batch_size)
+        Through = SalesNetworkCell.products.through
+        Through.objects.bulk_create(
+            [
+                Through(salesnetworkcell_id=cell.pk, product_id=product_id)
+                for cell in instances
+                for product_id in dict.fromkeys(cell.product_ids)
+            ],
+            batch_size=batch_size,
+        )
+
+    def link(self, records, known=None):
+        """Set the supplier of each (line, {"name", "supplier_name"}) record of a batch, applying the
+        hierarchy rules, and return the errors by line. In a dry run, 'known' maps the names of the
+        cells of the file to their hierarchy name and level, and nothing is written."""
+        names = set()
+        for line, record in records:
+            names.update((record["name"], record["supplier_name"]))
+        found = {}
+        for pk, name, hierarchy_name, level in SalesNetworkCell.objects.filter(name__in=names).values_list(
+            "id", "name", "hierarchy_name", "hierarchy_level"
+        ):
+            found.setdefault(name, []).append((pk, hierarchy_name, level))
+
+        errors, cells, now = {}, [], timezone.now()
+        for line, record in records:
+            try:
+                cell = self.resolve(record["name"], found, known)
+                cell.supplier = self.resolve(record["supplier_name"], found, known)
+                cell.apply_hierarchy_rules()
+            except (ValidationError, DjangoValidationError) as exc:
+                errors[line] = error_messages(exc)
+                continue
+            if known is not None:
+                known[record["name"]] = (cell.hierarchy_name, cell.hierarchy_level)
+            cell.updated_at = now
+            cells.append(cell)
+        if known is None:
+            SalesNetworkCell.objects.bulk_update(
+                cells, ["supplier", "supplier_level", "hierarchy_level", "updated_at"]
+            )
+        return errors
+
+    @staticmethod
+    def resolve(name, found, known):
+        matches = found.get(name, [])
+        if not matches and known is not None and name in known:
+            matches = [(None, *known[name])]
+        if not matches:
+            raise ValidationError({"supplier": [f"Cell {name!r} does not exist."]})
+        if len(matches) > 1:
+            raise ValidationError({"supplier": [f"Cell name {name!r} is not unique."]})
+        pk, hierarchy_name, level = matches[0]
+        return SalesNetworkCell(pk=pk, name=name, hierarchy_name=hierarchy_name, hierarchy_level=level)
+
+
+IMPORTERS = {
+    "cells": SalesNetworkCellImporter,
+    "contacts": ContactImporter,
+    "products": ProductImporter,
+}
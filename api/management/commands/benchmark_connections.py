@@ -0,0 +1,101 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+
+from api.benchmarks import get_authorization, get_paths, serve_wsgi, summarize
+
+# Environment of each mode, read by config/settings.py
+MODES = {
+    "per_request": {"DB_CONN_MAX_AGE": "0", "DB_POOL_MAX_SIZE": ""},
+    "persistent": {"DB_CONN_MAX_AGE": "600", "DB_POOL_MAX_SIZE": ""},
+    "pool": {"DB_CONN_MAX_AGE": "0"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of the read endpoints served by the WSGI handler with a new database connection per "
+        "request, persistent connections and, with psycopg 3, a connection pool. Each mode runs in its own process "
+        "on the current database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Number of requests per mode.")
+        parser.add_argument("--concurrency", type=int, default=4, help="Threads sending requests.")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+        parser.add_argument("--mode", choices=MODES, help="Benchmark the configured connections in this process only.")
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            results = [self.measure(options)]
+        else:
+            modes = [mode for mode in MODES if mode != "pool" or importlib.util.find_spec("psycopg_pool")]
+            results = [self.spawn(mode, options) for mode in modes]
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']}: {result['requests_per_second']:.1f} requests/s, p50 {result['p50_ms']:.2f}ms, "
+                f"p99 {result['p99_ms']:.2f}ms, {result['connects']} connects ({result['connect_ms']:.2f}ms each), "
+                f"{result['errors']} errors"
+            )
+
+    def spawn(self, mode, options):
+        command = [sys.executable, "-m", "django", "benchmark_connections", "--json", "--mode", mode]
+        command += ["--requests", str(options["requests"]), "--concurrency", str(options["concurrency"])]
+        env = {**os.environ, "DB_POOL_MAX_SIZE": str(options["concurrency"]), **MODES[mode]}
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f"The {mode} benchmark failed:\n{process.stderr}")
+        return json.loads(process.stdout)[0]
+
+    def measure(self, options):
+        # responses are not cached, so that every request queries the database
+        caches = {"benchmark": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES={**settings.CACHES, **caches}, API_CACHE_ALIAS="benchmark"):
+            authorization = get_authorization()
+            paths = get_paths()
+            urls = [paths[i % len(paths)] for i in range(options["requests"])]
+            # the threads of the measured run start without connection, like new workers
+            serve_wsgi(urls[: options["concurrency"]], authorization, options["concurrency"])
+            connects = []
+
+            def count(sender, connection, **kwargs):
+                connects.append(connection.alias)
+
+            connection_created.connect(count)
+            try:
+                results = serve_wsgi(urls, authorization, options["concurrency"], warm_up=False)
+            finally:
+                connection_created.disconnect(count)
+
+        return {
+            "mode": options["mode"],
+            "concurrency": options["concurrency"],
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "pool": "pool" in connection.settings_dict["OPTIONS"],
+            **summarize(*results),
+            "connects": len(connects),
+            "connect_ms": self.time_connect() * 1000,
+        }
+
+    def time_connect(self, times=20):
+        """Mean time to get a connection: a new one, or one taken from the pool."""
+        durations = []
+        for _ in range(times):
+            connection.close()
+            before = time.perf_counter()
+            connection.ensure_connection()
+            durations.append(time.perf_counter() - before)
+        connection.close()
+        return sum(durations) / times
@@ -0,0 +1,270 @@
+import itertools
+import json
+import time
+from datetime import datetime, timezone
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.benchmarks import summarize
+from api.models import Contact, Product, SalesNetworkCell
+from users.models import User
+from users.serializers import UserTokenObtainPairSerializer
+
+URLCONFS = ("api.urls", "users.urls")
+PASSWORD = "benchmark-password"
+
+
+def get_route_names():
+    """Namespaced names of the routes of the API and users applications."""
+    names = []
+    for module in URLCONFS:
+        urlconf = import_module(module)
+        names += [f"{urlconf.app_name}:{pattern.name}" for pattern in urlconf.urlpatterns]
+    return names
+
+
+class Fixtures:
+    """Rows requested by the scenarios: existing cells, contact and product of the network, and a staff employee
+    created in the benchmark transaction. Rows deleted or changed by a request are created fresh for it."""
+
+    def __init__(self):
+        self.counter = itertools.count(1)
+        self.factory = SalesNetworkCell.objects.filter(hierarchy_level=0).order_by("pk").first()
+        self.entrepreneur = SalesNetworkCell.objects.order_by("-hierarchy_level", "pk").first()
+        self.contact = Contact.objects.order_by("pk").first()
+        self.product = Product.objects.order_by("pk").first()
+        if None in (self.factory, self.contact, self.product):
+            raise CommandError("The database has no network to benchmark, generate one with seed_network")
+        self.user = User(email="benchmark-staff@example.com", is_staff=True, is_superuser=True, is_employee=True)
+        self.user.set_password(PASSWORD)
+        self.user.save()
+        self.refresh = str(UserTokenObtainPairSerializer.get_token(self.user))
+
+    def unique(self, prefix):
+        return f"benchmark-{prefix}-{next(self.counter)}"
+
+    def new_cell(self):
+        return SalesNetworkCell.objects.create(
+            name=self.unique("cell"), hierarchy_name="Retail Network", supplier=self.factory
+        )
+
+    def new_contact(self):
+        return Contact.objects.create(
+            email=f"{self.unique('contact')}@example.com", country="USA", city="Austin", street="Main St"
+        )
+
+    def new_product(self):
+        return Product.objects.create(name=self.unique("product"), model="B1", release_date="2025-01-01")
+
+    def new_users(self, count):
+        return User.objects.bulk_create(User(email=f"{self.unique('user')}@example.com") for _ in range(count))
+
+
+def url(name, *args):
+    return reverse(name, args=args)
+
+
+def contact_data(fixtures):
+    return {
+        "email": f"{fixtures.unique('contact')}@example.com",
+        "country": "USA",
+        "city": "Austin",
+        "street": "Main St",
+        "house_number": "1",
+    }
+
+
+def product_data(fixtures):
+    return {"name": fixtures.unique("product"), "model": "B1", "release_date": "2025-01-01"}
+
+
+def cell_data(fixtures):
+    return {"name": fixtures.unique("cell"), "hierarchy_name": "Retail Network", "supplier": fixtures.factory.pk}
+
+
+# Request (method, path, JSON body) of each route, built from the fixtures before the request is timed
+SCENARIOS = {
+    "api:cell-list": lambda f: ("get", url("api:cell-list"), None),
+    "api:cell-export": lambda f: ("get", url("api:cell-export") + "?output=csv", None),
+    "api:cell-detail": lambda f: ("get", url("api:cell-detail", f.entrepreneur.pk), None),
+    "api:cell-chain": lambda f: ("get", url("api:cell-chain", f.entrepreneur.pk), None),
+    "api:cell-tree": lambda f: ("get", url("api:cell-tree", f.factory.pk), None),
+    "api:cell-create": lambda f: ("post", url("api:cell-create"), cell_data(f)),
+    "api:cell-bulk-create": lambda f: ("post", url("api:cell-bulk-create"), [cell_data(f) for _ in range(10)]),
+    "api:cell-update": lambda f: ("patch", url("api:cell-update", f.new_cell().pk), {"name": f.unique("cell")}),
+    "api:cell-destroy": lambda f: ("delete", url("api:cell-destroy", f.new_cell().pk), None),
+    "api:contact-list": lambda f: ("get", url("api:contact-list"), None),
+    "api:contact-export": lambda f: ("get", url("api:contact-export") + "?output=csv", None),
+    "api:contact-detail": lambda f: ("get", url("api:contact-detail", f.contact.pk), None),
+    "api:contact-create": lambda f: ("post", url("api:contact-create"), contact_data(f)),
+    "api:contact-bulk-create": lambda f: (
+        "post",
+        url("api:contact-bulk-create"),
+        [contact_data(f) for _ in range(10)],
+    ),
+    "api:contact-update": lambda f: ("patch", url("api:contact-update", f.new_contact().pk), {"city": "Boston"}),
+    "api:contact-destroy": lambda f: ("delete", url("api:contact-destroy", f.new_contact().pk), None),
+    "api:search": lambda f: ("get", url("api:search") + f"?q={f.product.name.split()[0]}", None),
+    "api:cache-stats": lambda f: ("get", url("api:cache-stats"), None),
+    "api:product-list": lambda f: ("get", url("api:product-list"), None),
+    "api:product-export": lambda f: ("get", url("api:product-export") + "?output=csv", None),
+    "api:product-detail": lambda f: ("get", url("api:product-detail", f.product.pk), None),
+    "api:product-create": lambda f: ("post", url("api:product-create"), product_data(f)),
+    "api:product-bulk-create": lambda f: (
+        "post",
+        url("api:product-bulk-create"),
+        [product_data(f) for _ in range(10)],
+    ),
+    "api:product-update": lambda f: ("patch", url("api:product-update", f.new_product().pk), {"model": "B2"}),
+    "api:product-destroy": lambda f: ("delete", url("api:product-destroy", f.new_product().pk), None),
+    "users:register": lambda f: (
+        "post",
+        url("users:register"),
+        {"email": f"{f.unique('user')}@example.com", "password": PASSWORD},
+    ),
+    "users:token_obtain_pair": lambda f: (
+        "post",
+        url("users:token_obtain_pair"),
+        {"email": f.user.email, "password": PASSWORD},
+    ),
+    "users:token_refresh": lambda f: ("post", url("users:token_refresh"), {"refresh": f.refresh}),
+    "users:employees_list": lambda f: ("get", url("users:employees_list"), None),
+    "users:users_list": lambda f: ("get", url("users:users_list"), None),
+    "users:employee_status_update": lambda f: (
+        "post",
+        url("users:employee_status_update"),
+        {"email": f.new_users(1)[0].email},
+    ),
+    "users:employee_status_bulk_update": lambda f: (
+        "post",
+        url("users:employee_status_bulk_update"),
+        {"promote": {"user_ids": [user.pk for user in f.new_users(10)]}},
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure every route of the API and users applications on the current database: latency percentiles, "
+        "requests per second and SQL queries per request. Requests are sent with the test client as a staff "
+        "employee, without the response cache, in a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Number of requests per route.")
+        parser.add_argument("--routes", nargs="+", metavar="NAME", help="Only benchmark these routes.")
+        parser.add_argument(
+            "--fast-hasher",
+            action="store_true",
+            help="Hash passwords with MD5 to leave the password hashing out of the login and register routes.",
+        )
+        parser.add_argument("--output", metavar="FILE", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", metavar="FILE", help="Show the changes from the results of this file.")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        names = get_route_names()
+        missing = sorted(set(names) - set(SCENARIOS))
+        if missing:
+            raise CommandError(f"No benchmark scenario for the routes: {', '.join(missing)}")
+        unknown = sorted(set(options["routes"] or ()) - set(names))
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(unknown)}")
+        baseline = self.load(options["compare"]) if options["compare"] else None
+
+        # responses are not cached, so that every request runs the view
+        caches = {"benchmark": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        overrides = {"CACHES": {**settings.CACHES, **caches}, "API_CACHE_ALIAS": "benchmark"}
+        if options["fast_hasher"]:
+            overrides["PASSWORD_HASHERS"] = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+        with override_settings(**overrides), transaction.atomic():
+            routes = self.run([name for name in names if name in (options["routes"] or names)], options)
+            transaction.set_rollback(True)
+
+        results = {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "database": connection.vendor,
+            "requests": options["requests"],
+            "fast_hasher": options["fast_hasher"],
+            "routes": routes,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in routes.items():
+            line = (
+                f"{name}: {result['requests_per_second']:.1f} requests/s, p50 {result['p50_ms']:.2f}ms, "
+                f"p95 {result['p95_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms, "
+                f"{result['queries']:.1f} queries, {result['errors']} errors"
+            )
+            previous = (baseline or {}).get("routes", {}).get(name)
+            if previous:
+                changes = [
+                    f"{key.removesuffix('_ms')} {self.change(previous[key], result[key])}"
+                    for key in ("p50_ms", "p95_ms", "p99_ms", "queries")
+                ]
+                line += f" ({', '.join(changes)})"
+            self.stdout.write(line)
+
+    def run(self, names, options):
+        fixtures = Fixtures()
+        authorization = f"Bearer {UserTokenObtainPairSerializer.get_token(fixtures.user).access_token}"
+        client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=authorization)
+        routes = {}
+        for name in names:
+            self.measure(client, SCENARIOS[name](fixtures))  # warm-up
+            requests = [SCENARIOS[name](fixtures) for _ in range(options["requests"])]
+            statuses, latencies, queries = zip(*(self.measure(client, request) for request in requests))
+            routes[name] = {
+                "method": requests[0][0].upper(),
+                "path": requests[0][1],
+                **summarize(statuses, latencies, sum(latencies)),
+                "queries": sum(queries) / len(queries),
+                "max_queries": max(queries),
+            }
+        return routes
+
+    def measure(self, client, request):
+        """Send the request in a savepoint, return its status, latency and number of queries."""
+        savepoint = transaction.savepoint()
+        with CaptureQueriesContext(connection) as captured:
+            before = time.perf_counter()
+            response = self.send(client, *request)
+            latency = time.perf_counter() - before
+        # a failed request must not abort the benchmark transaction
+        if response.status_code >= 500:
+            transaction.savepoint_rollback(savepoint)
+        else:
+            transaction.savepoint_commit(savepoint)
+        return response.status_code, latency, len(captured)
+
+    def send(self, client, method, path, data):
+        if data is None:
+            response = getattr(client, method)(path)
+        else:
+            response = getattr(client, method)(path, data, content_type="application/json")
+        if response.streaming:
+            # the exports query and serialize the rows while the content is read
+            b"".join(response.streaming_content)
+        return response
+
+    def load(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read the results to compare with: {exc}")
+
+    def change(self, before, after):
+        if not before:
+            return f"{before:.2f} -> {after:.2f}"
+        return f"{(after - before) / before:+.1%}"
@@ -0,0 +1,86 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api.models import SalesNetworkCell
+from api.serializers import SalesNetworkCellReadSerializer, SalesNetworkCellSerializer
+
+
+def model_rows(rows):
+    return list(SalesNetworkCell.objects.with_related()[:rows])
+
+
+def values_rows(rows):
+    return list(SalesNetworkCellReadSerializer.values(SalesNetworkCell.objects.all())[:rows])
+
+
+def canonical(data):
+    """The JSON of the cells, products with the same name (in any order in both paths) sorted by id."""
+    data = json.loads(JSONRenderer().render(data))
+    for cell in data:
+        cell["products"].sort(key=lambda product: (product["name"], product["id"]))
+    return data
+
+
+# (fetch, serializer class) of each way to serialize the cells
+PATHS = {
+    "model": (model_rows, SalesNetworkCellSerializer),
+    "values": (values_rows, SalesNetworkCellReadSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the CPU time per row of serializing cells from model instances (SalesNetworkCellSerializer) "
+        "and from values() rows (SalesNetworkCellReadSerializer), with and without fetching the rows, "
+        "on the current database. Fails if the two give different JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Number of cells serialized.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs of each path, the fastest one is kept.")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], max(options["repeat"], 1)
+        outputs, results = {}, {}
+        for name, (fetch, serializer_class) in PATHS.items():
+            fetch_seconds, serialize_seconds = [], []
+            for _ in range(repeat):
+                started = time.process_time()
+                objects = fetch(rows)
+                fetched = time.process_time()
+                data = serializer_class(objects, many=True).data
+                serialize_seconds.append(time.process_time() - fetched)
+                fetch_seconds.append(fetched - started)
+            outputs[name] = canonical(data)
+            count = max(len(objects), 1)
+            results[name] = {
+                "rows": len(objects),
+                "total_us_per_row": min(map(sum, zip(fetch_seconds, serialize_seconds))) / count * 1e6,
+                "serialize_us_per_row": min(serialize_seconds) / count * 1e6,
+            }
+        if outputs["model"] != outputs["values"]:
+            raise CommandError("The values() rows are not serialized like the model instances")
+        if not results["model"]["rows"]:
+            raise CommandError("The database has no cells to serialize, generate some with seed_network")
+        for key in ("total_us_per_row", "serialize_us_per_row"):
+            ratio = results["model"][key] / max(results["values"][key], 1e-9)
+            results[f"{key.removesuffix('_us_per_row')}_speedup"] = ratio
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name in PATHS:
+            self.stdout.write(
+                f"{name}: {results[name]['total_us_per_row']:.1f}us/row fetched and serialized, "
+                f"{results[name]['serialize_us_per_row']:.1f}us/row serialized ({results[name]['rows']} rows)"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"values() rows: {results['total_speedup']:.1f}x less CPU per row, "
+                f"{results['serialize_speedup']:.1f}x for the serialization alone"
+            )
+        )
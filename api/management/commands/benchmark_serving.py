@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from api.benchmarks import get_authorization, get_paths, serve_asgi, serve_wsgi, summarize
+
+SERVERS = ("wsgi", "asgi")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the read endpoints served by the WSGI handler (synchronous views on a thread pool, like a threaded "
+        "worker) and by the ASGI handler (async views on an event loop) on the current database: requests per "
+        "second, latency percentiles and peak memory of the worker. Each server runs in its own process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Number of requests per server.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at the same time.")
+        parser.add_argument(
+            "--cached", action="store_true", help="Serve from the response cache, bypassed by default."
+        )
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+        parser.add_argument("--server", choices=SERVERS, help="Benchmark this server in the current process only.")
+
+    def handle(self, *args, **options):
+        if options["server"]:
+            results = [self.run(options)]
+        else:
+            results = [self.spawn(server, options) for server in SERVERS]
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['server'].upper()}: {result['requests']} requests in {result['seconds']:.2f}s, "
+                f"{result['requests_per_second']:.1f} requests/s, p50 {result['p50_ms']:.1f}ms, "
+                f"p99 {result['p99_ms']:.1f}ms, {result['errors']} errors, peak memory {result['max_rss_mb']:.1f}MB"
+            )
+
+    def spawn(self, server, options):
+        """Run the benchmark of a server in a new process, whose URLs are built with ASYNC_READ_VIEWS set
+        for ASGI, so that its memory is not shared with the other server."""
+        command = [sys.executable, "-m", "django", "benchmark_serving", "--json", "--server", server]
+        command += ["--requests", str(options["requests"]), "--concurrency", str(options["concurrency"])]
+        if options["cached"]:
+            command.append("--cached")
+        env = {**os.environ, "ASYNC_READ_VIEWS": str(server == "asgi")}
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f"The {server} benchmark failed:\n{process.stderr}")
+        return json.loads(process.stdout)[0]
+
+    def run(self, options):
+        if options["cached"]:
+            return self.measure(options)
+        caches = {"benchmark": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        with override_settings(CACHES={**settings.CACHES, **caches}, API_CACHE_ALIAS="benchmark"):
+            return self.measure(options)
+
+    def measure(self, options):
+        authorization = get_authorization()
+        paths = get_paths()
+        urls = [paths[i % len(paths)] for i in range(options["requests"])]
+        if options["server"] == "wsgi":
+            results = serve_wsgi(urls, authorization, options["concurrency"])
+        else:
+            results = asyncio.run(serve_asgi(urls, authorization, options["concurrency"]))
+        return {
+            "server": options["server"],
+            "concurrency": options["concurrency"],
+            **summarize(*results),
+            # kilobytes on Linux
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "cached": options["cached"],
+        }
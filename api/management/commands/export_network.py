@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from api.exports import CHUNK_SIZE, OUTPUTS, RESOURCES, iter_lines
+
+
+class Command(BaseCommand):
+    help = "Stream sales network cells, contacts or products to a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("resource", choices=RESOURCES)
+        parser.add_argument("--output", choices=OUTPUTS, default="csv")
+        parser.add_argument("--file", help="Path of the file to write, standard output by default.")
+        parser.add_argument("--country", help="Only export cells whose contact is in this country (or contacts).")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        resource = options["resource"]
+        queryset = RESOURCES[resource]["queryset"]()
+        if options["country"]:
+            if resource == "cells":
+                queryset = queryset.filter(contact__country=options["country"])
+            elif resource == "contacts":
+                queryset = queryset.filter(country=options["country"])
+
+        lines = iter_lines(resource, options["output"], queryset, options["chunk_size"])
+        if not options["file"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        count = -1 if options["output"] == "csv" else 0
+        with open(options["file"], "w", newline="", encoding="utf-8") as file:
+            for line in lines:
+                file.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Successfully exported {count} {resource} to {options['file']}"))
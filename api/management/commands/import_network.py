@@ -0,0 +1,176 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from api.cache import invalidate
+from api.imports import FORMATS, IMPORTERS, detect_format, error_messages, read_records
+from api.models import SalesNetworkCell
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Import sales network cells, contacts or products from a CSV or NDJSON file (e.g. written by export_network). "
+        "Rows are inserted in batches, cell suppliers are resolved by name in a second pass, and progress is saved "
+        "to a checkpoint file so an interrupted import resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("resource", choices=IMPORTERS)
+        parser.add_argument("file")
+        parser.add_argument("--format", choices=FORMATS, help="File format, guessed from the extension by default.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the file, nothing is written.")
+        parser.add_argument("--checkpoint", help="Path of the checkpoint file, '<file>.checkpoint' by default.")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.dry_run = options["dry_run"]
+        self.importer = IMPORTERS[options["resource"]]()
+        self.checkpoint = options["checkpoint"] or f"{options['file']}.checkpoint"
+        # in a dry run nothing is inserted, so the keys and cells seen so far are kept in memory
+        self.seen = set() if self.dry_run else None
+        self.known = {} if self.dry_run else None
+
+        state = {"phase": "rows", "line": 0, "created": 0, "skipped": 0, "failed": []}
+        if not self.dry_run and not options["restart"] and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding="utf-8") as file:
+                state = json.load(file)
+            self.log(f"Resuming {state['phase']} after line {state['line']}")
+
+        if state["phase"] == "rows":
+            for batch in self.read_batches(state["line"]):
+                self.import_rows(batch, state)
+                self.save_state(state, batch[-1][0], "Imported rows")
+            state.update(phase="suppliers", line=0)
+            self.save_state(state, 0)
+
+        if options["resource"] == "cells":
+            failed = set(state["failed"])
+            for batch in self.read_batches(state["line"]):
+                records = [
+                    (line, record)
+                    for line, record in batch
+                    if line not in failed and isinstance(record, dict) and record.get("supplier_name")
+                ]
+                errors = self.link_suppliers(records)
+                state["failed"].extend(errors)
+                failed.update(errors)
+                self.save_state(state, batch[-1][0], "Linked suppliers")
+            if not self.dry_run:
+                self.rebuild_hierarchy()
+
+        if os.path.exists(self.checkpoint) and not self.dry_run:
+            os.remove(self.checkpoint)
+
+        summary = (
+            f"{state['created']} {options['resource']} "
+            f"({state['skipped']} already existing, {len(state['failed'])} invalid)"
+        )
+        if self.dry_run:
+            if state["failed"]:
+                raise CommandError(f"Dry run: {len(state['failed'])} invalid rows")
+            self.stdout.write(self.style.SUCCESS(f"Dry run: would import {summary}"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Successfully imported {summary}"))
+
+    def read_batches(self, after_line):
+        """Yield lists of (line, record) of at most batch size rows, starting after the given line."""
+        records = read_records(self.options["file"], self.options["format"] or detect_format(self.options["file"]))
+        records = ((line, record) for line, record in records if line > after_line)
+        self.started, self.rows = time.monotonic(), 0
+        while batch := list(islice(records, self.options["batch_size"])):
+            self.rows += len(batch)
+            yield batch
+
+    def import_rows(self, batch, state):
+        importer = self.importer
+        keys = {importer.get_key(record) for line, record in batch if isinstance(record, dict)}
+        existing = importer.get_existing_keys(keys)
+        if self.seen is not None:
+            existing |= keys & self.seen
+
+        instances = []
+        for line, record in batch:
+            try:
+                if not isinstance(record, dict):
+                    raise ValidationError({"non_field_errors": ["Expected an object."]})
+                key = importer.get_key(record)
+                if key in existing:
+                    state["skipped"] += 1
+                    continue
+                instance = importer.build(record)
+            except (ValidationError, DjangoValidationError) as exc:
+                self.report(line, error_messages(exc), state)
+                continue
+            existing.add(key)
+            instances.append(instance)
+            if self.known is not None and isinstance(instance, SalesNetworkCell):
+                self.known[instance.name] = (instance.hierarchy_name, instance.hierarchy_level)
+        if self.seen is not None:
+            self.seen |= existing
+
+        if not self.dry_run and instances:
+            with transaction.atomic():
+                importer.insert(instances, self.options["batch_size"])
+                invalidate(importer.cache_tags)
+        state["created"] += len(instances)
+
+    def link_suppliers(self, records):
+        if self.dry_run:
+            errors = self.importer.link(records, self.known)
+        else:
+            with transaction.atomic():
+                errors = self.importer.link(records)
+                invalidate(self.importer.cache_tags)
+        for line, detail in errors.items():
+            self.stderr.write(f"Line {line}: {detail}")
+        return list(errors)
+
+    def rebuild_hierarchy(self):
+        """Break the supplier cycles the new links may have closed, then rebuild the paths and rollups."""
+        expected = SalesNetworkCell.objects.expected_paths()
+        suppliers = dict(
+            SalesNetworkCell.objects.filter(supplier__isnull=False).values_list("id", "supplier_id").iterator(10000)
+        )
+        visited, broken = set(), []
+        for start in suppliers:
+            trail, pk = {}, start
+            while pk is not None and pk not in visited and pk not in expected:
+                visited.add(pk)
+                trail[pk] = len(trail)
+                pk = suppliers.get(pk)
+            if pk in trail:  # walked back into the trail: the cells from pk on form a cycle
+                broken.append(max(islice(trail, trail[pk], None)))
+        if broken:
+            SalesNetworkCell.objects.filter(id__in=broken).update(supplier=None, supplier_level=None)
+            self.stderr.write(f"Cells left without supplier to break a cycle: {', '.join(map(str, broken))}")
+        call_command("rebuild_cell_paths", stdout=self.stdout, stderr=self.stderr)
+        call_command("rebuild_cell_rollups", stdout=self.stdout, stderr=self.stderr)
+
+    def report(self, line, detail, state):
+        state["failed"].append(line)
+        self.stderr.write(f"Line {line}: {detail}")
+
+    def save_state(self, state, line, message=None):
+        """Write the checkpoint once the batch is committed, and report the progress."""
+        state["line"] = line
+        if not self.dry_run:
+            with open(self.checkpoint, "w", encoding="utf-8") as file:
+                json.dump(state, file)
+        if message:
+            rate = self.rows / max(time.monotonic() - self.started, 1e-6)
+            self.log(f"{message} up to line {line} ({self.rows} rows, {rate:.0f} rows/s)")
+
+    def log(self, message):
+        if self.options["verbosity"] >= 1:
+            self.stdout.write(message)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import SalesNetworkCell
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized paths of sales network cells from the supplier links, or check them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report inconsistent paths.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expected = SalesNetworkCell.objects.expected_paths()
+        mismatched, cycles = {}, []
+        for pk, path in SalesNetworkCell.objects.values_list("id", "path").iterator(chunk_size=10000):
+            if pk not in expected:
+                cycles.append(pk)
+            elif expected[pk] != path:
+                mismatched[pk] = expected[pk]
+
+        if cycles:
+            self.stderr.write(f"Cells in a supplier cycle: {', '.join(map(str, sorted(cycles)))}")
+
+        if options["check"]:
+            if mismatched or cycles:
+                raise CommandError(f"{len(mismatched)} cells have an inconsistent path, {len(cycles)} are in a cycle")
+            self.stdout.write(self.style.SUCCESS("All cell paths are consistent"))
+            return
+
+        cells = [SalesNetworkCell(id=pk, path=path) for pk, path in mismatched.items()]
+        with transaction.atomic():
+            SalesNetworkCell.objects.bulk_update(cells, ["path"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt {len(cells)} cell paths"))
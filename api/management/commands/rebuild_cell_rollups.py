@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import invalidate
+from api.models import SalesNetworkCell
+
+
+class Command(BaseCommand):
+    help = "Rebuild the subtree debt and cell count rollups of sales network cells, or check them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report inconsistent rollups.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expected = SalesNetworkCell.objects.expected_rollups()
+        mismatched, now = [], timezone.now()
+        for pk, debt, cells in SalesNetworkCell.objects.values_list("id", "subtree_debt", "subtree_cells").iterator(
+            chunk_size=10000
+        ):
+            if [debt, cells] != expected[pk]:
+                mismatched.append(
+                    SalesNetworkCell(
+                        id=pk, subtree_debt=expected[pk][0], subtree_cells=expected[pk][1], updated_at=now
+                    )
+                )
+
+        if options["check"]:
+            if mismatched:
+                raise CommandError(f"{len(mismatched)} cells have inconsistent rollups")
+            self.stdout.write(self.style.SUCCESS("All cell rollups are consistent"))
+            return
+
+        with transaction.atomic():
+            SalesNetworkCell.objects.bulk_update(
+                mismatched, ["subtree_debt", "subtree_cells", "updated_at"], batch_size=options["batch_size"]
+            )
+            invalidate(["cell:all"])
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt {len(mismatched)} cell rollups"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending bulk admin operations and resume the ones interrupted by a restart, "
+        "or keep polling for new ones with --watch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--watch", action="store_true", help="Keep running and poll for new operations.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds between two polls with --watch.")
+
+    def handle(self, *args, **options):
+        while True:
+            completed = tasks.run_pending()
+            if completed:
+                self.stdout.write(self.style.SUCCESS(f"Successfully completed {completed} bulk operations"))
+            if not options["watch"]:
+                return
+            time.sleep(options["interval"])
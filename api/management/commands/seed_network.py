@@ -0,0 +1,184 @@
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from api.cache import invalidate
+
+BATCH_SIZE = 2000
+
+BRANDS = ("Acme", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Tyrell", "Hooli", "Soylent", "Cyberdyne")
+PRODUCT_NAMES = (
+    "Laptop",
+    "Smartphone",
+    "Tablet",
+    "Monitor",
+    "Headphones",
+    "Camera",
+    "Router",
+    "Smartwatch",
+    "Speaker",
+)
+CITIES = {
+    "USA": ("New York", "Chicago", "Austin", "Seattle"),
+    "Germany": ("Berlin", "Munich", "Hamburg"),
+    "Japan": ("Tokyo", "Osaka"),
+    "France": ("Paris", "Lyon"),
+    "Brazil": ("Sao Paulo", "Rio de Janeiro"),
+}
+STREETS = ("Main St", "Oak Ave", "Market St", "Station Rd", "High St", "Park Ln", "River Rd", "Hill St")
+LEVELS = ("Factory", "Retail Network", "Individual Entrepreneur")
+
+# Ids of the products the cells are given, set in each worker process
+product_ids = []
+
+
+def set_product_ids(ids):
+    global product_ids
+    product_ids = ids
+
+
+def init_worker(ids):
+    # the workers are spawned: the models are imported once the apps are loaded
+    django.setup()
+    set_product_ids(ids)
+
+
+def insert_products(start, count, seed):
+    """Insert the products start+1 to start+count, return their ids. The values only depend on the seed
+    and the position, so a run is repeatable whatever the number of workers."""
+    from api.models import Product
+
+    rng = random.Random(f"{seed}:products:{start}")
+    products = [
+        Product(
+            name=f"{rng.choice(BRANDS)} {rng.choice(PRODUCT_NAMES)}",
+            model=f"{rng.choice('ABCDEFGHKLMNPRSTX')}{start + i + 1:07d}",
+            release_date=date(2015, 1, 1) + timedelta(days=rng.randrange(3650)),
+        )
+        for i in range(count)
+    ]
+    Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+    return [product.pk for product in products]
+
+
+def insert_cells(level, slots, seed, products_per_cell):
+    """Insert a cell with its contact and products for each (number, supplier id, supplier path) slot,
+    in one transaction. Paths and levels are set here, the rollups are rebuilt once all cells exist.
+    Return the (id, path) of the new cells."""
+    from api.models import Contact, SalesNetworkCell
+
+    rng = random.Random(f"{seed}:{level}:{slots[0][0]}")
+    cells = []
+    for number, supplier_id, supplier_path in slots:
+        country = rng.choice(list(CITIES))
+        contact = Contact(
+            email=f"{LEVELS[level].split()[-1].lower()}{number}@example.com",
+            country=country,
+            city=rng.choice(CITIES[country]),
+            street=rng.choice(STREETS),
+            house_number=str(rng.randrange(1, 500)),
+        )
+        cell = SalesNetworkCell(
+            name=f"{LEVELS[level]} {number}",
+            hierarchy_name=LEVELS[level],
+            hierarchy_level=level,
+            supplier_id=supplier_id,
+            supplier_level=level - 1 if supplier_id else None,
+            path=f"{supplier_path}{supplier_id}/" if supplier_id else "/",
+            debt=Decimal(rng.randrange(1_000_000)) / 100 if level else Decimal(0),
+            contact=contact,
+        )
+        cell.reset_rollups()
+        cells.append(cell)
+
+    Through = SalesNetworkCell.products.through
+    with transaction.atomic():
+        Contact.objects.bulk_create([cell.contact for cell in cells], batch_size=BATCH_SIZE)
+        SalesNetworkCell.objects.bulk_create(cells, batch_size=BATCH_SIZE)
+        Through.objects.bulk_create(
+            [
+                Through(salesnetworkcell_id=cell.pk, product_id=product_id)
+                for cell in cells
+                for product_id in rng.sample(product_ids, min(products_per_cell, len(product_ids)))
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return [(cell.pk, cell.path) for cell in cells]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic sales network: factories supplying retail networks supplying individual "
+        "entrepreneurs, each with a contact and an assortment of products. Rows are inserted in batches by "
+        "several worker processes (one on SQLite). The same --seed generates the same network."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factories", type=int, default=10)
+        parser.add_argument("--retail-networks", type=int, default=10, help="Retail networks per factory.")
+        parser.add_argument("--entrepreneurs", type=int, default=10, help="Entrepreneurs per retail network.")
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--products-per-cell", type=int, default=5)
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows inserted per transaction.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        workers = 1 if connection.vendor == "sqlite" else max(options["workers"], 1)
+        if workers > 1:
+            # the connection must not be shared with the worker processes
+            connections.close_all()
+        started = time.monotonic()
+        size, seed, total = options["batch_size"], options["seed"], options["products"]
+
+        chunks = [(start, min(size, total - start), seed) for start in range(0, total, size)]
+        ids = [pk for chunk in self.run(insert_products, chunks, workers) for pk in chunk]
+        counts = {"products": len(ids)}
+        suppliers = [(None, None)] * options["factories"]
+        for level, name, per_supplier in (
+            (0, "factories", 1),
+            (1, "retail networks", options["retail_networks"]),
+            (2, "entrepreneurs", options["entrepreneurs"]),
+        ):
+            slots = [
+                (number, supplier_id, supplier_path)
+                for number, (supplier_id, supplier_path) in enumerate(
+                    (supplier for supplier in suppliers for _ in range(per_supplier)), start=1
+                )
+            ]
+            batches = (slots[start:][:size] for start in range(0, len(slots), size))
+            chunks = [(level, batch, seed, options["products_per_cell"]) for batch in batches]
+            suppliers = [cell for chunk in self.run(insert_cells, chunks, workers, ids) for cell in chunk]
+            counts[name] = len(suppliers)
+            if options["verbosity"] >= 1:
+                self.stdout.write(f"Inserted {len(suppliers)} {name}")
+
+        call_command("rebuild_cell_rollups", stdout=self.stdout, stderr=self.stderr)
+        invalidate(["cell:all", "contact:all", "product:all"])
+        seconds = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {counts['products']} products, {counts['factories']} factories, "
+                f"{counts['retail networks']} retail networks and {counts['entrepreneurs']} entrepreneurs "
+                f"in {seconds:.1f}s ({sum(counts.values()) / max(seconds, 1e-6):.0f} rows/s, {workers} workers)"
+            )
+        )
+
+    def run(self, function, arguments, workers, ids=()):
+        """Run the function on each tuple of arguments, in order, in worker processes given the product ids."""
+        if workers == 1 or len(arguments) <= 1:
+            set_product_ids(list(ids))
+            return [function(*args) for args in arguments]
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            min(workers, len(arguments)), mp_context=context, initializer=init_worker, initargs=(list(ids),)
+        ) as executor:
+            return list(executor.map(function, *zip(*arguments)))
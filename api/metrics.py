@@ -0,0 +1,257 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Time to serve the request.", SECONDS_BUCKETS),
+    "http_request_db_queries": ("SQL queries run by the request.", QUERY_BUCKETS),
+    "http_request_db_seconds": ("Time spent in the SQL queries of the request.", SECONDS_BUCKETS),
+    "http_request_serializer_seconds": ("Time spent serializing the response data, without SQL.", SECONDS_BUCKETS),
+    "http_response_size_bytes": ("Size of the response body, streaming responses excepted.", SIZE_BUCKETS),
+}
+
+METHODS = {"GET", "HEAD", "OPTIONS", "POST", "PUT", "PATCH", "DELETE"}
+
+
+class RequestMetrics:
+    """Measurements of the request being served."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = None
+        self.serializing = False
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+# Set by MetricsMiddleware, shared with the threads running the sync code of async requests
+current_request = ContextVar("current_request_metrics", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection, counting the query for the request of the context if any.
+    The connections of the threads running the sync code of async requests are counted as well."""
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+class MetricsRegistry:
+    """Histograms of this process, keyed by name and labels. With a directory, they are written to '<name>.json'
+    in it every 'interval' seconds from a background thread, and collect() adds up the files of all processes."""
+
+    def __init__(self, directory=None, interval=5, name=None):
+        self.directory = Path(directory) if directory else None
+        self.interval = interval
+        self.name = name or str(os.getpid())
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def observe(self, name, labels, value):
+        """Add a value to the histogram of the labels, a tuple of (label, value) pairs."""
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            # the count of each bucket, the last one being +Inf, then the sum
+            values = self.histograms.setdefault((name, labels), [0] * (len(buckets) + 1) + [0])
+            values[bisect_left(buckets, value)] += 1
+            values[-1] += value
+            if self.directory and self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="metrics-flush", daemon=True)
+                self.thread.start()
+
+    def flush(self):
+        """Write the histograms of this process to its file, replaced atomically."""
+        if self.directory is None:
+            return
+        with self.lock:
+            entries = [[name, labels, list(values)] for (name, labels), values in self.histograms.items()]
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.name}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(entries))
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Histograms of all the processes writing to the directory, or of this process without one."""
+        if self.directory is None:
+            with self.lock:
+                return {key: list(values) for key, values in self.histograms.items()}
+        self.flush()
+        totals = {}
+        for path in self.directory.glob("*.json"):
+            try:
+                entries = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, labels, values in entries:
+                key = (name, tuple(map(tuple, labels)))
+                totals[key] = [a + b for a, b in zip(totals[key], values)] if key in totals else values
+        return totals
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write the metrics")
+
+
+registry = MetricsRegistry(getattr(settings, "METRICS_DIR", None), getattr(settings, "METRICS_FLUSH_INTERVAL", 5))
+atexit.register(registry.flush)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(histograms):
+    """Prometheus text exposition of the histograms."""
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            pairs = [f'{label}="{escape(value)}"' for label, value in labels]
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), values):
+                cumulative += count
+                bucket = ",".join([*pairs, f'le="{bound}"'])
+                lines.append(f"{name}_bucket{{{bucket}}} {cumulative}")
+            lines.append(f"{name}_sum{{{','.join(pairs)}}} {values[-1]}")
+            lines.append(f"{name}_count{{{','.join(pairs)}}} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """Metrics of all the worker processes in the Prometheus text format, behind METRICS_TOKEN when it is set."""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(render(registry.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def instrument_serializers():
+    """Time the serialization of the response data (BaseSerializer.data, which the serializers of the views call),
+    without the SQL queries of the querysets it evaluates."""
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, "instrumented", False):
+        return
+
+    def timed_data(serializer):
+        metrics = current_request.get()
+        if metrics is None or metrics.serializing:
+            return data.fget(serializer)
+        metrics.serializing = True
+        started, db_seconds = time.perf_counter(), metrics.db_seconds
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializing = False
+            seconds = time.perf_counter() - started - (metrics.db_seconds - db_seconds)
+            metrics.serializer_seconds = (metrics.serializer_seconds or 0) + seconds
+
+    timed_data.instrumented = True
+    serializers.BaseSerializer.data = property(timed_data)
+
+
+class MetricsMiddleware:
+    """Record the latency, SQL queries, serialization time and response size of each request, labelled by
+    URL name (e.g. 'api:cell-list') so the number of series stays bounded."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        self.instrument_connections()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.observe(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        self.instrument_connections()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.observe(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    def instrument_connections(self):
+        """Instrument the connections of this thread opened before the receiver was connected."""
+        for alias in connections:
+            instrument_connection(connections[alias])
+
+    def observe(self, request, response, metrics, seconds):
+        match = getattr(request, "resolver_match", None)
+        route = (("route", match.view_name if match else "unmatched"),)
+        method = request.method if request.method in METHODS else "OTHER"
+        registry.observe(
+            "http_request_duration_seconds",
+            (*route, ("method", method), ("status", str(response.status_code))),
+            seconds,
+        )
+        registry.observe("http_request_db_queries", route, metrics.queries)
+        registry.observe("http_request_db_seconds", route, metrics.db_seconds)
+        if metrics.serializer_seconds is not None:
+            registry.observe("http_request_serializer_seconds", route, metrics.serializer_seconds)
+        if not response.streaming:
+            registry.observe("http_response_size_bytes", route, len(response.content))
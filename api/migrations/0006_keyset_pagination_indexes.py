@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_alter_salesnetworkcell_contact_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="contact",
+            index=models.Index(fields=["email", "id"], name="contact_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["name", "id"], name="product_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="salesnetworkcell",
+            index=models.Index(fields=["hierarchy_level", "name", "id"], name="cell_keyset_idx"),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:20
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    SalesNetworkCell = apps.get_model("api", "SalesNetworkCell")
+    roots, children = [], defaultdict(list)
+    for pk, supplier_id in SalesNetworkCell.objects.values_list("id", "supplier_id"):
+        (children[supplier_id] if supplier_id else roots).append(pk)
+    cells = []
+    stack = [(pk, "/") for pk in roots]
+    while stack:
+        pk, path = stack.pop()
+        if path != "/":
+            cells.append(SalesNetworkCell(id=pk, path=path))
+        stack.extend((child, f"{path}{pk}/") for child in children.get(pk, ()))
+    SalesNetworkCell.objects.bulk_update(cells, ["path"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesnetworkcell",
+            name="path",
+            field=models.CharField(
+                db_index=True,
+                default="/",
+                editable=False,
+                help_text="Materialized path of supplier ids from the top of the chain, e.g. '/1/5/'.",
+                max_length=255,
+                verbose_name="Path",
+            ),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:23
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def populate_rollups(apps, schema_editor):
+    SalesNetworkCell = apps.get_model("api", "SalesNetworkCell")
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for pk, path, debt in SalesNetworkCell.objects.values_list("id", "path", "debt"):
+        for target in (pk, *(int(part) for part in path.split("/") if part)):
+            totals[target][0] += debt
+            totals[target][1] += 1
+    cells = [SalesNetworkCell(id=pk, subtree_debt=debt, subtree_cells=count) for pk, (debt, count) in totals.items()]
+    SalesNetworkCell.objects.bulk_update(cells, ["subtree_debt", "subtree_cells"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_salesnetworkcell_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesnetworkcell",
+            name="subtree_cells",
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name="Subtree Cells"),
+        ),
+        migrations.AddField(
+            model_name="salesnetworkcell",
+            name="subtree_debt",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=16, verbose_name="Subtree Debt"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="salesnetworkcell",
+            index=models.Index(fields=["subtree_debt", "id"], name="cell_subtree_debt_idx"),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_salesnetworkcell_subtree_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contact",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At"),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At"),
+        ),
+        migrations.AddField(
+            model_name="salesnetworkcell",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At"),
+        ),
+    ]
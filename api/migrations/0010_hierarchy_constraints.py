@@ -0,0 +1,107 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:41
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+import api.models
+
+SUPPLIER_LEVEL_FK = (
+    "ALTER TABLE api_salesnetworkcell ADD CONSTRAINT cell_supplier_level_fk "
+    "FOREIGN KEY (supplier_id, supplier_level) REFERENCES api_salesnetworkcell (id, hierarchy_level) "
+    "ON UPDATE CASCADE"
+)
+
+
+def populate_supplier_levels(apps, schema_editor):
+    SalesNetworkCell = apps.get_model("api", "SalesNetworkCell")
+    levels = SalesNetworkCell.objects.filter(pk=OuterRef("supplier_id")).values("hierarchy_level")
+    SalesNetworkCell.objects.filter(supplier__isnull=False).update(supplier_level=Subquery(levels))
+
+
+def add_supplier_level_foreign_key(apps, schema_editor):
+    """Composite foreign keys cannot be added to an existing SQLite table, so it is PostgreSQL only."""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(SUPPLIER_LEVEL_FK)
+
+
+def remove_supplier_level_foreign_key(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("ALTER TABLE api_salesnetworkcell DROP CONSTRAINT cell_supplier_level_fk")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="salesnetworkcell",
+            name="supplier_level",
+            field=models.PositiveSmallIntegerField(
+                editable=False,
+                help_text="Hierarchy level of the supplier, denormalized so the database can check the hierarchy rules.",
+                null=True,
+                verbose_name="Supplier Level",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="salesnetworkcell",
+            name="supplier",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=api.models.detach_from_supplier,
+                to="api.salesnetworkcell",
+                verbose_name="Supplier",
+            ),
+        ),
+        migrations.RunPython(populate_supplier_levels, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="salesnetworkcell",
+            constraint=models.UniqueConstraint(fields=("id", "hierarchy_level"), name="cell_id_level_uniq"),
+        ),
+        migrations.AddConstraint(
+            model_name="salesnetworkcell",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("supplier__isnull", True), ("supplier_level__isnull", False), _connector="OR"),
+                name="cell_supplier_level_required",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="salesnetworkcell",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    ("supplier__isnull", True),
+                    models.Q(("hierarchy_level", models.F("supplier_level")), _negated=True),
+                    _connector="OR",
+                ),
+                name="cell_level_differs_from_supplier",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="salesnetworkcell",
+            constraint=models.CheckConstraint(
+                condition=models.Q(
+                    models.Q(("hierarchy_level", 0), ("hierarchy_name", "Factory"), ("supplier__isnull", True)),
+                    models.Q(("hierarchy_level", 1), ("hierarchy_name", "Retail Network")),
+                    models.Q(
+                        ("hierarchy_level", 2),
+                        ("hierarchy_name", "Individual Entrepreneur"),
+                        models.Q(
+                            ("supplier__isnull", True), models.Q(("supplier_level", 0), _negated=True), _connector="OR"
+                        ),
+                    ),
+                    models.Q(
+                        ("hierarchy_level", 1),
+                        ("hierarchy_name", "Individual Entrepreneur"),
+                        models.Q(("supplier__isnull", True), ("supplier_level", 0), _connector="OR"),
+                    ),
+                    _connector="OR",
+                ),
+                name="cell_level_matches_name",
+            ),
+        ),
+        migrations.RunPython(add_supplier_level_foreign_key, remove_supplier_level_foreign_key),
+    ]
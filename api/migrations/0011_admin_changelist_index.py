@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_hierarchy_constraints"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="salesnetworkcell",
+            index=models.Index(fields=["hierarchy_level", "-created_at", "-id"], name="cell_admin_order_idx"),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_admin_changelist_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BulkOperation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "action",
+                    models.CharField(choices=[("clear_debt", "Clear debt")], max_length=50, verbose_name="Action"),
+                ),
+                ("query", models.BinaryField(help_text="Pickled query of the selection.", verbose_name="Selection")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Status",
+                    ),
+                ),
+                ("total", models.PositiveIntegerField(blank=True, null=True, verbose_name="Total")),
+                ("processed", models.PositiveIntegerField(default=0, verbose_name="Processed")),
+                ("last_id", models.PositiveBigIntegerField(default=0, verbose_name="Last Processed ID")),
+                ("chunk_size", models.PositiveIntegerField(default=1000, verbose_name="Chunk Size")),
+                ("worker", models.CharField(blank=True, max_length=64, verbose_name="Worker")),
+                ("heartbeat_at", models.DateTimeField(blank=True, null=True, verbose_name="Heartbeat At")),
+                ("error", models.TextField(blank=True, verbose_name="Error")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+                ("finished_at", models.DateTimeField(blank=True, null=True, verbose_name="Finished At")),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Created By",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Bulk Operation",
+                "verbose_name_plural": "Bulk Operations",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# model: (full-text fields, trigram fields), as SEARCH_FIELDS and TRIGRAM_FIELDS of the models
+SEARCH_FIELDS = {
+    "product": (("name", "model"), ("name", "model")),
+    "contact": (("country", "city", "street", "house_number"), ("city", "street")),
+    "salesnetworkcell": (("name",), ("name",)),
+}
+PREFIXES = {"product": "product", "contact": "contact", "salesnetworkcell": "cell"}
+
+
+def get_indexes(apps):
+    for model_name, (fields, trigram_fields) in SEARCH_FIELDS.items():
+        model = apps.get_model("api", model_name)
+        prefix = PREFIXES[model_name]
+        yield model, GinIndex(SearchVector(*fields, config="simple"), name=f"{prefix}_search_idx")
+        for field in trigram_fields:
+            yield model, GinIndex(fields=[field], opclasses=["gin_trgm_ops"], name=f"{prefix}_{field}_trgm_idx")
+
+
+def add_search_indexes(apps, schema_editor):
+    """GIN indexes only exist on PostgreSQL, other databases search without index (see api.search)."""
+    if schema_editor.connection.vendor == "postgresql":
+        for model, index in get_indexes(apps):
+            schema_editor.add_index(model, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for model, index in get_indexes(apps):
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_bulkoperation"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_unfinished_operations(apps, schema_editor):
+    """The pickled selections are not converted, unfinished operations have to be run again from the admin."""
+    BulkOperation = apps.get_model("api", "BulkOperation")
+    BulkOperation.objects.exclude(status__in=["done", "failed"]).update(status="failed", finished_at=timezone.now())
+    BulkOperation.objects.exclude(status="done").update(
+        error="The selection was stored by an older version, run the action again."
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bulkoperation",
+            name="cell_ids",
+            field=models.JSONField(
+                default=list, editable=False, help_text="Sorted ids of the selected cells.", verbose_name="Selection"
+            ),
+        ),
+        migrations.RunPython(fail_unfinished_operations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="bulkoperation",
+            name="query",
+        ),
+    ]
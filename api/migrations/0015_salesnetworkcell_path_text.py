@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_bulkoperation_cell_ids"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="salesnetworkcell",
+            name="path",
+            field=models.TextField(
+                db_index=True,
+                default="/",
+                editable=False,
+                help_text="Materialized path of supplier ids from the top of the chain, e.g. '/1/5/'.",
+                verbose_name="Path",
+            ),
+        ),
+    ]
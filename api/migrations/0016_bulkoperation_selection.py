@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+def convert_selections(apps, schema_editor):
+    """The stored ids become the selected ids of an unfiltered changelist."""
+    BulkOperation = apps.get_model("api", "BulkOperation")
+    for operation in BulkOperation.objects.exclude(status="done").iterator():
+        operation.selection = {"params": {}, "ids": operation.cell_ids}
+        operation.max_id = max(operation.cell_ids, default=0)
+        operation.save(update_fields=["selection", "max_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_salesnetworkcell_path_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bulkoperation",
+            name="max_id",
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Largest Selectable ID"),
+        ),
+        migrations.AddField(
+            model_name="bulkoperation",
+            name="selection",
+            field=models.JSONField(
+                default=dict,
+                editable=False,
+                help_text="Changelist filters and selected ids of the cells, see SalesNetworkCellAdmin.get_selection.",
+                verbose_name="Selection",
+            ),
+        ),
+        migrations.RunPython(convert_selections, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="bulkoperation",
+            name="cell_ids",
+        ),
+    ]
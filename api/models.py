@@ -1,6 +1,170 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.functions import Concat, StrIndex, Substr
+from django.utils import timezone
+
+
+def detach_from_supplier(collector, field, sub_objs, using):
+    """on_delete handler of SalesNetworkCell.supplier: SET_NULL, then clear the denormalized supplier level.
+    The supplier is cleared first so every intermediate state satisfies the hierarchy constraints.
+    sub_objs is evaluated (not lazy), so both updates filter on the primary keys of the cells."""
+    collector.add_field_update(field, None, sub_objs)
+    collector.add_field_update(field.model._meta.get_field("supplier_level"), None, sub_objs)
+
+
+class SalesNetworkCellQuerySet(models.QuerySet):
+    """QuerySet for SalesNetworkCell with helpers for loading related objects."""
+
+    def with_related(self):
+        """Load contact, supplier and products in a fixed number of queries."""
+        return self.select_related("contact", "supplier").prefetch_related("products")
+
+    def touch(self):
+        """Bump the version stamp of the cells, e.g. when their contact or products change."""
+        return self.update(updated_at=timezone.now())
+
+    def expected_paths(self):
+        """Compute the materialized path of every cell from the supplier links alone.
+        Cells caught in a supplier cycle are unreachable from the top of any chain and are left out."""
+        roots, children = [], defaultdict(list)
+        for pk, supplier_id in self.values_list("id", "supplier_id").iterator(chunk_size=10000):
+            (children[supplier_id] if supplier_id else roots).append(pk)
+        paths = {}
+        stack = [(pk, "/") for pk in roots]
+        while stack:
+            pk, path = stack.pop()
+            paths[pk] = path
+            stack.extend((child, f"{path}{pk}/") for child in children.get(pk, ()))
+        return paths
+
+    @staticmethod
+    def subtree_prefixes(pk, old_path):
+        """Return the paths the direct children of cell 'pk' may have.
+        old_path may be stale when ancestors were detached first, so every suffix of it is included."""
+        ancestor_ids = [part for part in old_path.split("/") if part]
+        return [
+            "/" + "".join(f"{part}/" for part in ancestor_ids[i:]) + f"{pk}/" for i in range(len(ancestor_ids) + 1)
+        ]
+
+    def subtree(self, pk, old_path):
+        """Return all descendants of the cell 'pk' from their materialized paths, see subtree_prefixes."""
+        condition = Q()
+        for prefix in self.subtree_prefixes(pk, old_path):
+            condition |= Q(path__startswith=prefix)
+        return self.filter(condition)
+
+    def rebase_descendants(self, pk, old_path, new_prefix):
+        """Rewrite the materialized paths of all descendants of the cell 'pk':
+        the part up to and including '/<pk>/' is replaced by new_prefix."""
+        token = f"/{pk}/"
+        return self.subtree(pk, old_path).update(
+            path=Concat(
+                Value(new_prefix),
+                Substr("path", StrIndex("path", Value(token)) + len(token)),
+                output_field=models.TextField(),
+            )
+        )
+
+    def add_to_rollups(self, totals, chunk_size=500):
+        """Add {cell id: (debt, cells)} amounts to the subtree rollups with one UPDATE per chunk of cells."""
+        items = [(pk, debt, cells) for pk, (debt, cells) in totals.items() if debt or cells]
+        while items:
+            chunk, items = items[:chunk_size], items[chunk_size:]
+            self.filter(id__in=[pk for pk, _, _ in chunk]).update(
+                updated_at=timezone.now(),
+                subtree_debt=F("subtree_debt")
+                + Case(
+                    *[When(id=pk, then=Value(Decimal(debt))) for pk, debt, _ in chunk],
+                    default=Value(Decimal(0)),
+                    output_field=models.DecimalField(max_digits=16, decimal_places=2),
+                ),
+                subtree_cells=F("subtree_cells")
+                + Case(
+                    *[When(id=pk, then=Value(cells)) for pk, _, cells in chunk],
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                ),
+            )
+
+    def detach_from_rollups(self, cell):
+        """Subtract a deleted cell and the subtrees of its remaining children from the rollups of its ancestors."""
+        children = self.filter(path__in=self.subtree_prefixes(cell.pk, cell.path)).aggregate(
+            debt=Sum("subtree_debt"), cells=Sum("subtree_cells")
+        )
+        debt = Decimal(cell.debt) + (children["debt"] or 0)
+        cells = 1 + (children["cells"] or 0)
+        self.add_to_rollups({pk: (-debt, -cells) for pk in cell.path_ids(cell.path)})
+
+    def clear_debt(self):
+        """Set the debt of the cells to zero and update the rollups of the cells and their ancestors.
+        The debts are read with a row lock, so they cannot change before they are subtracted."""
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        ids = []
+        with transaction.atomic():
+            for pk, path, debt in (
+                self.exclude(debt=0).select_for_update(of=("self",)).values_list("id", "path", "debt")
+            ):
+                ids.append(pk)
+                for target in (pk, *self.model.path_ids(path)):
+                    totals[target][0] -= debt
+            self.model.objects.filter(id__in=ids).update(debt=0, updated_at=timezone.now())
+            self.model.objects.add_to_rollups(totals)
+        return len(ids)
+
+    def expected_rollups(self):
+        """Compute the subtree debt and cell count of every cell from the materialized paths."""
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        for pk, path, debt in self.values_list("id", "path", "debt").iterator(chunk_size=10000):
+            for target in (pk, *self.model.path_ids(path)):
+                totals[target][0] += debt
+                totals[target][1] += 1
+        return totals
+
+    def descendants_of(self, pk, max_depth):
+        """Return the cell and its downstream subtree with one recursive query.
+        Each cell is annotated with 'depth', the distance from the root cell."""
+        table = self.model._meta.db_table
+        return self.raw(
+            f"""
+            WITH RECURSIVE tree (id, depth) AS (
+                SELECT id, 0 FROM {table} WHERE id = %s
+                UNION ALL
+                SELECT cell.id, tree.depth + 1 FROM {table} cell
+                JOIN tree ON cell.supplier_id = tree.id
+                WHERE tree.depth < %s
+            )
+            SELECT cell.*, tree.depth FROM {table} cell
+            JOIN tree ON cell.id = tree.id
+            ORDER BY tree.depth, cell.hierarchy_level, cell.name, cell.id
+            """,
+            [pk, max_depth],
+        )
+
+    def ancestors_of(self, pk, max_depth):
+        """Return the cell and its upstream supplier chain with one recursive query.
+        Each cell is annotated with 'depth', the distance from the starting cell."""
+        table = self.model._meta.db_table
+        return self.raw(
+            f"""
+            WITH RECURSIVE chain (id, supplier_id, depth) AS (
+                SELECT id, supplier_id, 0 FROM {table} WHERE id = %s
+                UNION ALL
+                SELECT cell.id, cell.supplier_id, chain.depth + 1 FROM {table} cell
+                JOIN chain ON cell.id = chain.supplier_id
+                WHERE chain.depth < %s
+            )
+            SELECT cell.*, chain.depth FROM {table} cell
+            JOIN chain ON cell.id = chain.id
+            ORDER BY chain.depth
+            """,
+            [pk, max_depth],
+        )
 
 
 class SalesNetworkCell(models.Model):
@@ -21,29 +185,232 @@ class SalesNetworkCell(models.Model):
         "Contact", on_delete=models.CASCADE, verbose_name="Contact Information", null=True, blank=True
     )
     products = models.ManyToManyField("Product", blank=True, null=True, verbose_name="Products")
-    supplier = models.ForeignKey("self", null=True, blank=True, on_delete=models.SET_NULL, verbose_name="Supplier")
+    supplier = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=detach_from_supplier, verbose_name="Supplier"
+    )
+    supplier_level = models.PositiveSmallIntegerField(
+        null=True,
+        editable=False,
+        verbose_name="Supplier Level",
+        help_text="Hierarchy level of the supplier, denormalized so the database can check the hierarchy rules.",
+    )
     debt = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Debt", default=0.00)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At")
+    path = models.TextField(
+        default="/",
+        editable=False,
+        db_index=True,
+        verbose_name="Path",
+        help_text="Materialized path of supplier ids from the top of the chain, e.g. '/1/5/'.",
+    )
+    subtree_debt = models.DecimalField(
+        max_digits=16, decimal_places=2, default=0, editable=False, verbose_name="Subtree Debt"
+    )
+    subtree_cells = models.PositiveIntegerField(default=1, editable=False, verbose_name="Subtree Cells")
 
-    def save(self, *args, **kwargs):
-        """Override save method to ensure hierarchy level and supplier are set correctly"""
-        level_names = {"Factory": 0, "Retail Network": 1, "Individual Entrepreneur": 2}
-        self.hierarchy_level = level_names.get(self.hierarchy_name)
+    objects = SalesNetworkCellQuerySet.as_manager()
 
-        if self.supplier and self.hierarchy_level == self.supplier.hierarchy_level:
+    LEVEL_NAMES = {"Factory": 0, "Retail Network": 1, "Individual Entrepreneur": 2}
+    ROLLUP_FIELDS = ("subtree_debt", "subtree_cells")
+    TRACKED_FIELDS = ("path", "debt", "supplier_id", "hierarchy_level")
+    # full-text and trigram indexed fields, see api.search
+    SEARCH_FIELDS = ("name",)
+    TRIGRAM_FIELDS = ("name",)
+    HIERARCHY_CONSTRAINTS = (
+        "cell_supplier_level_required",
+        "cell_level_differs_from_supplier",
+        "cell_level_matches_name",
+        "cell_supplier_level_fk",
+    )
+
+    def get_supplier_level(self):
+        """Return the hierarchy level of the supplier. The supplier is only loaded when it changed since
+        the cell was loaded, otherwise the denormalized supplier_level is used."""
+        if self.supplier_id is None:
+            return None
+        loaded_supplier_id = getattr(self, "_loaded_values", {}).get("supplier_id")
+        if not SalesNetworkCell.supplier.is_cached(self) and self.supplier_id == loaded_supplier_id:
+            return self.supplier_level
+        return self.supplier.hierarchy_level
+
+    def apply_hierarchy_rules(self):
+        """Set hierarchy level from hierarchy name and validate it against the supplier level.
+        Called by save() and by bulk paths that bypass it. The database enforces the same rules
+        with the constraints in Meta, so queryset updates cannot break them either."""
+        self.hierarchy_level = self.LEVEL_NAMES.get(self.hierarchy_name)
+        self.supplier_level = self.get_supplier_level()
+
+        if self.supplier_level is not None and self.hierarchy_level == self.supplier_level:
             raise ValidationError("Hierarchy level cannot be the same as the supplier")
 
         if self.hierarchy_level == 0:  # Factory level
             self.supplier = None
-        elif self.hierarchy_level == 2 and self.supplier and self.supplier.hierarchy_level == 0:
+            self.supplier_level = None
+        elif self.hierarchy_level == 2 and self.supplier_level == 0:
             self.hierarchy_level = 1
 
-        super().save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: instance.__dict__.get(name) for name in cls.TRACKED_FIELDS}
+        return instance
+
+    @staticmethod
+    def path_ids(path):
+        """Return the ids of the ancestors stored in a materialized path."""
+        return [int(part) for part in path.split("/") if part]
+
+    @property
+    def child_path(self):
+        """Path shared by all descendants of this cell."""
+        return f"{self.path}{self.pk}/"
+
+    def update_path(self):
+        """Set the materialized path from the supplier, rejecting supplier cycles."""
+        self.path = self.supplier.child_path if self.supplier else "/"
+        if self.pk and f"/{self.pk}/" in self.path:
+            raise ValidationError("A cell cannot be supplied by its own descendant")
+
+    def reset_rollups(self):
+        """Set the subtree rollups of a new cell without children."""
+        self.subtree_debt = self._meta.get_field("debt").to_python(self.debt)
+        self.subtree_cells = 1
+
+    def get_ancestors(self):
+        """Return the supplier chain of this cell using the materialized path."""
+        return SalesNetworkCell.objects.filter(id__in=self.path_ids(self.path))
+
+    def get_descendants(self):
+        """Return the whole downstream subtree of this cell using the materialized path."""
+        return SalesNetworkCell.objects.filter(path__startswith=self.child_path)
+
+    def is_ancestor_of(self, other):
+        return other.path.startswith(self.child_path)
+
+    def get_stored_values(self):
+        """Return the path, debt, supplier and level of the stored row, locked until the end of the transaction."""
+        return SalesNetworkCell.objects.select_for_update().filter(pk=self.pk).values(*self.TRACKED_FIELDS).get()
+
+    def save(self, *args, **kwargs):
+        """Override save method to ensure hierarchy level and supplier are set correctly,
+        and to keep the materialized paths and subtree rollups of the cell and its ancestors
+        and descendants up to date. Rollups are only changed with relative updates.
+        The path and supplier level are only written when the supplier changed."""
+        self.apply_hierarchy_rules()
+        debt = self._meta.get_field("debt").to_python(self.debt)
+
+        if self._state.adding:
+            self.update_path()
+            self.reset_rollups()
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                SalesNetworkCell.objects.add_to_rollups(
+                    {pk: (self.subtree_debt, 1) for pk in self.path_ids(self.path)}
+                )
+            self._loaded_values = {
+                "path": self.path,
+                "debt": debt,
+                "supplier_id": self.supplier_id,
+                "hierarchy_level": self.hierarchy_level,
+            }
+            return
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in (*self.ROLLUP_FIELDS, "path", "supplier_level")
+            ]
+        elif "hierarchy_name" in update_fields:
+            update_fields = [*update_fields, "hierarchy_level"]
+
+        try:
+            with transaction.atomic():
+                # The deltas are computed from the locked row, not from the values loaded with the instance,
+                # so a concurrent update of the debt or the supplier cannot be counted twice or lost.
+                stored = self._loaded_values = self.get_stored_values()
+                track_path = "supplier" in update_fields and self.supplier_id != stored["supplier_id"]
+                if track_path:
+                    self.update_path()
+                    update_fields = [*update_fields, "path", "supplier_level"]
+                kwargs["update_fields"] = written = {*update_fields, "updated_at"}
+                debt_delta = debt - stored["debt"] if "debt" in written else 0
+                track_level = "hierarchy_level" in written and self.hierarchy_level != stored["hierarchy_level"]
+
+                super().save(*args, **kwargs)
+                if track_level:
+                    # also cascaded by the composite foreign key on PostgreSQL
+                    SalesNetworkCell.objects.filter(supplier_id=self.pk).update(supplier_level=self.hierarchy_level)
+                if debt_delta:
+                    SalesNetworkCell.objects.add_to_rollups(
+                        {pk: (debt_delta, 0) for pk in (self.pk, *self.path_ids(stored["path"]))}
+                    )
+                    self.subtree_debt += debt_delta
+                if track_path and stored["path"] != self.path:
+                    self.move_subtree(stored["path"])
+        except IntegrityError as exc:
+            if not any(name in str(exc) for name in self.HIERARCHY_CONSTRAINTS):
+                raise
+            raise ValidationError("Hierarchy level conflicts with the cells supplied by this cell") from exc
+        self._loaded_values = {
+            "path": self.path if track_path else stored["path"],
+            "debt": debt if "debt" in written else stored["debt"],
+            "supplier_id": self.supplier_id if "supplier" in written else stored["supplier_id"],
+            "hierarchy_level": self.hierarchy_level if "hierarchy_level" in written else stored["hierarchy_level"],
+        }
+
+    def move_subtree(self, old_path):
+        """Move the rollups and paths of the subtree from the old ancestors to the new ones."""
+        debt, cells = (
+            SalesNetworkCell.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("subtree_debt", "subtree_cells")
+            .get()
+        )
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        for pk in self.path_ids(old_path):
+            totals[pk][0] -= debt
+            totals[pk][1] -= cells
+        for pk in self.path_ids(self.path):
+            totals[pk][0] += debt
+            totals[pk][1] += cells
+        SalesNetworkCell.objects.add_to_rollups(totals)
+        SalesNetworkCell.objects.rebase_descendants(self.pk, old_path, self.child_path)
 
     class Meta:
         verbose_name = "Sales Network Cell"
         verbose_name_plural = "Sales Network Cells"
         ordering = ["hierarchy_level", "name"]
+        indexes = [
+            models.Index(fields=["hierarchy_level", "name", "id"], name="cell_keyset_idx"),
+            models.Index(fields=["subtree_debt", "id"], name="cell_subtree_debt_idx"),
+            models.Index(fields=["hierarchy_level", "-created_at", "-id"], name="cell_admin_order_idx"),
+        ]
+        # The hierarchy rules of apply_hierarchy_rules(), checked on every write including bulk paths.
+        # On PostgreSQL the (supplier, supplier_level) pair also references (id, hierarchy_level)
+        # with ON UPDATE CASCADE, see migration 0010.
+        constraints = [
+            models.UniqueConstraint(fields=["id", "hierarchy_level"], name="cell_id_level_uniq"),
+            models.CheckConstraint(
+                condition=Q(supplier__isnull=True) | Q(supplier_level__isnull=False),
+                name="cell_supplier_level_required",
+            ),
+            models.CheckConstraint(
+                condition=Q(supplier__isnull=True) | ~Q(hierarchy_level=F("supplier_level")),
+                name="cell_level_differs_from_supplier",
+            ),
+            models.CheckConstraint(
+                condition=Q(hierarchy_name="Factory", hierarchy_level=0, supplier__isnull=True)
+                | Q(hierarchy_name="Retail Network", hierarchy_level=1)
+                | Q(hierarchy_name="Individual Entrepreneur", hierarchy_level=2)
+                & (Q(supplier__isnull=True) | ~Q(supplier_level=0))
+                | Q(hierarchy_name="Individual Entrepreneur", hierarchy_level=1)
+                & (Q(supplier__isnull=True) | Q(supplier_level=0)),
+                name="cell_level_matches_name",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} (Level {self.hierarchy_level})"
@@ -57,11 +424,16 @@ class Contact(models.Model):
     city = models.CharField(max_length=100, verbose_name="City")
     street = models.CharField(max_length=100, verbose_name="Street")
     house_number = models.CharField(max_length=10, verbose_name="House Number")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At")
+
+    SEARCH_FIELDS = ("country", "city", "street", "house_number")
+    TRIGRAM_FIELDS = ("city", "street")
 
     class Meta:
         verbose_name = "Contact"
         verbose_name_plural = "Contacts"
         ordering = ["email"]
+        indexes = [models.Index(fields=["email", "id"], name="contact_keyset_idx")]
 
     def __str__(self):
         return f"{self.email} - {self.city}, {self.street} {self.house_number}"
@@ -73,11 +445,69 @@ class Product(models.Model):
     name = models.CharField(max_length=100, verbose_name="Product Name")
     model = models.CharField(max_length=100, verbose_name="Model", null=True, blank=True)
     release_date = models.DateField(verbose_name="Release Date", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Updated At")
+
+    SEARCH_FIELDS = ("name", "model")
+    TRIGRAM_FIELDS = ("name", "model")
 
     class Meta:
         verbose_name = "Product"
         verbose_name_plural = "Products"
         ordering = ["name"]
+        indexes = [models.Index(fields=["name", "id"], name="product_keyset_idx")]
 
     def __str__(self):
         return f"{self.name}: {self.model}"
+
+
+class BulkOperation(models.Model):
+    """A bulk admin action on sales network cells, run by a background worker in chunks of ids,
+    each in its own short transaction. Progress is saved with every chunk, so an interrupted
+    operation resumes after the last processed id (see api.tasks)."""
+
+    ACTION_CHOICES = [("clear_debt", "Clear debt")]
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    action = models.CharField(max_length=50, choices=ACTION_CHOICES, verbose_name="Action")
+    selection = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name="Selection",
+        help_text="Changelist filters and selected ids of the cells, see SalesNetworkCellAdmin.get_selection.",
+    )
+    max_id = models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Largest Selectable ID")
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="pending", db_index=True, verbose_name="Status"
+    )
+    total = models.PositiveIntegerField(null=True, blank=True, verbose_name="Total")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Processed")
+    last_id = models.PositiveBigIntegerField(default=0, verbose_name="Last Processed ID")
+    chunk_size = models.PositiveIntegerField(default=1000, verbose_name="Chunk Size")
+    worker = models.CharField(max_length=64, blank=True, verbose_name="Worker")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Heartbeat At")
+    error = models.TextField(blank=True, verbose_name="Error")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, verbose_name="Created By"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+
+    class Meta:
+        verbose_name = "Bulk Operation"
+        verbose_name_plural = "Bulk Operations"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.get_action_display()} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Percentage of the selected cells processed, None until the worker counted them."""
+        if not self.total:
+            return None if self.total is None else 100
+        return min(100, round(100 * self.processed / self.total))
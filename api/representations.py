@@ -0,0 +1,156 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from functools import cache
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.query import ValuesIterable
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Serializer fields whose to_representation returns the values read from the database unchanged
+PLAIN_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+
+def get_converter(field, current_timezone):
+    """Function giving the representation of the database values of the field, None if they are unchanged.
+    ISO 8601 datetimes in the current timezone are converted here, DRF resolves the timezone for each value."""
+    if field is None:
+        return None
+    iso = str(getattr(field, "format", api_settings.DATETIME_FORMAT)).lower() == ISO_8601
+    if isinstance(field, serializers.DateTimeField) and iso and current_timezone and not hasattr(field, "timezone"):
+        # the database backends return UTC datetimes, unchanged in the UTC timezone
+        utc = str(current_timezone) == "UTC"
+
+        def convert(value):
+            if value.tzinfo is dt_timezone.utc and utc:
+                value = value.isoformat()
+            elif value.utcoffset() is None:
+                return field.to_representation(value)
+            else:
+                value = value.astimezone(current_timezone).isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+        return convert
+    return field.to_representation
+
+
+class RelatedValuesIterable(ValuesIterable):
+    """Iterable of values() rows to which the many-to-many relations of 'representation' are added,
+    with one query per relation for each chunk of rows, like prefetch_related for model instances."""
+
+    representation = None
+    related_chunk_size = 2000
+
+    def __iter__(self):
+        rows = super().__iter__()
+        while chunk := list(islice(rows, self.related_chunk_size)):
+            self.representation.add_related(chunk, self.queryset.db)
+            yield from chunk
+
+
+class ValuesRepresentation:
+    """Read-only representation of a ModelSerializer computed from values() rows instead of model instances.
+
+    The serializer and its fields are built once and their converters once per batch of rows. Only the fields
+    that change the database values (decimals, dates, choices) are converted. Nested serializers are read from
+    the same row ('contact__email'). Many-to-many ones are represented once per related object and grouped by
+    row id before the rows are used. The data is the same as the serializer's."""
+
+    def __init__(self, serializer_class, prefix=""):
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.pk = f"{prefix}{self.model._meta.pk.attname}"
+        self.columns = [self.pk]
+        self.related = []
+        # (name, column, field to convert the values, nested representation), in the order of the serializer fields
+        self.fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == "*" or "." in field.source:
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is not a model field")
+            if isinstance(field, serializers.ListSerializer):
+                if prefix:
+                    raise ImproperlyConfigured(f"{serializer_class.__name__}.{name}: nested many-to-many")
+                representation = ValuesRepresentation(type(field.child))
+                self.related.append((field.source, representation))
+                self.fields.append((name, field.source, None, representation))
+            elif isinstance(field, serializers.BaseSerializer):
+                representation = ValuesRepresentation(type(field), f"{prefix}{field.source}__")
+                self.columns += representation.columns
+                self.fields.append((name, representation.pk, None, representation))
+            elif isinstance(field, serializers.RelatedField):
+                if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                    raise ImproperlyConfigured(f"{serializer_class.__name__}.{name}: only primary keys are supported")
+                self.columns.append(f"{prefix}{field.source}")
+                self.fields.append((name, f"{prefix}{field.source}", None, None))
+            else:
+                self.columns.append(f"{prefix}{field.source}")
+                self.fields.append(
+                    (name, f"{prefix}{field.source}", None if isinstance(field, PLAIN_FIELDS) else field, None)
+                )
+        self.iterable_class = type("RelatedValuesIterable", (RelatedValuesIterable,), {"representation": self})
+
+    def values(self, queryset):
+        """The values() queryset of the rows to represent, filtered, ordered and sliced like any queryset."""
+        queryset = queryset.values(*self.columns)
+        queryset._iterable_class = self.iterable_class
+        return queryset
+
+    def add_related(self, rows, using):
+        """Set the represented objects of each many-to-many relation on the rows, under the relation name."""
+        ids = [row[self.pk] for row in rows]
+        for source, representation in self.related:
+            field = self.model._meta.get_field(source)
+            query_name = field.related_query_name()
+            # ordered like the relation's prefetch_related query
+            queryset = field.related_model._default_manager.using(using).filter(**{f"{query_name}__in": ids})
+            # the related objects are represented from (row id, primary key, ...) tuples
+            positions = {column: index for index, column in enumerate(representation.columns, start=1)}
+            bound = representation.bind(positions=positions)
+            represented, grouped = {}, defaultdict(list)
+            for item in queryset.values_list(query_name, *representation.columns):
+                if item[1] not in represented:
+                    represented[item[1]] = representation.represent(item, bound)
+                grouped[item[0]].append(represented[item[1]])
+            for row in rows:
+                row[source] = grouped.get(row[self.pk], [])
+
+    def bind(self, current_timezone=None, positions=None):
+        """The fields with the converters of their values, for the current timezone. With 'positions', the
+        columns are read from the given positions of values_list() rows."""
+        if current_timezone is None and settings.USE_TZ:
+            current_timezone = timezone.get_current_timezone()
+        return [
+            (
+                name,
+                positions[column] if positions else column,
+                get_converter(field, current_timezone),
+                nested and nested.bind(current_timezone, positions),
+            )
+            for name, column, field, nested in self.fields
+        ]
+
+    def represent(self, row, bound):
+        data = {}
+        for name, column, converter, nested in bound:
+            value = row[column]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = list(value) if isinstance(value, list) else self.represent(row, nested)
+            else:
+                data[name] = value if converter is None else converter(value)
+        return data
+
+    def represent_rows(self, rows):
+        bound = self.bind()
+        return [self.represent(row, bound) for row in rows]
+
+
+@cache
+def get_representation(serializer_class):
+    return ValuesRepresentation(serializer_class)
@@ -0,0 +1,131 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.views import APIView
+from rest_framework_simplejwt.models import TokenUser
+
+# Request whose queries are being routed, set by ReplicaRoutingMiddleware
+routed_request = ContextVar("routed_request", default=None)
+
+# Header with which staff users read from the primary, e.g. to check a change that is still replicating
+PRIMARY_HEADER = "X-Read-From"
+
+
+# Signed cookie with which the reads of a user stay on the primary after their writes, see stick_after_write()
+STICKY_COOKIE = "read_primary"
+STICKY_SALT = "api.routers.sticky"
+
+
+def get_replica_lag():
+    return getattr(settings, "DATABASE_REPLICA_LAG", 5)
+
+
+def is_sticky(request, user_id):
+    """Whether the request carries the sticky cookie of the user, signed less than DATABASE_REPLICA_LAG seconds ago."""
+    value = request.get_signed_cookie(STICKY_COOKIE, default=None, salt=STICKY_SALT, max_age=get_replica_lag())
+    return value == str(user_id)
+
+
+def get_token_user(request):
+    """Return the user authenticated by DRF, which sets it on the Django request, or None.
+    The lazy session user of AuthenticationMiddleware is not evaluated (it would query the database)."""
+    user = getattr(request, "user", None)
+    return user if issubclass(type(user), TokenUser) else None
+
+
+def is_api_view(request):
+    func = getattr(request.resolver_match, "func", None)
+    view_class = getattr(func, "cls", None) or getattr(func, "view_initkwargs", {}).get("view_class")
+    return isinstance(view_class, type) and issubclass(view_class, APIView)
+
+
+def reads_from_replicas(request):
+    """Whether the queries of the request may be read from a replica: safe methods of API views only,
+    unless the user wrote recently (sticky primary) or is staff and asked for the primary."""
+    if request.method not in SAFE_METHODS or not is_api_view(request):
+        return False
+    user = get_token_user(request)
+    if user is None:
+        return True
+    if user.is_staff and request.headers.get(PRIMARY_HEADER, "").lower() == "primary":
+        return False
+    return not is_sticky(request, user.id)
+
+
+class ReplicaRouter:
+    """Route the reads of the requests allowed by reads_from_replicas to one of DATABASE_REPLICAS, chosen at
+    random for each request. Everything else, writes and reads in a transaction included, uses the primary."""
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        request = routed_request.get()
+        if not replicas or request is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if not hasattr(request, "_read_database"):
+            database = random.choice(replicas) if reads_from_replicas(request) else DEFAULT_DB_ALIAS
+            if get_token_user(request) is None:
+                return database  # decided again once DRF has authenticated the user
+            request._read_database = database
+        return request._read_database
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, "DATABASE_REPLICAS", [])
+
+
+class ReplicaRoutingMiddleware:
+    """Make the request available to ReplicaRouter and, after a successful write by an API user,
+    keep their reads on the primary while the write replicates with the signed STICKY_COOKIE."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routed_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routed_request.reset(token)
+        return self.stick_after_write(request, response)
+
+    async def __acall__(self, request):
+        token = routed_request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routed_request.reset(token)
+        return self.stick_after_write(request, response)
+
+    def stick_after_write(self, request, response):
+        user = get_token_user(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and user is not None:
+            if getattr(settings, "DATABASE_REPLICAS", []):
+                # Kept by the client rather than in a cache, so every process sees it. The signature carries
+                # its time, so a client keeping the cookie longer than DATABASE_REPLICA_LAG reads from replicas.
+                response.set_signed_cookie(
+                    STICKY_COOKIE,
+                    str(user.id),
+                    salt=STICKY_SALT,
+                    max_age=get_replica_lag(),
+                    secure=request.is_secure(),
+                    httponly=True,
+                    samesite="Lax",
+                )
+        return response
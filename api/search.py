@@ -0,0 +1,73 @@
+from functools import reduce
+from operator import add, or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+from rest_framework.filters import BaseFilterBackend
+
+# 'simple' does no stemming: names, models and addresses are not English prose
+SEARCH_CONFIG = "simple"
+
+
+def search_vector(fields):
+    """Document searched with full-text, the expression of the '<model>_search_idx' GIN indexes."""
+    return SearchVector(*fields, config=SEARCH_CONFIG)
+
+
+def search(queryset, text, rank=True):
+    """Filter the queryset on the model's SEARCH_FIELDS and, with rank, order it by relevance then id.
+
+    On PostgreSQL a row matches the full-text query (websearch syntax) or is similar to a word of one of
+    the TRIGRAM_FIELDS, so typos and prefixes are found too; both use the GIN indexes of migration 0013.
+    Other databases fall back to 'icontains' on every term."""
+    model = queryset.model
+    text = text.strip()
+    if not text:
+        return queryset
+
+    if connections[queryset.db].vendor == "postgresql":
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        condition = reduce(
+            or_, (Q(**{f"{field}__trigram_word_similar": text}) for field in model.TRIGRAM_FIELDS), Q(document=query)
+        )
+        queryset = queryset.alias(document=search_vector(model.SEARCH_FIELDS)).filter(condition)
+        if rank:
+            similarities = [TrigramWordSimilarity(text, field) for field in model.TRIGRAM_FIELDS]
+            similarity = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+            queryset = queryset.annotate(rank=SearchRank(F("document"), query) + similarity)
+    else:
+        for term in text.split():
+            queryset = queryset.filter(
+                reduce(or_, (Q(**{f"{field}__icontains": term}) for field in model.SEARCH_FIELDS))
+            )
+        if rank:
+            matches = (
+                Case(When(Q(**{f"{field}__icontains": text}), then=Value(1.0)), default=Value(0.0))
+                for field in model.SEARCH_FIELDS
+            )
+            queryset = queryset.annotate(rank=reduce(add, matches, Value(0.0, output_field=FloatField())))
+    return queryset.order_by("-rank", "id") if rank else queryset
+
+
+class SearchFilterBackend(BaseFilterBackend):
+    """Filter on '?search=' with api.search.search. Results are ordered by relevance,
+    unless an explicit '?ordering=' is given to the OrderingFilter."""
+
+    search_param = "search"
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "")
+        return search(queryset, text, rank="ordering" not in request.query_params)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.search_param,
+                "required": False,
+                "in": "query",
+                "description": "Full-text and fuzzy search, results ordered by relevance.",
+                "schema": {"type": "string"},
+            }
+        ]
@@ -1,6 +1,26 @@
 from rest_framework import serializers
 
 from .models import Contact, Product, SalesNetworkCell
+from .representations import get_representation
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key related field that resolves objects from a dict preloaded into
+    context["prefetched"][<field name>], so validating many items costs no query per item.
+    Falls back to the regular lookup when nothing was preloaded."""
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get("prefetched", {}).get(self.field_name)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return prefetched[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -24,8 +44,51 @@ class SalesNetworkCellSerializer(serializers.ModelSerializer):
 
     contact = ContactSerializer(read_only=True)
     products = ProductSerializer(many=True, read_only=True)
+    supplier = PrefetchedPrimaryKeyRelatedField(
+        queryset=SalesNetworkCell.objects.all(), required=False, allow_null=True, label="Supplier"
+    )
 
     class Meta:
         model = SalesNetworkCell
-        fields = "__all__"
+        exclude = ("path", "supplier_level")
         read_only_fields = ("created_at", "hierarchy_level", "contact", "products")
+
+
+class SalesNetworkCellTreeSerializer(serializers.ModelSerializer):
+    """Serializer for cells returned by the supply chain endpoints."""
+
+    depth = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SalesNetworkCell
+        fields = ("id", "name", "hierarchy_name", "hierarchy_level", "supplier", "debt", "depth")
+
+
+class ValuesListSerializer(serializers.ListSerializer):
+    """Represents the rows of a ValuesSerializer in one batch."""
+
+    def to_representation(self, data):
+        return get_representation(self.child.model_serializer_class).represent_rows(data)
+
+
+class ValuesSerializer(serializers.BaseSerializer):
+    """Read-only serializer of the values() rows of values(queryset), giving the data of 'model_serializer_class'
+    without building model instances nor serializer fields per row, see api.representations."""
+
+    model_serializer_class = None
+
+    class Meta:
+        list_serializer_class = ValuesListSerializer
+
+    @classmethod
+    def values(cls, queryset):
+        return get_representation(cls.model_serializer_class).values(queryset)
+
+    def to_representation(self, row):
+        return get_representation(self.model_serializer_class).represent_rows([row])[0]
+
+
+class SalesNetworkCellReadSerializer(ValuesSerializer):
+    """Read-only SalesNetworkCellSerializer for the list and detail views."""
+
+    model_serializer_class = SalesNetworkCellSerializer
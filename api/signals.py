@@ -0,0 +1,78 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate, mark_deleted
+from .models import Contact, Product, SalesNetworkCell
+
+
+@receiver(post_delete, sender=SalesNetworkCell)
+def detach_descendants(sender, instance, **kwargs):
+    """Children of a deleted cell lose their supplier (on_delete=SET_NULL),
+    so they become the top of their chains and leave the rollups of its ancestors.
+    The descendants, whose supplier or path change, get a new version stamp in the deletion transaction
+    and are remembered for invalidate_cell."""
+    descendants = SalesNetworkCell.objects.subtree(instance.pk, instance.path)
+    instance._detached_ids = list(descendants.values_list("id", flat=True))
+    descendants.touch()
+    SalesNetworkCell.objects.detach_from_rollups(instance)
+    SalesNetworkCell.objects.rebase_descendants(instance.pk, instance.path, "/")
+
+
+@receiver(post_save, sender=SalesNetworkCell)
+@receiver(post_delete, sender=SalesNetworkCell)
+def invalidate_cell(sender, instance, **kwargs):
+    """Invalidate the cell and its ancestors, whose rollups change with it, and the descendants of a deleted cell."""
+    paths = {instance.path, getattr(instance, "_loaded_values", {}).get("path") or "/"}
+    ancestor_ids = {pk for path in paths for pk in SalesNetworkCell.path_ids(path)}
+    cell_ids = ancestor_ids.union(instance.__dict__.pop("_detached_ids", []))
+    invalidate(["cell:list", f"cell:{instance.pk}", *(f"cell:{pk}" for pk in cell_ids)])
+
+
+@receiver(post_delete, sender=SalesNetworkCell)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Product)
+def record_deletion(sender, instance, **kwargs):
+    mark_deleted(sender)
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def invalidate_contact(sender, instance, **kwargs):
+    """Cells embed their contact, so their version stamps are bumped as well."""
+    cell_ids = list(SalesNetworkCell.objects.filter(contact_id=instance.pk).values_list("id", flat=True))
+    SalesNetworkCell.objects.filter(id__in=cell_ids).touch()
+    invalidate(["contact:list", f"contact:{instance.pk}", "cell:list", *(f"cell:{pk}" for pk in cell_ids)])
+
+
+@receiver(pre_delete, sender=Product)
+def collect_product_cells(sender, instance, **kwargs):
+    """Remember the cells containing the product while they can still be found."""
+    instance._cell_ids = list(SalesNetworkCell.objects.filter(products=instance.pk).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    """Cells embed their products, so their version stamps are bumped as well."""
+    cell_ids = instance.__dict__.pop("_cell_ids", None)
+    if cell_ids is None:
+        cell_ids = list(SalesNetworkCell.objects.filter(products=instance.pk).values_list("id", flat=True))
+    SalesNetworkCell.objects.filter(id__in=cell_ids).touch()
+    invalidate(["product:list", f"product:{instance.pk}", "cell:list", *(f"cell:{pk}" for pk in cell_ids)])
+
+
+@receiver(m2m_changed, sender=SalesNetworkCell.products.through)
+def invalidate_cell_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        instance._cleared_cell_ids = list(instance.salesnetworkcell_set.values_list("id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        cell_ids = [instance.pk]
+    elif action == "post_clear":
+        cell_ids = instance.__dict__.pop("_cleared_cell_ids", [])
+    else:
+        cell_ids = list(pk_set or [])
+    SalesNetworkCell.objects.filter(id__in=cell_ids).touch()
+    invalidate(["cell:list", *(f"cell:{pk}" for pk in cell_ids)])
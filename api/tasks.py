@@ -0,0 +1,130 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import BulkOperation, SalesNetworkCell
+
+logger = logging.getLogger(__name__)
+
+# Operations whose worker has not saved any progress for this long are considered interrupted.
+LEASE = timedelta(seconds=getattr(settings, "BULK_OPERATION_LEASE_SECONDS", 300))
+
+ACTIONS = {
+    "clear_debt": lambda queryset: queryset.clear_debt(),
+}
+
+executor = ThreadPoolExecutor(max_workers=getattr(settings, "BULK_OPERATION_WORKERS", 1))
+
+
+class LeaseLost(Exception):
+    """Another worker took over the operation."""
+
+
+def enqueue(action, selection, user, chunk_size=None):
+    """Record a bulk operation on the cells of a selection (see SalesNetworkCellAdmin.get_selection) and run it
+    in the background once committed. Cells created afterwards, with a larger id, are left out."""
+    operation = BulkOperation.objects.create(
+        action=action,
+        selection=selection,
+        max_id=SalesNetworkCell.objects.aggregate(max_id=Max("id"))["max_id"] or 0,
+        created_by=user,
+        **({"chunk_size": chunk_size} if chunk_size else {}),
+    )
+    transaction.on_commit(lambda: submit(operation.pk))
+    return operation
+
+
+def submit(pk):
+    """Run the operation in the thread pool of this process."""
+    return executor.submit(run_in_thread, pk)
+
+
+def run_in_thread(pk):
+    try:
+        return run(pk)
+    except Exception:
+        logger.exception("Bulk operation %s failed", pk)
+        raise
+    finally:
+        connection.close()
+
+
+def get_queryset(operation):
+    """Return the selected cells, as the changelist of the user who enqueued the operation shows them."""
+    if operation.created_by is None:
+        raise ValueError("The user who enqueued the operation was deleted")
+    model_admin = admin.site.get_model_admin(SalesNetworkCell)
+    queryset = model_admin.get_selection_queryset(operation.selection, operation.created_by)
+    return queryset.filter(id__lte=operation.max_id).select_related(None).prefetch_related(None)
+
+
+def claim(pk, worker):
+    """Take the operation if it is pending, or running without progress for longer than the lease."""
+    now = timezone.now()
+    claimable = Q(status="pending") | Q(status="running", heartbeat_at__lt=now - LEASE)
+    return BulkOperation.objects.filter(claimable, pk=pk).update(status="running", worker=worker, heartbeat_at=now)
+
+
+def run(pk, worker=None):
+    """Process the operation chunk by chunk from its last processed id. Each chunk is applied and its
+    progress saved in one transaction, so after a restart no cell is processed twice or skipped.
+    Return False if the operation could not be claimed or another worker took it over."""
+    worker = worker or uuid.uuid4().hex
+    if not claim(pk, worker):
+        return False
+    operation = BulkOperation.objects.get(pk=pk)
+
+    try:
+        queryset = get_queryset(operation)
+        if operation.total is None:
+            operation.total = queryset.count()
+            BulkOperation.objects.filter(pk=pk).update(total=operation.total)
+        while ids := list(
+            queryset.filter(id__gt=operation.last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[: operation.chunk_size]
+        ):
+            with transaction.atomic():
+                ACTIONS[operation.action](SalesNetworkCell.objects.filter(id__in=ids))
+                invalidate(["cell:all"])
+                saved = BulkOperation.objects.filter(pk=pk, worker=worker).update(
+                    last_id=ids[-1], processed=F("processed") + len(ids), heartbeat_at=timezone.now()
+                )
+                if not saved:
+                    raise LeaseLost
+            operation.last_id = ids[-1]
+    except LeaseLost:
+        return False
+    except Exception as exc:
+        BulkOperation.objects.filter(pk=pk, worker=worker).update(
+            status="failed", error=repr(exc), finished_at=timezone.now()
+        )
+        raise
+    BulkOperation.objects.filter(pk=pk, worker=worker).update(status="done", finished_at=timezone.now())
+    return True
+
+
+def resume(pk):
+    """Queue a failed operation again, it continues after its last processed id."""
+    return BulkOperation.objects.filter(pk=pk, status="failed").update(status="pending", error="", finished_at=None)
+
+
+def run_pending(worker=None):
+    """Run every pending or interrupted operation in this process. Return the number of operations completed."""
+    stale = timezone.now() - LEASE
+    pending = BulkOperation.objects.filter(Q(status="pending") | Q(status="running", heartbeat_at__lt=stale))
+    completed = 0
+    for pk in pending.order_by("created_at").values_list("pk", flat=True):
+        try:
+            completed += run(pk, worker)
+        except Exception:
+            logger.exception("Bulk operation %s failed", pk)
+    return completed
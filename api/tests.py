@@ -1,10 +1,53 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.urls import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
 
-from api.models import Contact, Product, SalesNetworkCell
+from api import metrics, tasks, views
+from api.async_views import AsyncReadView
+from api.cache import bump_tags, delayed_bumps, get_cache, get_tag_versions, invalidate
+from api.management.commands.benchmark_routes import SCENARIOS, get_route_names
+from api.models import BulkOperation, Contact, Product, SalesNetworkCell
+from api.paginators import EstimatedCountPaginator
+from api.routers import PRIMARY_HEADER, STICKY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from api.search import search
+from api.serializers import SalesNetworkCellReadSerializer, SalesNetworkCellSerializer
+from users.authentication import ClaimsJWTAuthentication, ClaimsUser
 from users.models import User
+from users.serializers import UserTokenObtainPairSerializer
+from users.views import UsersListAPIView
 
 
 class APITests(APITestCase):
@@ -197,3 +240,1758 @@ class APITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("products", response.data)
         self.assertEqual(str(response.data["products"]), "Invalid product IDs: 9")
+
+
+class SalesNetworkCellQueryCountTests(APITestCase):
+    """Query count regression tests for the sales network cell endpoints."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.products = [Product.objects.create(name=f"Product {i}", model="X") for i in range(3)]
+
+    def create_cells(self, count):
+        for i in range(count):
+            contact = Contact.objects.create(
+                email=f"cell{i}@mail.com", country="USA", city="Boston", street="Main St", house_number=str(i)
+            )
+            cell = SalesNetworkCell.objects.create(
+                name=f"Retail {i}", hierarchy_name="Retail Network", supplier=self.factory, contact=contact
+            )
+            cell.products.set(self.products)
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        self.create_cells(20)
+        url = reverse("api:cell-list")
+        # version stamp, count, cells with contact and supplier, products
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"page_size": 5})
+        self.assertEqual(len(response.data["results"]), 5)
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"page_size": 20})
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(len(response.data["results"][1]["products"]), 3)
+
+    def test_list_filtered_by_country_query_count(self):
+        self.create_cells(10)
+        url = reverse("api:cell-list")
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"contact__country": "USA", "page_size": 20})
+        self.assertEqual(response.data["count"], 10)
+
+    def test_detail_query_count(self):
+        self.create_cells(1)
+        cell = SalesNetworkCell.objects.get(name="Retail 0")
+        url = reverse("api:cell-detail", args=[cell.id])
+        # version stamp, cell with contact and supplier, products
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.data["contact"]["email"], "cell0@mail.com")
+        self.assertEqual(len(response.data["products"]), 3)
+
+    def test_update_query_count_does_not_depend_on_products(self):
+        self.create_cells(2)
+        first, second = SalesNetworkCell.objects.filter(hierarchy_level=1).order_by("id")
+        second.products.add(*[Product.objects.create(name=f"Extra {i}") for i in range(10)])
+
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.patch(reverse("api:cell-update", args=[first.id]), {"name": "Renamed"})
+        with CaptureQueriesContext(connection) as second_queries:
+            response = self.client.patch(reverse("api:cell-update", args=[second.id]), {"name": "Renamed"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(first_queries), len(second_queries))
+
+    def test_update_with_contact_and_products_query_count(self):
+        self.create_cells(1)
+        cell = SalesNetworkCell.objects.get(name="Retail 0")
+        contact = Contact.objects.create(email="new@mail.com", country="USA", city="A", street="B", house_number="1")
+        extra = [Product.objects.create(name=f"Extra {i}") for i in range(5)]
+        data = {"name": "Renamed", "contact": contact.id, "products": [product.id for product in extra]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse("api:cell-update", args=[cell.id]), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sql = [query["sql"] for query in queries if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        # locked fetch, contact, products, locked stored values, update, through table insert, products of the response
+        self.assertEqual(len(sql), 7, "\n".join(sql))
+        self.assertEqual(len(response.data["products"]), 8)
+        self.assertEqual(response.data["contact"]["email"], "new@mail.com")
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class SalesNetworkCellUpdateConcurrencyTests(TransactionTestCase):
+    """The cell update locks the row, so a concurrent writer is not overwritten with stale values."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.cell = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.product = Product.objects.create(name="Phone", model="X1")
+
+    def patch_in_thread(self, data, results):
+        def patch():
+            client = APIClient()
+            client.force_authenticate(user=self.admin_user)
+            try:
+                results["response"] = client.patch(
+                    reverse("api:cell-update", args=[self.cell.id]), data, format="json"
+                )
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=patch)
+        thread.start()
+        return thread
+
+    def test_update_waits_for_the_row_lock(self):
+        results = {}
+        with transaction.atomic():
+            SalesNetworkCell.objects.select_for_update().get(pk=self.cell.pk)
+            thread = self.patch_in_thread({"products": [self.product.id]}, results)
+            thread.join(timeout=0.5)
+            self.assertTrue(thread.is_alive())
+            SalesNetworkCell.objects.filter(pk=self.cell.pk).update(name="Renamed concurrently")
+        thread.join(timeout=10)
+
+        self.assertEqual(results["response"].status_code, status.HTTP_200_OK)
+        self.assertEqual(results["response"].data["name"], "Renamed concurrently")
+        self.cell.refresh_from_db()
+        self.assertEqual(self.cell.name, "Renamed concurrently")
+        self.assertEqual(list(self.cell.products.values_list("id", flat=True)), [self.product.id])
+
+    def test_debt_delta_uses_the_locked_debt(self):
+        retail = SalesNetworkCell.objects.create(name="Retail", hierarchy_name="Retail Network", supplier=self.cell)
+        stale = SalesNetworkCell.objects.get(pk=retail.pk)
+        stale.debt = 5
+        errors = []
+
+        def save():
+            try:
+                stale.save()
+            except Exception as exc:  # reported by the main thread
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            locked = SalesNetworkCell.objects.select_for_update().get(pk=retail.pk)
+            thread = threading.Thread(target=save)
+            thread.start()
+            thread.join(timeout=0.5)
+            self.assertTrue(thread.is_alive())
+            locked.debt = 10
+            locked.save()
+        thread.join(timeout=10)
+
+        self.assertEqual(errors, [])
+        self.cell.refresh_from_db()
+        self.assertEqual(self.cell.subtree_debt, 5)
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+
+class KeysetPaginationTests(APITestCase):
+    """Tests for the '?cursor=' keyset pagination mode."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        # Duplicate names exercise the id tiebreaker
+        for i in range(7):
+            Product.objects.create(name=f"Product {i % 3}", model=str(i))
+
+    def walk(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(item["id"] for item in response.data["results"])
+            pages += 1
+            if not response.data["next"]:
+                return ids, pages, response
+            response = self.client.get(response.data["next"])
+
+    def test_cursor_pages_follow_meta_ordering(self):
+        ids, pages, _ = self.walk(reverse("api:product-list"), {"cursor": "", "page_size": 3})
+        expected = list(Product.objects.order_by("name", "id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_previous_link_returns_previous_page(self):
+        url = reverse("api:product-list")
+        first = self.client.get(url, {"cursor": "", "page_size": 3})
+        second = self.client.get(first.data["next"])
+        self.assertIsNone(first.data["previous"])
+        back = self.client.get(second.data["previous"])
+        self.assertEqual(back.data["results"], first.data["results"])
+        self.assertIsNone(back.data["previous"])
+
+    def test_cursor_query_count_does_not_depend_on_depth(self):
+        response = self.client.get(reverse("api:product-list"), {"cursor": "", "page_size": 2})
+        while response.data["next"]:
+            # version stamp, page
+            with self.assertNumQueries(2):
+                response = self.client.get(response.data["next"])
+
+    def test_cells_cursor_with_filter(self):
+        factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        for i in range(4):
+            contact = Contact.objects.create(
+                email=f"c{i}@mail.com", country="USA" if i % 2 else "Canada", city="A", street="B", house_number="1"
+            )
+            SalesNetworkCell.objects.create(
+                name="Retail", hierarchy_name="Retail Network", supplier=factory, contact=contact
+            )
+        ids, _, _ = self.walk(reverse("api:cell-list"), {"cursor": "", "page_size": 1, "contact__country": "USA"})
+        expected = SalesNetworkCell.objects.filter(contact__country="USA").order_by("hierarchy_level", "name", "id")
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("api:contact-list"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor(self):
+        def cursor(position):
+            return b64encode(json.dumps({"p": position}).encode()).decode()
+
+        for name, position in [
+            ("api:cell-list", ["x", "y", "z"]),
+            ("api:product-list", [None, 1]),
+            ("api:product-list", [{"name": "a"}, 1]),
+            ("api:product-list", ["Product 1", 2**70]),
+            ("users:users_list", ["a", "b"]),
+        ]:
+            with self.subTest(name=name, position=position):
+                response = self.client.get(reverse(name), {"cursor": cursor(position)})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(str(response.data["detail"]), "Invalid cursor")
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(reverse("api:product-list"))
+        self.assertEqual(response.data["count"], 7)
+
+
+class BulkCreateTests(APITestCase):
+    """Tests for the bulk create endpoints."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+
+    def test_bulk_create_contacts(self):
+        url = reverse("api:contact-bulk-create")
+        data = [
+            {"email": f"c{i}@mail.com", "country": "USA", "city": "A", "street": "B", "house_number": "1"}
+            for i in range(3)
+        ]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["created"]), 3)
+        self.assertEqual(Contact.objects.count(), 3)
+
+    def test_bulk_create_atomic_mode_creates_nothing_on_error(self):
+        url = reverse("api:product-bulk-create")
+        data = [{"name": "Product A"}, {"model": "No name"}, {"name": "Product C"}]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["errors"][0]["index"], 1)
+        self.assertIn("name", response.data["errors"][0]["errors"])
+        self.assertFalse(Product.objects.exists())
+
+    def test_bulk_create_partial_mode(self):
+        url = reverse("api:product-bulk-create") + "?mode=partial"
+        data = [{"name": "Product A"}, {"model": "No name"}, {"name": "Product C"}]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["created"]), 2)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [1])
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_bulk_create_cells_applies_hierarchy_rules(self):
+        url = reverse("api:cell-bulk-create") + "?mode=partial"
+        data = [
+            {"name": "Entrepreneur", "hierarchy_name": "Individual Entrepreneur", "supplier": self.factory.id},
+            {"name": "Factory 2", "hierarchy_name": "Factory", "supplier": self.factory.id},
+            {"name": "No level"},
+            {"name": "Missing supplier", "hierarchy_name": "Retail Network", "supplier": 9999},
+        ]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [1, 2, 3])
+        created = SalesNetworkCell.objects.get(name="Entrepreneur")
+        self.assertEqual(created.hierarchy_level, 1)
+        self.assertEqual(created.supplier, self.factory)
+
+    def test_bulk_create_cells_query_count(self):
+        url = reverse("api:cell-bulk-create")
+        data = [
+            {"name": f"Retail {i}", "hierarchy_name": "Retail Network", "supplier": self.factory.id} for i in range(50)
+        ]
+        # suppliers, savepoint, insert, supplier rollups, release savepoint
+        with self.assertNumQueries(5):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(len(response.data["created"]), 50)
+
+    def test_bulk_create_requires_list(self):
+        url = reverse("api:contact-bulk-create")
+        response = self.client.post(url, {"email": "c@mail.com"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SupplyChainTests(APITestCase):
+    """Tests for the supply chain chain/tree endpoints."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.retail_a = SalesNetworkCell.objects.create(
+            name="Retail A", hierarchy_name="Retail Network", supplier=self.factory
+        )
+        self.retail_b = SalesNetworkCell.objects.create(
+            name="Retail B", hierarchy_name="Retail Network", supplier=self.factory
+        )
+        self.entrepreneur = SalesNetworkCell.objects.create(
+            name="Entrepreneur", hierarchy_name="Individual Entrepreneur", supplier=self.retail_a
+        )
+
+    def test_tree_flat(self):
+        url = reverse("api:cell-tree", args=[self.factory.id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["name"] for item in response.data], ["Factory", "Retail A", "Retail B", "Entrepreneur"])
+        self.assertEqual([item["depth"] for item in response.data], [0, 1, 1, 2])
+
+    def test_tree_nested_with_depth_limit(self):
+        url = reverse("api:cell-tree", args=[self.factory.id])
+        response = self.client.get(url, {"output": "nested", "depth": 1})
+        self.assertEqual(response.data["name"], "Factory")
+        self.assertEqual([child["name"] for child in response.data["children"]], ["Retail A", "Retail B"])
+        self.assertEqual(response.data["children"][0]["children"], [])
+
+    def test_chain(self):
+        url = reverse("api:cell-chain", args=[self.entrepreneur.id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual([item["name"] for item in response.data], ["Entrepreneur", "Retail A", "Factory"])
+
+        response = self.client.get(url, {"output": "nested"})
+        self.assertEqual(response.data["name"], "Factory")
+        self.assertEqual(response.data["children"][0]["children"][0]["name"], "Entrepreneur")
+
+    def test_cycle_in_suppliers_terminates(self):
+        SalesNetworkCell.objects.filter(id=self.retail_a.id).update(supplier=self.entrepreneur, supplier_level=2)
+        response = self.client.get(reverse("api:cell-tree", args=[self.retail_a.id]))
+        self.assertEqual([item["name"] for item in response.data], ["Retail A", "Entrepreneur"])
+
+    def test_invalid_parameters(self):
+        url = reverse("api:cell-tree", args=[self.factory.id])
+        self.assertEqual(self.client.get(url, {"depth": "x"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"depth": 1000}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"output": "xml"}).status_code, status.HTTP_400_BAD_REQUEST)
+        missing = reverse("api:cell-chain", args=[9999])
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CellPathTests(TestCase):
+    """Tests for the materialized path index of the sales network hierarchy."""
+
+    def setUp(self):
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.retail = SalesNetworkCell.objects.create(
+            name="Retail", hierarchy_name="Retail Network", supplier=self.factory
+        )
+        self.entrepreneur = SalesNetworkCell.objects.create(
+            name="Entrepreneur", hierarchy_name="Individual Entrepreneur", supplier=self.retail
+        )
+
+    def test_paths_on_create(self):
+        self.assertEqual(self.factory.path, "/")
+        self.assertEqual(self.retail.path, f"/{self.factory.id}/")
+        self.assertEqual(self.entrepreneur.path, f"/{self.factory.id}/{self.retail.id}/")
+        self.assertTrue(self.factory.is_ancestor_of(self.entrepreneur))
+        self.assertFalse(self.entrepreneur.is_ancestor_of(self.factory))
+        self.assertEqual(set(self.factory.get_descendants()), {self.retail, self.entrepreneur})
+        self.assertEqual(set(self.entrepreneur.get_ancestors()), {self.factory, self.retail})
+
+    def test_reparent_updates_descendants(self):
+        other = SalesNetworkCell.objects.create(name="Other", hierarchy_name="Factory")
+        retail = SalesNetworkCell.objects.get(id=self.retail.id)
+        retail.supplier = other
+        retail.save()
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(self.entrepreneur.path, f"/{other.id}/{retail.id}/")
+        self.assertFalse(self.factory.get_descendants().exists())
+
+    def test_delete_detaches_descendants(self):
+        self.factory.delete()
+        self.retail.refresh_from_db()
+        self.entrepreneur.refresh_from_db()
+        self.assertIsNone(self.retail.supplier)
+        self.assertEqual(self.retail.path, "/")
+        self.assertEqual(self.entrepreneur.path, f"/{self.retail.id}/")
+
+    def test_delete_of_several_levels(self):
+        child = SalesNetworkCell.objects.create(
+            name="Child", hierarchy_name="Retail Network", supplier=self.entrepreneur
+        )
+        SalesNetworkCell.objects.filter(id__in=[self.factory.id, self.retail.id]).delete()
+        self.entrepreneur.refresh_from_db()
+        child.refresh_from_db()
+        self.assertEqual(self.entrepreneur.path, "/")
+        self.assertEqual(child.path, f"/{self.entrepreneur.id}/")
+
+    def test_deep_chain(self):
+        supplier = self.entrepreneur
+        for i in range(40):
+            supplier = SalesNetworkCell.objects.create(
+                id=10**9 + i,
+                name=f"Cell {i}",
+                hierarchy_name="Retail Network" if i % 2 == 0 else "Individual Entrepreneur",
+                supplier=supplier,
+            )
+        self.assertGreater(len(supplier.path), 255)
+        other = SalesNetworkCell.objects.create(name="Other", hierarchy_name="Factory")
+        retail = SalesNetworkCell.objects.get(id=self.retail.id)
+        retail.supplier = other
+        retail.save()
+        supplier.refresh_from_db()
+        self.assertTrue(supplier.path.startswith(f"/{other.id}/{retail.id}/{self.entrepreneur.id}/"))
+        call_command("rebuild_cell_paths", "--check", stdout=StringIO())
+
+    def test_cycle_is_rejected(self):
+        retail = SalesNetworkCell.objects.get(id=self.retail.id)
+        retail.supplier = self.entrepreneur
+        with self.assertRaises(ValidationError):
+            retail.save()
+
+    def test_rebuild_and_check_command(self):
+        call_command("rebuild_cell_paths", "--check", stdout=StringIO())
+        SalesNetworkCell.objects.filter(id=self.entrepreneur.id).update(path="/")
+        with self.assertRaises(CommandError):
+            call_command("rebuild_cell_paths", "--check", stdout=StringIO())
+        call_command("rebuild_cell_paths", stdout=StringIO())
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(self.entrepreneur.path, f"/{self.factory.id}/{self.retail.id}/")
+        call_command("rebuild_cell_paths", "--check", stdout=StringIO())
+
+
+class HierarchyConstraintTests(TestCase):
+    """The hierarchy rules are enforced by database constraints on the denormalized supplier level."""
+
+    def setUp(self):
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.retail = SalesNetworkCell.objects.create(
+            name="Retail", hierarchy_name="Retail Network", supplier=self.factory
+        )
+
+    def assertRejected(self, write):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            write()
+
+    def test_save_does_not_load_an_unchanged_supplier(self):
+        cell = SalesNetworkCell.objects.get(pk=self.retail.pk)
+        self.assertEqual(cell.supplier_level, 0)
+        with CaptureQueriesContext(connection) as queries:
+            cell.name = "Renamed"
+            cell.save()
+        sql = [query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]]
+        # the locked stored values of the cell, and no supplier
+        self.assertEqual([query.split()[0] for query in sql], ["SELECT", "UPDATE"])
+
+    def test_bulk_paths_cannot_break_the_rules(self):
+        self.assertRejected(
+            lambda: SalesNetworkCell.objects.bulk_create(
+                [SalesNetworkCell(name="Factory 2", hierarchy_name="Factory", hierarchy_level=1)]
+            )
+        )
+        self.assertRejected(
+            lambda: SalesNetworkCell.objects.bulk_create(
+                [
+                    SalesNetworkCell(
+                        name="Shop", hierarchy_name="Retail Network", hierarchy_level=1, supplier=self.factory
+                    )
+                ]
+            )
+        )
+        self.assertRejected(lambda: SalesNetworkCell.objects.filter(pk=self.retail.pk).update(supplier_level=1))
+        self.assertRejected(
+            lambda: SalesNetworkCell.objects.filter(pk=self.retail.pk).update(
+                hierarchy_name="Factory", hierarchy_level=0
+            )
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "composite foreign key is PostgreSQL only")
+    def test_supplier_level_must_match_the_supplier(self):
+        other = SalesNetworkCell.objects.create(name="Other", hierarchy_name="Retail Network", supplier=self.factory)
+        self.assertRejected(lambda: SalesNetworkCell.objects.filter(pk=self.retail.pk).update(supplier=other))
+        # the supplier level follows queryset updates of the supplier
+        SalesNetworkCell.objects.filter(pk=self.factory.pk).update(
+            hierarchy_name="Individual Entrepreneur", hierarchy_level=2
+        )
+        self.retail.refresh_from_db()
+        self.assertEqual(self.retail.supplier_level, 2)
+
+    def test_level_change_is_propagated_to_the_cells_supplied(self):
+        self.factory.hierarchy_name = "Individual Entrepreneur"
+        self.factory.save()
+        self.retail.refresh_from_db()
+        self.assertEqual(self.retail.supplier_level, 2)
+
+        self.factory.hierarchy_name = "Retail Network"
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.factory.save()
+
+    def test_deleting_the_supplier_clears_the_supplier_level(self):
+        self.factory.delete()
+        self.retail.refresh_from_db()
+        self.assertIsNone(self.retail.supplier)
+        self.assertIsNone(self.retail.supplier_level)
+
+
+class SubtreeRollupTests(APITestCase):
+    """Tests for the incrementally maintained subtree debt rollups."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory", debt=100)
+        self.retail = SalesNetworkCell.objects.create(
+            name="Retail", hierarchy_name="Retail Network", supplier=self.factory, debt=10
+        )
+        self.entrepreneur = SalesNetworkCell.objects.create(
+            name="Entrepreneur", hierarchy_name="Individual Entrepreneur", supplier=self.retail, debt=1
+        )
+
+    def assertRollup(self, cell, debt, cells):
+        cell.refresh_from_db()
+        self.assertEqual((cell.subtree_debt, cell.subtree_cells), (Decimal(debt), cells))
+
+    def test_rollups_on_create(self):
+        self.assertRollup(self.factory, 111, 3)
+        self.assertRollup(self.retail, 11, 2)
+        self.assertRollup(self.entrepreneur, 1, 1)
+
+    def test_debt_change(self):
+        entrepreneur = SalesNetworkCell.objects.get(id=self.entrepreneur.id)
+        entrepreneur.debt = Decimal("5.50")
+        entrepreneur.save()
+        self.assertRollup(self.factory, "115.50", 3)
+        self.assertRollup(self.retail, "15.50", 2)
+
+    def test_stale_instance_does_not_overwrite_rollups(self):
+        self.factory.name = "Renamed"
+        self.factory.save()
+        self.assertRollup(self.factory, 111, 3)
+
+    def test_stale_debt_is_not_used_for_the_delta(self):
+        stale = SalesNetworkCell.objects.get(id=self.entrepreneur.id)
+        entrepreneur = SalesNetworkCell.objects.get(id=self.entrepreneur.id)
+        entrepreneur.debt = 10
+        entrepreneur.save()
+        stale.debt = 5
+        stale.save()
+        self.assertRollup(self.factory, 115, 3)
+        self.assertRollup(self.retail, 15, 2)
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+    def test_stale_supplier_is_not_used_for_the_move(self):
+        other = SalesNetworkCell.objects.create(name="Other", hierarchy_name="Retail Network", supplier=self.factory)
+        stale = SalesNetworkCell.objects.get(id=self.entrepreneur.id)
+        entrepreneur = SalesNetworkCell.objects.get(id=self.entrepreneur.id)
+        entrepreneur.supplier = other
+        entrepreneur.save()
+        stale.supplier = self.retail
+        stale.save()
+        self.assertRollup(self.retail, 11, 2)
+        self.assertRollup(other, 0, 1)
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+    def test_reparent(self):
+        other = SalesNetworkCell.objects.create(name="Other", hierarchy_name="Factory", debt=1000)
+        retail = SalesNetworkCell.objects.get(id=self.retail.id)
+        retail.supplier = other
+        retail.save()
+        self.assertRollup(self.factory, 100, 1)
+        self.assertRollup(other, 1011, 3)
+
+    def test_delete_detaches_subtree(self):
+        SalesNetworkCell.objects.get(id=self.retail.id).delete()
+        self.assertRollup(self.factory, 100, 1)
+        self.assertRollup(self.entrepreneur, 1, 1)
+
+    def test_clear_debt(self):
+        SalesNetworkCell.objects.filter(id__in=[self.retail.id, self.entrepreneur.id]).clear_debt()
+        self.assertRollup(self.factory, 100, 3)
+        self.assertRollup(self.retail, 0, 2)
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+    def test_bulk_create_updates_rollups(self):
+        url = reverse("api:cell-bulk-create")
+        data = [{"name": "New", "hierarchy_name": "Individual Entrepreneur", "supplier": self.retail.id, "debt": 5}]
+        self.client.post(url, data, format="json")
+        self.assertRollup(self.factory, 116, 4)
+        self.assertRollup(self.retail, 16, 3)
+
+    def test_rebuild_command(self):
+        SalesNetworkCell.objects.update(subtree_debt=0, subtree_cells=1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+        call_command("rebuild_cell_rollups", stdout=StringIO())
+        self.assertRollup(self.factory, 111, 3)
+
+    def test_filter_and_order_by_subtree_debt(self):
+        url = reverse("api:cell-list")
+        response = self.client.get(url, {"ordering": "-subtree_debt"})
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Factory", "Retail", "Entrepreneur"])
+        self.assertEqual(response.data["results"][0]["subtree_cells"], 3)
+        response = self.client.get(url, {"subtree_debt__gte": 10})
+        self.assertEqual(response.data["count"], 2)
+        response = self.client.get(url, {"ordering": "-subtree_debt", "cursor": "", "page_size": 2})
+        response = self.client.get(response.data["next"])
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Entrepreneur"])
+
+
+class ResponseCacheTests(APITestCase):
+    """Tests for the read endpoint response cache and its signal based invalidation."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.contact = Contact.objects.create(
+            email="doe@mail.com", country="USA", city="New York", street="123 Main St", house_number="1A"
+        )
+        self.product = Product.objects.create(name="Product A", model="X")
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory", contact=self.contact)
+        self.factory.products.add(self.product)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_second_read_is_served_from_cache(self):
+        url = reverse("api:cell-detail", args=[self.factory.id])
+        self.assertEqual(self.get(url)["X-Cache"], "MISS")
+        # Only the version stamp of the cell is read
+        with self.assertNumQueries(1):
+            response = self.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["name"], "Factory")
+        self.assertEqual(self.get(url, page_size=2)["X-Cache"], "MISS")
+
+        stats = self.client.get(reverse("api:cache-stats")).data
+        self.assertEqual(stats, {"hits": 1, "misses": 2})
+
+    def test_cell_update_invalidates_detail_list_and_ancestors(self):
+        retail = SalesNetworkCell.objects.create(name="Retail", hierarchy_name="Retail Network", supplier=self.factory)
+        factory_url = reverse("api:cell-detail", args=[self.factory.id])
+        list_url = reverse("api:cell-list")
+        self.get(factory_url)
+        self.get(list_url)
+        retail = SalesNetworkCell.objects.get(id=retail.id)
+        retail.debt = 10
+        retail.save()
+        response = self.get(factory_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["subtree_debt"], "10.00")
+        self.assertEqual(self.get(list_url)["X-Cache"], "MISS")
+
+    def test_supplier_deletion_invalidates_descendants(self):
+        retail = SalesNetworkCell.objects.create(name="Retail", hierarchy_name="Retail Network", supplier=self.factory)
+        shop = SalesNetworkCell.objects.create(name="Shop", hierarchy_name="Individual Entrepreneur", supplier=retail)
+        urls = [reverse("api:cell-detail", args=[cell.id]) for cell in (retail, shop)]
+        for url in urls:
+            self.get(url)
+        self.factory.delete()
+        response = self.get(urls[0])
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIsNone(response.data["supplier"])
+        self.assertEqual(self.get(urls[1])["X-Cache"], "MISS")
+
+    def test_other_cells_stay_cached(self):
+        other = SalesNetworkCell.objects.create(name="Other", hierarchy_name="Factory")
+        url = reverse("api:cell-detail", args=[other.id])
+        self.get(url)
+        self.factory.name = "Renamed"
+        self.factory.save()
+        self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+    def test_contact_and_product_changes_invalidate_cells(self):
+        url = reverse("api:cell-detail", args=[self.factory.id])
+        self.get(url)
+        self.contact.city = "Boston"
+        self.contact.save()
+        self.assertEqual(self.get(url).data["contact"]["city"], "Boston")
+        self.product.name = "Renamed"
+        self.product.save()
+        self.assertEqual(self.get(url).data["products"][0]["name"], "Renamed")
+        self.product.delete()
+        self.assertEqual(self.get(url).data["products"], [])
+
+    def test_m2m_change_invalidates_cell(self):
+        url = reverse("api:cell-detail", args=[self.factory.id])
+        self.get(url)
+        product = Product.objects.create(name="Product B")
+        product.salesnetworkcell_set.add(self.factory)
+        self.assertEqual(len(self.get(url).data["products"]), 2)
+        self.factory.products.clear()
+        self.assertEqual(self.get(url).data["products"], [])
+
+    def test_bulk_create_invalidates_list(self):
+        url = reverse("api:product-list")
+        self.assertEqual(self.get(url).data["count"], 1)
+        self.client.post(reverse("api:product-bulk-create"), [{"name": "Product B"}], format="json")
+        self.assertEqual(self.get(url).data["count"], 2)
+
+    def test_permissions_are_checked_before_the_cache(self):
+        url = reverse("api:product-detail", args=[self.product.id])
+        self.get(url)
+        user = User.objects.create(email="user@mail.com", password="password")
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConditionalGetTests(APITestCase):
+    """Tests for ETag and Last-Modified handling on the read endpoints."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.product = Product.objects.create(name="Product A", model="X")
+        self.cell = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.cell.products.add(self.product)
+
+    def test_detail_not_modified(self):
+        url = reverse("api:cell-detail", args=[self.cell.id])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_embedded_product_change_changes_cell_etag(self):
+        url = reverse("api:cell-detail", args=[self.cell.id])
+        etag = self.client.get(url)["ETag"]
+        self.product.name = "Renamed"
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_supplier_deletion_changes_children_etag(self):
+        retail = SalesNetworkCell.objects.create(name="Retail", hierarchy_name="Retail Network", supplier=self.cell)
+        url = reverse("api:cell-detail", args=[retail.id])
+        etag = self.client.get(url)["ETag"]
+        self.cell.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data["supplier"])
+
+    def test_if_modified_since(self):
+        url = reverse("api:product-detail", args=[self.product.id])
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE="Mon, 01 Jan 2001 00:00:00 GMT")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_etag_changes_on_create_and_delete(self):
+        url = reverse("api:product-list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        product = Product.objects.create(name="Product B")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response["ETag"]
+        product.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+
+    def test_missing_object(self):
+        url = reverse("api:contact-detail", args=[9999])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExportTests(APITestCase):
+    """Tests for the streaming export endpoints and command."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.products = [Product.objects.create(name=f"Product {i}", model="X") for i in range(2)]
+        for i, country in enumerate(["USA", "Canada", "USA"]):
+            contact = Contact.objects.create(
+                email=f"c{i}@mail.com", country=country, city="A", street="B", house_number="1"
+            )
+            cell = SalesNetworkCell.objects.create(name=f"Factory {i}", hierarchy_name="Factory", contact=contact)
+            cell.products.set(self.products)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_cells_csv_export_with_filter(self):
+        response = self.client.get(reverse("api:cell-export"), {"contact__country": "USA"}, HTTP_ACCEPT="text/csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(self.read(response))))
+        self.assertEqual([row["name"] for row in rows], ["Factory 0", "Factory 2"])
+        self.assertEqual(rows[0]["contact_country"], "USA")
+        self.assertEqual(rows[0]["products_name"], "Product 0;Product 1")
+
+    def test_cells_ndjson_export_query_count(self):
+        # cells with contact and supplier, products of the chunk
+        with self.assertNumQueries(2):
+            content = self.read(self.client.get(reverse("api:cell-export"), {"output": "ndjson"}))
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[1]["contact"]["country"], "Canada")
+        self.assertEqual([product["name"] for product in records[1]["products"]], ["Product 0", "Product 1"])
+
+    def test_products_and_contacts_export(self):
+        content = self.read(self.client.get(reverse("api:product-export")))
+        self.assertEqual(content.splitlines()[0], "id,name,model,release_date")
+        self.assertEqual(len(content.splitlines()), 3)
+        content = self.read(self.client.get(reverse("api:contact-export"), {"country": "Canada"}))
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_invalid_output(self):
+        response = self.client.get(reverse("api:product-export"), {"output": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command("export_network", "cells", "--output", "ndjson", "--country", "USA", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ImportTests(TestCase):
+    """Tests for the import_network command."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        Product.objects.create(name="Phone", model="X1")
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def run_import(self, *args, **kwargs):
+        out, err = StringIO(), StringIO()
+        call_command("import_network", *args, stdout=out, stderr=err, **kwargs)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_cells_resolves_forward_supplier_references(self):
+        path = self.write(
+            "cells.csv",
+            "name,hierarchy_name,debt,supplier_name,contact_email,contact_country,contact_city,contact_street,"
+            "contact_house_number,products_name,products_model\n"
+            "Shop,Individual Entrepreneur,5.00,Network,,,,,,,\n"
+            "Network,Retail Network,10.00,Factory,net@mail.com,USA,NY,Main,1,Phone,X1\n"
+            "Factory,Factory,1.00,,,,,,,,\n"
+            "Broken,Unknown,0,,,,,,,,\n",
+        )
+        out, err = self.run_import("cells", path, batch_size=2)
+        self.assertIn("3 cells (0 already existing, 1 invalid)", out)
+        self.assertIn("Line 5", err)
+
+        factory = SalesNetworkCell.objects.get(name="Factory")
+        network = SalesNetworkCell.objects.get(name="Network")
+        shop = SalesNetworkCell.objects.get(name="Shop")
+        self.assertEqual(shop.path, f"/{factory.pk}/{network.pk}/")
+        self.assertEqual(factory.subtree_debt, Decimal("16.00"))
+        self.assertEqual(factory.subtree_cells, 3)
+        self.assertEqual(network.contact.email, "net@mail.com")
+        self.assertEqual([product.model for product in network.products.all()], ["X1"])
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+        # importing the file again skips the existing cells
+        out, err = self.run_import("cells", path)
+        self.assertIn("0 cells (3 already existing, 1 invalid)", out)
+        self.assertEqual(SalesNetworkCell.objects.count(), 3)
+
+    def test_import_round_trips_an_export(self):
+        factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory", debt=2)
+        SalesNetworkCell.objects.create(name="Shop", hierarchy_name="Individual Entrepreneur", supplier=factory)
+        path = os.path.join(self.directory.name, "cells.ndjson")
+        call_command("export_network", "cells", "--output", "ndjson", "--file", path, stdout=StringIO())
+        SalesNetworkCell.objects.all().delete()
+
+        self.run_import("cells", path)
+        shop = SalesNetworkCell.objects.get(name="Shop")
+        self.assertEqual(shop.supplier.name, "Factory")
+        self.assertEqual(shop.hierarchy_level, 1)
+
+    def test_dry_run_validates_without_writing(self):
+        path = self.write(
+            "products.ndjson",
+            '{"name": "Laptop", "model": "L1"}\nnot json\n{"name": "Tablet", "release_date": "2024-13-01"}\n',
+        )
+        with self.assertRaises(CommandError):
+            self.run_import("products", path, dry_run=True)
+        self.assertEqual(Product.objects.count(), 1)
+
+        path = self.write(
+            "cells.ndjson", '{"name": "Shop", "hierarchy_name": "Retail Network", "supplier_name": "?"}\n'
+        )
+        with self.assertRaises(CommandError):
+            self.run_import("cells", path, dry_run=True)
+        self.assertFalse(SalesNetworkCell.objects.exists())
+
+    def test_dry_run_resolves_suppliers_of_the_file(self):
+        path = self.write(
+            "cells.ndjson",
+            '{"name": "F1", "hierarchy_name": "Factory"}\n'
+            '{"name": "R1", "hierarchy_name": "Retail Network", "supplier_name": "F1"}\n',
+        )
+        out, err = self.run_import("cells", path, dry_run=True)
+        self.assertIn("would import 2 cells", out)
+        self.assertEqual(err, "")
+        self.assertFalse(SalesNetworkCell.objects.exists())
+
+    def test_resume_from_checkpoint(self):
+        path = self.write(
+            "contacts.ndjson",
+            "".join(
+                json.dumps(
+                    {"email": f"c{i}@mail.com", "country": "USA", "city": "A", "street": "B", "house_number": "1"}
+                )
+                + "\n"
+                for i in range(4)
+            ),
+        )
+        checkpoint = f"{path}.checkpoint"
+        with open(checkpoint, "w", encoding="utf-8") as file:
+            json.dump({"phase": "rows", "line": 2, "created": 2, "skipped": 0, "failed": []}, file)
+
+        out, err = self.run_import("contacts", path)
+        self.assertIn("Resuming rows after line 2", out)
+        self.assertIn("4 contacts", out)
+        self.assertEqual(sorted(Contact.objects.values_list("email", flat=True)), ["c2@mail.com", "c3@mail.com"])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_supplier_cycle_is_broken(self):
+        path = self.write(
+            "cells.ndjson",
+            '{"name": "A", "hierarchy_name": "Retail Network", "supplier_name": "B"}\n'
+            '{"name": "B", "hierarchy_name": "Individual Entrepreneur", "supplier_name": "A"}\n',
+        )
+        out, err = self.run_import("cells", path)
+        self.assertIn("to break a cycle", err)
+        call_command("rebuild_cell_paths", "--check", stdout=StringIO())
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+
+class SearchTests(APITestCase):
+    """Search on the list views, the search endpoint and the admin, with the full-text and trigram
+    indexes on PostgreSQL and the 'icontains' fallback elsewhere."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.user)
+        self.iphone = Product.objects.create(name="iPhone", model="15 Pro")
+        self.case = Product.objects.create(name="Leather case", model="iPhone 15")
+        self.galaxy = Product.objects.create(name="Samsung Galaxy", model="S24")
+        self.berlin = Contact.objects.create(
+            email="berlin@mail.com", country="Germany", city="Berlin", street="Friedrichstrasse", house_number="1"
+        )
+        self.paris = Contact.objects.create(
+            email="paris@mail.com", country="France", city="Paris", street="Rue de Rivoli", house_number="2"
+        )
+        self.factory = SalesNetworkCell.objects.create(name="Berlin Factory", hierarchy_name="Factory", debt=10)
+        self.retail = SalesNetworkCell.objects.create(
+            name="Berlin Retail", hierarchy_name="Retail Network", supplier=self.factory, contact=self.berlin, debt=5
+        )
+        SalesNetworkCell.objects.create(name="Paris Factory", hierarchy_name="Factory", contact=self.paris)
+
+    def names(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item.get("name", item.get("email")) for item in response.data["results"]]
+
+    def test_product_search_is_ranked(self):
+        names = self.names(reverse("api:product-list"), {"search": "iphone"})
+        self.assertEqual(names, ["iPhone", "Leather case"])
+        self.assertEqual(self.names(reverse("api:product-list"), {"search": "galaxy s24"}), ["Samsung Galaxy"])
+        self.assertEqual(len(self.names(reverse("api:product-list"), {"search": "  "})), 3)
+
+    def test_product_search_matches_prefixes(self):
+        self.assertEqual(self.names(reverse("api:product-list"), {"search": "samsu"}), ["Samsung Galaxy"])
+
+    @skipUnless(connection.vendor == "postgresql", "fuzzy search is PostgreSQL only")
+    def test_product_search_tolerates_typos(self):
+        self.assertEqual(self.names(reverse("api:product-list"), {"search": "samsng"}), ["Samsung Galaxy"])
+
+    def test_contact_search_on_address(self):
+        url = reverse("api:contact-list")
+        self.assertEqual(self.names(url, {"search": "berlin friedrichstrasse"}), ["berlin@mail.com"])
+        self.assertEqual(self.names(url, {"search": "rivoli", "country": "Germany"}), [])
+
+    def test_cell_search_with_filters_and_ordering(self):
+        url = reverse("api:cell-list")
+        self.assertEqual(set(self.names(url, {"search": "berlin"})), {"Berlin Factory", "Berlin Retail"})
+        self.assertEqual(
+            self.names(url, {"search": "berlin", "ordering": "subtree_debt"}), ["Berlin Retail", "Berlin Factory"]
+        )
+        self.assertEqual(self.names(url, {"search": "berlin", "contact__country": "Germany"}), ["Berlin Retail"])
+
+    def test_search_with_keyset_pagination(self):
+        url = reverse("api:product-list")
+        response = self.client.get(url, {"search": "iphone", "cursor": "", "page_size": 1})
+        self.assertEqual([item["name"] for item in response.data["results"]], ["iPhone"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Leather case"])
+        self.assertIsNone(response.data["next"])
+
+    def test_search_endpoint(self):
+        url = reverse("api:search")
+        response = self.client.get(url, {"q": "berlin"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["products"], [])
+        self.assertEqual([item["email"] for item in response.data["contacts"]], ["berlin@mail.com"])
+        self.assertEqual({item["name"] for item in response.data["cells"]}, {"Berlin Factory", "Berlin Retail"})
+
+        response = self.client.get(url, {"q": "iphone", "types": "products", "limit": 1})
+        self.assertEqual(list(response.data), ["products"])
+        self.assertEqual([item["name"] for item in response.data["products"]], ["iPhone"])
+
+    def test_search_endpoint_validation(self):
+        url = reverse("api:search")
+        for params in ({}, {"q": " "}, {"q": "a", "types": "users"}, {"q": "a", "limit": "x"}, {"q": "a", "limit": 0}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_admin_search(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("admin:api_product_changelist"), {"q": "samsu"})
+        self.assertContains(response, "Samsung Galaxy")
+        self.assertNotContains(response, "Leather case")
+        response = self.client.get(reverse("admin:api_contact_changelist"), {"q": "paris"})
+        self.assertContains(response, "paris@mail.com")
+        self.assertNotContains(response, "berlin@mail.com")
+
+    @skipUnless(connection.vendor == "postgresql", "GIN indexes are PostgreSQL only")
+    def test_search_uses_indexes(self):
+        queryset = search(Product.objects.all(), "iphone")
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        self.assertIn("product_search_idx", plan)
+        self.assertIn("product_name_trgm_idx", plan)
+        self.assertIn("product_model_trgm_idx", plan)
+
+
+class AsyncReadViewTests(TestCase):
+    """The async read views return the same responses as the DRF views, without blocking calls in the event loop."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(email="employee@mail.com", is_employee=True, is_staff=True)
+        self.token = f"Bearer {UserTokenObtainPairSerializer.get_token(self.user).access_token}"
+        self.products = [Product.objects.create(name=f"Product {i}", model="X") for i in range(3)]
+        contact = Contact.objects.create(
+            email="doe@mail.com", country="USA", city="New York", street="Main St", house_number="1"
+        )
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory", debt=10)
+        self.retail = SalesNetworkCell.objects.create(
+            name="Retail", hierarchy_name="Retail Network", supplier=self.factory, contact=contact, debt=5
+        )
+        self.retail.products.set(self.products)
+
+    async def compare(self, view_class, path, params=None, token=None, **kwargs):
+        """Return the async response after checking it has the content, status and headers of the sync one."""
+        headers = {"Authorization": token or self.token}
+        expected = await self.async_client.get(path, params, headers=headers)
+        if getattr(view_class, "cache_name", None):
+            await sync_to_async(bump_tags)([f"{view_class.cache_name}:all"])
+        request = AsyncRequestFactory().get(path, params, headers=headers)
+        response = await AsyncReadView.as_view(view_class=view_class)(request, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        for header in ("Content-Type", "ETag", "Last-Modified", "X-Cache", "WWW-Authenticate"):
+            self.assertEqual(response.get(header), expected.get(header), header)
+        return response
+
+    async def test_lists(self):
+        await self.compare(views.ProductListView, reverse("api:product-list"))
+        await self.compare(views.ProductListView, reverse("api:product-list"), {"page": 2, "page_size": 2})
+        await self.compare(views.ProductListView, reverse("api:product-list"), {"cursor": "", "page_size": 2})
+        await self.compare(views.ContactListView, reverse("api:contact-list"), {"country": "USA"})
+        await self.compare(views.SalesNetworkCellListView, reverse("api:cell-list"))
+        await self.compare(views.SalesNetworkCellListView, reverse("api:cell-list"), {"ordering": "-subtree_debt"})
+        await self.compare(views.SalesNetworkCellListView, reverse("api:cell-list"), {"search": "retail"})
+        await self.compare(UsersListAPIView, reverse("users:users_list"))
+
+    async def test_details(self):
+        pk = self.retail.pk
+        response = await self.compare(views.SalesNetworkCellDetailView, reverse("api:cell-detail", args=[pk]), pk=pk)
+        self.assertEqual(len(json.loads(response.content)["products"]), 3)
+        pk = self.products[0].pk
+        await self.compare(views.ProductDetailView, reverse("api:product-detail", args=[pk]), pk=pk)
+
+    async def test_errors(self):
+        await self.compare(views.ProductDetailView, reverse("api:product-detail", args=[0]), pk=0)
+        await self.compare(views.ProductListView, reverse("api:product-list"), {"page": 9})
+        response = await self.compare(views.ProductListView, reverse("api:product-list"), token="Bearer invalid")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        visitor = await User.objects.acreate(email="visitor@mail.com")
+        token = f"Bearer {UserTokenObtainPairSerializer.get_token(visitor).access_token}"
+        response = await self.compare(views.ProductListView, reverse("api:product-list"), token=token)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_blocking_calls_run_in_threads(self):
+        threads = []
+
+        def record(function):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return function(*args, **kwargs)
+
+            return wrapper
+
+        pk, loop_thread, responses = self.products[0].pk, threading.get_ident(), []
+        with (
+            mock.patch("api.cache.get_cache", record(get_cache)),
+            mock.patch.object(ClaimsJWTAuthentication, "get_user", record(ClaimsJWTAuthentication.get_user)),
+        ):
+            for view_class, path, kwargs in (
+                (views.SalesNetworkCellListView, reverse("api:cell-list"), {}),
+                (views.ProductDetailView, reverse("api:product-detail", args=[pk]), {"pk": pk}),
+            ):
+                request = AsyncRequestFactory().get(path, headers={"Authorization": self.token})
+                view = AsyncReadView.as_view(view_class=view_class)
+                responses += [await view(request, **kwargs), await view(request, **kwargs)]
+        self.assertEqual([response["X-Cache"] for response in responses], ["MISS", "HIT", "MISS", "HIT"])
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    async def test_not_modified(self):
+        path = reverse("api:cell-list")
+        request = AsyncRequestFactory().get(path, headers={"Authorization": self.token})
+        view = AsyncReadView.as_view(view_class=views.SalesNetworkCellListView)
+        etag = (await view(request))["ETag"]
+        request = AsyncRequestFactory().get(path, headers={"Authorization": self.token, "If-None-Match": etag})
+        response = await view(request)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+
+class BenchmarkServingTests(TransactionTestCase):
+    """The requests of the benchmark run in other threads, which must see the committed data."""
+
+    databases = {"default", *settings.DATABASE_REPLICAS}
+
+    def test_benchmark_command(self):
+        User.objects.create(email="employee@mail.com", is_employee=True, is_staff=True)
+        Product.objects.create(name="Product", model="X")
+        for server in ("wsgi", "asgi"):
+            out = StringIO()
+            call_command("benchmark_serving", server=server, requests=14, concurrency=2, json=True, stdout=out)
+            [result] = json.loads(out.getvalue())
+            self.assertEqual(result["server"], server)
+            self.assertEqual(result["requests"], 14)
+            self.assertEqual(result["errors"], 0)
+
+    def test_connections_benchmark_command(self):
+        User.objects.create(email="employee@mail.com", is_employee=True, is_staff=True)
+        out = StringIO()
+        call_command("benchmark_connections", mode="per_request", requests=8, concurrency=2, json=True, stdout=out)
+        [result] = json.loads(out.getvalue())
+        self.assertEqual(result["mode"], "per_request")
+        self.assertEqual(result["requests"], 8)
+        self.assertEqual(result["errors"], 0)
+
+
+class SeedNetworkTests(TestCase):
+    def seed(self, **options):
+        options = {"factories": 2, "retail_networks": 3, "entrepreneurs": 2, "products": 30, **options}
+        call_command("seed_network", products_per_cell=4, workers=1, batch_size=4, stdout=StringIO(), **options)
+
+    def test_seed_network(self):
+        self.seed()
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Contact.objects.count(), 2 + 6 + 12)
+        levels = SalesNetworkCell.objects.values_list("hierarchy_level", flat=True)
+        self.assertEqual(sorted(levels), [0] * 2 + [1] * 6 + [2] * 12)
+        for cell in SalesNetworkCell.objects.prefetch_related("products"):
+            self.assertEqual(len(cell.products.all()), 4)
+        call_command("rebuild_cell_paths", "--check", stdout=StringIO())
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+    def test_benchmark_routes_command(self):
+        self.seed(products=5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "routes.json")
+            call_command("benchmark_routes", requests=2, fast_hasher=True, output=path, stdout=StringIO())
+            with open(path) as file:
+                results = json.load(file)
+            out = StringIO()
+            call_command("benchmark_routes", requests=1, routes=["api:cell-list"], compare=path, stdout=out)
+
+        self.assertEqual(set(results["routes"]), set(get_route_names()))
+        for name, result in results["routes"].items():
+            self.assertEqual(result["requests"], 2)
+            self.assertEqual(result["errors"], 0, name)
+        self.assertGreater(results["routes"]["api:cell-detail"]["queries"], 0)
+        self.assertIn("p50 ", out.getvalue().split("(")[1])
+        # the requests were rolled back
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertFalse(User.objects.exists())
+
+    def test_benchmark_routes_needs_a_scenario_per_route(self):
+        self.seed(products=5)
+        with mock.patch.dict(SCENARIOS), self.assertRaisesMessage(CommandError, "api:search"):
+            del SCENARIOS["api:search"]
+            call_command("benchmark_routes", requests=1, stdout=StringIO())
+
+
+class ValuesSerializerTests(APITestCase):
+    """The cell list and detail views serialize values() rows like SalesNetworkCellSerializer."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        products = [
+            Product.objects.create(name=name, model=f"M{i}", release_date="2024-02-29" if i else None)
+            for i, name in enumerate(["Zeta", "Alpha", "Gamma", "Beta"])
+        ]
+        for i in range(6):
+            contact = None
+            if i % 2:
+                contact = Contact.objects.create(
+                    email=f"cell{i}@mail.com", country="USA", city="Boston", street="Main St", house_number=str(i)
+                )
+            cell = SalesNetworkCell.objects.create(
+                name=f"Retail {i}",
+                hierarchy_name="Retail Network",
+                supplier=factory,
+                contact=contact,
+                debt=Decimal("1234.5") * i,
+            )
+            cell.products.set(products[: i % 5])
+
+    def assertSameData(self, queryset):
+        # compared as JSON, the order of the keys included
+        render = JSONRenderer().render
+        expected = SalesNetworkCellSerializer(queryset.with_related(), many=True).data
+        rows = SalesNetworkCellReadSerializer.values(queryset)
+        self.assertEqual(render(SalesNetworkCellReadSerializer(rows, many=True).data), render(expected))
+        for row, data in zip(rows, expected):
+            self.assertEqual(render(SalesNetworkCellReadSerializer(row).data), render(data))
+
+    def test_same_data_as_model_serializer(self):
+        queryset = SalesNetworkCell.objects.order_by("id")
+        self.assertSameData(queryset)
+        with timezone.override("America/New_York"):
+            self.assertSameData(queryset)
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "COERCE_DECIMAL_TO_STRING": False}):
+            self.assertSameData(queryset)
+
+    def test_related_objects_are_fetched_in_chunks(self):
+        queryset = SalesNetworkCellReadSerializer.values(SalesNetworkCell.objects.order_by("id"))
+        with mock.patch.object(queryset._iterable_class, "related_chunk_size", 2), self.assertNumQueries(1 + 4):
+            rows = list(queryset)
+        self.assertEqual([len(row["products"]) for row in rows], [0, 0, 1, 2, 3, 4, 0])
+
+    def test_list_and_detail(self):
+        cell = SalesNetworkCell.objects.get(name="Retail 3")
+        response = self.client.get(reverse("api:cell-list"), {"page_size": 20, "ordering": "-subtree_debt"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = SalesNetworkCellSerializer(
+            SalesNetworkCell.objects.with_related().order_by("-subtree_debt"), many=True
+        )
+        self.assertEqual(JSONRenderer().render(response.data["results"]), JSONRenderer().render(expected.data))
+
+        response = self.client.get(reverse("api:cell-detail", args=[cell.id]))
+        self.assertEqual(response.data, SalesNetworkCellSerializer(cell).data)
+        self.assertEqual([product["name"] for product in response.data["products"]], ["Alpha", "Gamma", "Zeta"])
+        response = self.client.get(reverse("api:cell-detail", args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_pagination(self):
+        url, ids = reverse("api:cell-list"), []
+        response = self.client.get(url, {"cursor": "", "page_size": 2, "ordering": "subtree_debt"})
+        while True:
+            ids.extend(item["id"] for item in response.data["results"])
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(
+            ids, list(SalesNetworkCell.objects.order_by("subtree_debt", "id").values_list("id", flat=True))
+        )
+
+    def test_benchmark_serialization_command(self):
+        out = StringIO()
+        call_command("benchmark_serialization", rows=5, repeat=1, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(results["model"]["rows"], 5)
+        self.assertEqual(results["values"]["rows"], 5)
+        self.assertGreater(results["total_speedup"], 0)
+
+        with mock.patch("api.management.commands.benchmark_serialization.canonical", side_effect=[[1], [2]]):
+            with self.assertRaisesMessage(CommandError, "not serialized like the model instances"):
+                call_command("benchmark_serialization", rows=5, repeat=1, stdout=StringIO())
+
+
+class AdminChangelistTests(TestCase):
+    """The sales network cell changelist renders with a bounded number of queries."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.client.force_login(self.admin_user)
+        self.url = reverse("admin:api_salesnetworkcell_changelist")
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory")
+        self.products = [Product.objects.create(name=f"Product {i}") for i in range(3)]
+
+    def create_cells(self, start, count):
+        for i in range(start, start + count):
+            contact = Contact.objects.create(
+                email=f"cell{i}@mail.com", country="USA", city=f"City {i}", street="Main St", house_number="1"
+            )
+            cell = SalesNetworkCell.objects.create(
+                name=f"Retail {i}", hierarchy_name="Retail Network", supplier=self.factory, contact=contact
+            )
+            cell.products.set(self.products)
+
+    def get(self, *args):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, *args)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query["sql"] for query in queries]
+
+    def test_query_count_does_not_depend_on_rows(self):
+        self.create_cells(0, 2)
+        self.get()
+        response, few = self.get()
+        self.create_cells(2, 20)
+        self.get()
+        response, many = self.get()
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, "Product 0, Product 1, Product 2")
+        self.assertContains(response, "City 21")
+
+    def test_city_choices_are_cached_until_contacts_change(self):
+        self.create_cells(0, 2)
+        distinct = [sql for sql in self.get()[1] if "DISTINCT" in sql]
+        self.assertEqual(len(distinct), 1)
+        self.assertFalse([sql for sql in self.get()[1] if "DISTINCT" in sql])
+
+        Contact.objects.create(email="new@mail.com", country="USA", city="New City", street="B", house_number="1")
+        response, queries = self.get()
+        self.assertTrue([sql for sql in queries if "DISTINCT" in sql])
+        self.assertContains(response, "New City")
+
+    def test_hierarchy_level_filter(self):
+        self.create_cells(0, 2)
+        response, queries = self.get({"hierarchy_level": "0"})
+        self.assertContains(response, "Factory")
+        self.assertNotContains(response, "Retail 0")
+
+    @skipUnless(connection.vendor == "postgresql", "row estimates are PostgreSQL only")
+    def test_estimated_count_paginator(self):
+        self.create_cells(0, 20)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE api_salesnetworkcell")
+        paginator = EstimatedCountPaginator(SalesNetworkCell.objects.order_by("id"), 10)
+        paginator.exact_count_limit = 0
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(paginator.count, 21)
+        self.assertTrue(queries.captured_queries[0]["sql"].startswith("EXPLAIN"))
+        self.assertEqual(paginator.num_pages, 3)
+
+
+class BulkOperationTests(TestCase):
+    """Tests for the bulk admin actions run in chunks by the background worker."""
+
+    def setUp(self):
+        self.admin_user = User.objects.create(
+            email="admin@mail.com", password="adminpassword", is_staff=True, is_superuser=True, is_employee=True
+        )
+        self.factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory", debt=1)
+        self.cells = [
+            SalesNetworkCell.objects.create(
+                name=f"Retail {i}", hierarchy_name="Retail Network", supplier=self.factory, debt=10
+            )
+            for i in range(5)
+        ]
+
+    def enqueue(self, **kwargs):
+        with self.captureOnCommitCallbacks() as callbacks:
+            operation = tasks.enqueue("clear_debt", {"params": {"hierarchy_level": ["1"]}}, self.admin_user, **kwargs)
+        self.assertEqual(len(callbacks), 1)
+        return operation
+
+    def test_admin_action_runs_in_the_background(self):
+        self.client.force_login(self.admin_user)
+        url = reverse("admin:api_salesnetworkcell_changelist")
+        data = {"action": "clear_debt", "select_across": "1", "index": "0", "_selected_action": [self.factory.pk]}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url, data, follow=True)
+        self.assertContains(response, "Debt is being cleared in the background")
+        self.assertTrue(callbacks)
+        operation = BulkOperation.objects.get()
+        self.assertEqual(operation.status, "pending")
+        self.assertEqual(SalesNetworkCell.objects.get(pk=self.factory.pk).debt, 1)
+
+        self.assertTrue(tasks.run(operation.pk))
+        operation.refresh_from_db()
+        self.assertEqual(
+            (operation.status, operation.processed, operation.total, operation.progress), ("done", 6, 6, 100)
+        )
+        self.assertFalse(SalesNetworkCell.objects.exclude(debt=0).exists())
+        call_command("rebuild_cell_rollups", "--check", stdout=StringIO())
+
+        response = self.client.get(reverse("admin:api_bulkoperation_changelist"))
+        self.assertContains(response, "100%")
+
+    def test_interrupted_operation_resumes_after_the_last_processed_cell(self):
+        operation = self.enqueue(chunk_size=2)
+        # a worker processed the first chunk, then the process stopped
+        BulkOperation.objects.filter(pk=operation.pk).update(
+            status="running", heartbeat_at=timezone.now() - timedelta(hours=1), last_id=self.cells[1].pk, processed=2
+        )
+        call_command("run_bulk_operations", stdout=StringIO())
+
+        operation.refresh_from_db()
+        self.assertEqual((operation.status, operation.processed), ("done", 5))
+        debts = dict(SalesNetworkCell.objects.values_list("name", "debt"))
+        self.assertEqual(debts["Retail 0"], 10)
+        self.assertEqual(debts["Retail 2"], 0)
+        self.assertEqual(SalesNetworkCell.objects.get(pk=self.factory.pk).subtree_debt, Decimal("21"))
+
+    def test_admin_action_stores_the_changelist_filters(self):
+        self.client.force_login(self.admin_user)
+        url = f"{reverse('admin:api_salesnetworkcell_changelist')}?hierarchy_level=1"
+        data = {"action": "clear_debt", "select_across": "1", "index": "0", "_selected_action": [self.cells[0].pk]}
+        with self.captureOnCommitCallbacks():
+            self.client.post(url, data)
+        operation = BulkOperation.objects.get()
+        self.assertEqual(operation.selection, {"params": {"hierarchy_level": ["1"]}})
+        self.assertEqual(operation.max_id, self.cells[-1].pk)
+        # cells added afterwards are not part of the selection
+        SalesNetworkCell.objects.create(
+            name="Retail 5", hierarchy_name="Retail Network", supplier=self.factory, debt=10
+        )
+        self.assertTrue(tasks.run(operation.pk))
+        operation.refresh_from_db()
+        self.assertEqual((operation.processed, operation.total), (5, 5))
+        debts = dict(SalesNetworkCell.objects.values_list("name", "debt"))
+        self.assertEqual((debts["Factory"], debts["Retail 0"], debts["Retail 4"], debts["Retail 5"]), (1, 0, 0, 10))
+
+    def test_admin_action_stores_the_selected_ids(self):
+        self.client.force_login(self.admin_user)
+        url = f"{reverse('admin:api_salesnetworkcell_changelist')}?hierarchy_level=1"
+        selected = [self.cells[1].pk, self.cells[3].pk]
+        data = {"action": "clear_debt", "select_across": "0", "index": "0", "_selected_action": selected}
+        with self.captureOnCommitCallbacks():
+            self.client.post(url, data)
+        operation = BulkOperation.objects.get()
+        self.assertEqual(sorted(operation.selection["ids"]), selected)
+        self.assertTrue(tasks.run(operation.pk))
+        cleared = SalesNetworkCell.objects.filter(debt=0).values_list("id", flat=True)
+        self.assertEqual(sorted(cleared), selected)
+
+    def test_operation_of_a_deleted_user_fails(self):
+        operation = self.enqueue()
+        self.admin_user.delete()
+        with self.assertRaises(ValueError):
+            tasks.run(operation.pk)
+        operation.refresh_from_db()
+        self.assertEqual(operation.status, "failed")
+        self.assertFalse(SalesNetworkCell.objects.filter(debt=0).exists())
+
+    def test_running_operation_is_not_claimed_twice(self):
+        operation = self.enqueue()
+        BulkOperation.objects.filter(pk=operation.pk).update(status="running", heartbeat_at=timezone.now())
+        self.assertFalse(tasks.run(operation.pk))
+        self.assertEqual(tasks.run_pending(), 0)
+
+    def test_failed_operation_can_be_resumed(self):
+        operation = self.enqueue(chunk_size=2)
+        calls = []
+
+        def fail_on_second_chunk(queryset):
+            calls.append(queryset)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return queryset.clear_debt()
+
+        with mock.patch.dict(tasks.ACTIONS, {"clear_debt": fail_on_second_chunk}):
+            with self.assertRaises(RuntimeError):
+                tasks.run(operation.pk)
+        operation.refresh_from_db()
+        self.assertEqual((operation.status, operation.processed), ("failed", 2))
+        self.assertIn("connection lost", operation.error)
+
+        self.assertEqual(tasks.resume(operation.pk), 1)
+        self.assertTrue(tasks.run(operation.pk))
+        operation.refresh_from_db()
+        self.assertEqual((operation.status, operation.processed), ("done", 5))
+        self.assertFalse(SalesNetworkCell.objects.filter(hierarchy_level=1).exclude(debt=0).exists())
+
+
+class BulkOperationWorkerTests(TransactionTestCase):
+    """The operation runs in the thread pool once the transaction enqueuing it commits."""
+
+    def test_operation_runs_in_a_worker_thread(self):
+        user = User.objects.create(email="admin@mail.com", is_staff=True, is_superuser=True, is_employee=True)
+        factory = SalesNetworkCell.objects.create(name="Factory", hierarchy_name="Factory", debt=5)
+        with transaction.atomic():
+            operation = tasks.enqueue("clear_debt", {"params": {}}, user)
+        tasks.executor.submit(lambda: None).result(timeout=10)
+
+        operation.refresh_from_db()
+        self.assertEqual(operation.status, "done")
+        factory.refresh_from_db()
+        self.assertEqual(factory.debt, 0)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1", "replica_2"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Databases chosen by ReplicaRouter for the reads of a request, no query is sent to the replicas."""
+
+    def setUp(self):
+        cache.clear()
+        employee = User.objects.create(email="employee@mail.com", is_employee=True)
+        admin = User.objects.create(email="admin@mail.com", is_employee=True, is_staff=True)
+        self.employee, self.admin = (
+            ClaimsUser(UserTokenObtainPairSerializer.get_token(user).access_token) for user in (employee, admin)
+        )
+        self.cookies = SimpleCookie()
+
+    def route(self, method, path, user=None, headers=None, status_code=200):
+        """Return the database of a read made by the view of the request, authenticated as the user.
+        The cookies set by the responses are sent with the next requests, like a client would."""
+        request = getattr(RequestFactory(), method)(path, headers=headers)
+        request.COOKIES = {key: morsel.value for key, morsel in self.cookies.items()}
+        request.resolver_match = resolve(path)
+        databases = []
+
+        def view(request):
+            if user is not None:
+                request.user = user  # as set by DRF once authenticated
+            databases.append(ReplicaRouter().db_for_read(Product))
+            return HttpResponse(status=status_code)
+
+        self.cookies.update(ReplicaRoutingMiddleware(view)(request).cookies)
+        return databases[0]
+
+    def test_safe_api_requests_read_from_replicas(self):
+        self.assertIn(self.route("get", reverse("api:product-list"), self.employee), ["replica_1", "replica_2"])
+        self.assertIn(self.route("head", reverse("api:cell-list"), self.employee), ["replica_1", "replica_2"])
+        self.assertIn(self.route("get", reverse("api:product-list")), ["replica_1", "replica_2"])
+
+    def test_writes_and_other_views_use_the_primary(self):
+        self.assertEqual(self.route("post", reverse("api:product-create"), self.employee, status_code=201), "default")
+        self.assertEqual(self.route("get", reverse("admin:index")), "default")
+        self.assertIsNone(ReplicaRouter().db_for_read(Product))
+
+        def read_in_transaction(request):
+            with transaction.atomic():
+                return HttpResponse(ReplicaRouter().db_for_read(Product))
+
+        request = RequestFactory().get(reverse("api:product-list"))
+        request.resolver_match = resolve(reverse("api:product-list"))
+        self.assertNotIn(ReplicaRoutingMiddleware(read_in_transaction)(request).content, [b"replica_1", b"replica_2"])
+
+    def test_sticky_primary_after_write(self):
+        self.route("post", reverse("api:product-create"), self.employee, status_code=400)
+        self.assertNotEqual(self.route("get", reverse("api:product-list"), self.employee), "default")
+
+        self.route("post", reverse("api:product-create"), self.employee, status_code=201)
+        self.assertEqual(self.cookies[STICKY_COOKIE]["max-age"], 5)
+        self.assertEqual(self.route("get", reverse("api:product-list"), self.employee), "default")
+        # the cookie is only valid for the user who wrote
+        self.assertNotEqual(self.route("get", reverse("api:product-list"), self.admin), "default")
+
+        # nor once the write has replicated, even if the client kept it
+        with mock.patch("django.core.signing.time.time", return_value=time.time() + 6):
+            self.assertNotEqual(self.route("get", reverse("api:product-list"), self.employee), "default")
+
+        # nor when forged
+        self.cookies[STICKY_COOKIE] = str(self.employee.id)
+        self.assertNotEqual(self.route("get", reverse("api:product-list"), self.employee), "default")
+
+    def test_staff_can_read_from_the_primary(self):
+        headers = {PRIMARY_HEADER: "primary"}
+        self.assertEqual(self.route("get", reverse("api:product-list"), self.admin, headers), "default")
+        self.assertNotEqual(self.route("get", reverse("api:product-list"), self.employee, headers), "default")
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(ReplicaRouter().allow_migrate("default", "api"))
+        self.assertFalse(ReplicaRouter().allow_migrate("replica_1", "api"))
+
+    @override_settings(DATABASE_REPLICA_LAG=0.05)
+    def test_cache_invalidated_again_after_replication(self):
+        with transaction.atomic():
+            invalidate(["product:all"])
+        version = get_tag_versions(["product:all"])
+        self.assertEqual(get_tag_versions(["product:all"]), version)
+        time.sleep(0.2)
+        self.assertNotEqual(get_tag_versions(["product:all"]), version)
+
+    @override_settings(DATABASE_REPLICA_LAG=0.05)
+    def test_delayed_bumps_share_one_thread(self):
+        threads = threading.active_count()
+        bumping_threads = []
+
+        def record_thread(tags):
+            bumping_threads.append(threading.current_thread())
+            bump_tags(tags)
+
+        with mock.patch("api.cache.bump_tags", side_effect=record_thread):
+            for _ in range(20):
+                with transaction.atomic():
+                    invalidate(["product:all", "contact:all"])
+            self.assertLessEqual(threading.active_count(), threads + 1)
+            time.sleep(0.2)
+        delayed = [thread for thread in bumping_threads if thread is not threading.current_thread()]
+        # the 20 delayed bumps, some of them together when due at the same time
+        self.assertTrue(delayed)
+        self.assertEqual(set(delayed), {delayed_bumps.thread})
+        self.assertEqual(len(bumping_threads) - len(delayed), 40)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "No replica configured (DB_REPLICA_HOSTS)")
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Queries of API requests on a replica alias, e.g. DB_REPLICA_HOSTS=localhost mirroring the test database."""
+
+    databases = {"default", *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(email="employee@mail.com", is_employee=True)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {UserTokenObtainPairSerializer.get_token(user).access_token}"
+        )
+
+    def request(self, method, path, **kwargs):
+        """Return the response and the number of queries sent to the primary and to the replicas."""
+        with ExitStack() as stack:
+            primary = stack.enter_context(CaptureQueriesContext(connections["default"]))
+            replicas = [
+                stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in settings.DATABASE_REPLICAS
+            ]
+            response = getattr(self.client, method)(path, **kwargs)
+        return response, len(primary), sum(len(queries) for queries in replicas)
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        response, primary, replicas = self.request("get", reverse("api:product-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replicas, 0)
+
+        data = {"name": "Product", "model": "X", "release_date": "2025-01-01"}
+        response, primary, replicas = self.request("post", reverse("api:product-create"), data=data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replicas, 0)
+
+        response, primary, replicas = self.request("get", reverse("api:product-list"))
+        self.assertEqual(response.data["count"], 1)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replicas, 0)
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="employee@mail.com", is_employee=True, is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        Product.objects.create(name="Product", model="X")
+        patcher = mock.patch("api.metrics.registry", metrics.MetricsRegistry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scrape(self, **headers):
+        response = self.client.get("/metrics", **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_requests_are_labelled_by_url_name(self):
+        cache.clear()
+        self.client.get(reverse("api:product-list"))
+        self.client.get(reverse("api:product-list"))
+        self.client.get("/missing/")
+        text = self.scrape()
+        route = 'route="api:product-list"'
+        self.assertIn(f'http_request_duration_seconds_count{{{route},method="GET",status="200"}} 2', text)
+        self.assertIn('http_request_duration_seconds_count{route="unmatched",method="GET",status="404"} 1', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{route},method="GET",status="200",le="+Inf"}} 2', text)
+        self.assertNotIn("/missing/", text)
+
+        queries = self.registry.histograms[("http_request_db_queries", (("route", "api:product-list"),))]
+        self.assertEqual(sum(queries[:-1]), 2)
+        self.assertGreater(queries[-1], 0)
+        # the second response comes from the cache, without serialization
+        self.assertIn(f"http_request_serializer_seconds_count{{{route}}} 1", text)
+        self.assertIn(f"http_response_size_bytes_count{{{route}}} 2", text)
+
+    async def test_async_requests_record_their_queries(self):
+        path = reverse("api:product-list")
+        token = await sync_to_async(UserTokenObtainPairSerializer.get_token)(self.user)
+        request = AsyncRequestFactory().get(path, headers={"Authorization": f"Bearer {token.access_token}"})
+        request.resolver_match = resolve(path)
+        view = AsyncReadView.as_view(view_class=views.ProductListView)
+        response = await metrics.MetricsMiddleware(view)(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        queries = self.registry.histograms[("http_request_db_queries", (("route", "api:product-list"),))]
+        self.assertGreater(queries[-1], 0)
+        db_seconds = self.registry.histograms[("http_request_db_seconds", (("route", "api:product-list"),))]
+        self.assertGreater(db_seconds[-1], 0)
+
+    def test_metrics_of_all_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [metrics.MetricsRegistry(directory, name=name) for name in ("1", "2")]
+            for worker in workers:
+                worker.observe("http_request_db_queries", (("route", "api:cell-list"),), 3)
+            workers[1].flush()
+            histograms = workers[0].collect()
+        values = histograms[("http_request_db_queries", (("route", "api:cell-list"),))]
+        self.assertEqual(values[metrics.QUERY_BUCKETS.index(5)], 2)
+        self.assertEqual(values[-1], 6)
+
+    def test_token(self):
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_403_FORBIDDEN)
+            self.assertIn(
+                "# TYPE http_request_duration_seconds histogram", self.scrape(HTTP_AUTHORIZATION="Bearer secret")
+            )
@@ -3,23 +3,34 @@ from django.urls import path
 from api.apps import ApiConfig
 
 from . import views
+from .async_views import read_view
 
 app_name = ApiConfig.name
 
 urlpatterns = [
-    path("cells/", views.SalesNetworkCellListView.as_view(), name="cell-list"),
-    path("cell/<int:pk>/", views.SalesNetworkCellDetailView.as_view(), name="cell-detail"),
+    path("cells/", read_view(views.SalesNetworkCellListView), name="cell-list"),
+    path("cells/export/", views.SalesNetworkCellExportView.as_view(), name="cell-export"),
+    path("cell/<int:pk>/", read_view(views.SalesNetworkCellDetailView), name="cell-detail"),
+    path("cell/<int:pk>/chain/", views.SalesNetworkCellChainView.as_view(), name="cell-chain"),
+    path("cell/<int:pk>/tree/", views.SalesNetworkCellTreeView.as_view(), name="cell-tree"),
     path("cell/create/", views.SalesNetworkCellCreateView.as_view(), name="cell-create"),
+    path("cell/bulk-create/", views.SalesNetworkCellBulkCreateView.as_view(), name="cell-bulk-create"),
     path("cell/<int:pk>/update/", views.SalesNetworkCellUpdateView.as_view(), name="cell-update"),
     path("cell/<int:pk>/delete", views.SalesNetworkCellDestroyView.as_view(), name="cell-destroy"),
-    path("contacts/", views.ContactListView.as_view(), name="contact-list"),
-    path("contact/<int:pk>/", views.ContactDetailView.as_view(), name="contact-detail"),
+    path("contacts/", read_view(views.ContactListView), name="contact-list"),
+    path("contacts/export/", views.ContactExportView.as_view(), name="contact-export"),
+    path("contact/<int:pk>/", read_view(views.ContactDetailView), name="contact-detail"),
     path("contact/create/", views.ContactCreateView.as_view(), name="contact-create"),
+    path("contact/bulk-create/", views.ContactBulkCreateView.as_view(), name="contact-bulk-create"),
     path("contact/<int:pk>/update/", views.ContactUpdateView.as_view(), name="contact-update"),
     path("contact/<int:pk>/delete", views.ContactDeleteView.as_view(), name="contact-destroy"),
-    path("products/", views.ProductListView.as_view(), name="product-list"),
-    path("product/<int:pk>/", views.ProductDetailView.as_view(), name="product-detail"),
+    path("search/", views.SearchView.as_view(), name="search"),
+    path("cache/stats/", views.CacheStatsView.as_view(), name="cache-stats"),
+    path("products/", read_view(views.ProductListView), name="product-list"),
+    path("products/export/", views.ProductExportView.as_view(), name="product-export"),
+    path("product/<int:pk>/", read_view(views.ProductDetailView), name="product-detail"),
     path("product/create/", views.ProductCreateView.as_view(), name="product-create"),
+    path("product/bulk-create/", views.ProductBulkCreateView.as_view(), name="product-bulk-create"),
     path("product/<int:pk>/update/", views.ProductUpdateView.as_view(), name="product-update"),
     path("product/<int:pk>/delete", views.ProductDeleteView.as_view(), name="product-destroy"),
 ]
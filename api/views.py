@@ -1,19 +1,127 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics
-from rest_framework.exceptions import ValidationError
+from rest_framework import generics, status, views
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+
+from users.permissions import IsAdmin
 
+from .async_views import AsyncListMixin, AsyncRetrieveMixin
+from .cache import CachedResponseMixin, ConditionalGetMixin, get_stats, invalidate
+from .exports import OUTPUTS, RESOURCES, iter_lines
 from .models import Contact, Product, SalesNetworkCell
 from .paginators import CustomPagination
-from .serializers import ContactSerializer, ProductSerializer, SalesNetworkCellSerializer
+from .search import SearchFilterBackend, search
+from .serializers import (
+    ContactSerializer,
+    ProductSerializer,
+    SalesNetworkCellReadSerializer,
+    SalesNetworkCellSerializer,
+    SalesNetworkCellTreeSerializer,
+)
+
+
+class ValuesReadMixin:
+    """Serve a read view from the values() rows of the queryset with 'read_serializer_class', a ValuesSerializer.
+    'serializer_class' still documents the responses in the schema."""
+
+    read_serializer_class = None
+
+    def get_queryset(self):
+        return self.read_serializer_class.values(super().get_queryset())
+
+    def get_serializer_class(self):
+        if getattr(self, "swagger_fake_view", False):
+            return super().get_serializer_class()
+        return self.read_serializer_class
+
+
+class BulkCreateView(generics.GenericAPIView):
+    """Base view to create many objects from a JSON array with a single bulk_create.
+    All items are validated in one pass and inserted in one transaction.
+    By default nothing is created if any item is invalid ('?mode=atomic'),
+    with '?mode=partial' the valid items are created and the invalid ones reported."""
+
+    max_batch_size = 1000
+    insert_batch_size = 500
+    modes = ("atomic", "partial")
+    cache_tags = ()
+
+    def build_instance(self, validated_data):
+        """Build an unsaved model instance from validated data.
+        Subclasses apply the rules normally enforced by Model.save() here."""
+        return self.get_serializer_class().Meta.model(**validated_data)
+
+    def perform_bulk_create(self, instances):
+        """Insert the instances, called inside the transaction."""
+        return self.get_serializer_class().Meta.model.objects.bulk_create(instances, batch_size=self.insert_batch_size)
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({"non_field_errors": "Expected a list of items."})
+        if len(items) > self.max_batch_size:
+            raise ValidationError({"non_field_errors": f"At most {self.max_batch_size} items can be created at once."})
+        mode = request.query_params.get("mode", "atomic")
+        if mode not in self.modes:
+            raise ValidationError({"mode": f"Expected one of: {', '.join(self.modes)}."})
+
+        serializer = self.get_serializer(many=True)
+        instances, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                instances.append(self.build_instance(serializer.child.run_validation(item)))
+            except ValidationError as exc:
+                errors.append({"index": index, "errors": exc.detail})
+            except DjangoValidationError as exc:
+                errors.append({"index": index, "errors": {"non_field_errors": exc.messages}})
+
+        if errors and (mode == "atomic" or not instances):
+            return Response({"created": [], "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            created = self.perform_bulk_create(instances)
+            invalidate(self.cache_tags)
+        return Response({"created": [obj.pk for obj in created], "errors": errors}, status=status.HTTP_201_CREATED)
+
+
+class ExportView(generics.GenericAPIView):
+    """Base view streaming a whole table as CSV or NDJSON ('?output=csv|ndjson').
+    Rows are read with a server-side cursor in chunks, so memory stays flat regardless of table size."""
+
+    resource = None
+
+    def get_queryset(self):
+        return RESOURCES[self.resource]["queryset"]()
+
+    def perform_content_negotiation(self, request, force=False):
+        # Clients asking for text/csv must not get 406, the response bypasses the renderers
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "csv")
+        if output not in OUTPUTS:
+            raise ValidationError({"output": f"Expected one of: {', '.join(OUTPUTS)}."})
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(iter_lines(self.resource, output, queryset), content_type=OUTPUTS[output])
+        response["Content-Disposition"] = f'attachment; filename="{self.resource}.{output}"'
+        return response
 
 
-class ContactListView(generics.ListAPIView):
+class ContactListView(ConditionalGetMixin, CachedResponseMixin, AsyncListMixin, generics.ListAPIView):
     """View to list contacts.
-    Allows filtering by country."""
+    Allows filtering by country and searching the address ('?search=')."""
 
+    cache_name = "contact"
     serializer_class = ContactSerializer
     pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, SearchFilterBackend]
     filterset_fields = ["country"]
 
     def get_queryset(self):
@@ -26,9 +134,25 @@ class ContactCreateView(generics.CreateAPIView):
     serializer_class = ContactSerializer
 
 
-class ContactDetailView(generics.RetrieveAPIView):
+class ContactExportView(ExportView):
+    """View to export all contacts.
+    Allows filtering by country."""
+
+    resource = "contacts"
+    filterset_fields = ["country"]
+
+
+class ContactBulkCreateView(BulkCreateView):
+    """View to create many contacts at once."""
+
+    serializer_class = ContactSerializer
+    cache_tags = ("contact:list",)
+
+
+class ContactDetailView(ConditionalGetMixin, CachedResponseMixin, AsyncRetrieveMixin, generics.RetrieveAPIView):
     """View to retrieve a specific contact."""
 
+    cache_name = "contact"
     serializer_class = ContactSerializer
 
     def get_queryset(self):
@@ -49,11 +173,14 @@ class ContactDeleteView(generics.DestroyAPIView):
     queryset = Contact.objects.all()
 
 
-class ProductListView(generics.ListAPIView):
-    """View to list products."""
+class ProductListView(ConditionalGetMixin, CachedResponseMixin, AsyncListMixin, generics.ListAPIView):
+    """View to list products.
+    Allows searching by name and model ('?search=')."""
 
+    cache_name = "product"
     serializer_class = ProductSerializer
     pagination_class = CustomPagination
+    filter_backends = [SearchFilterBackend]
 
     def get_queryset(self):
         return Product.objects.all()
@@ -65,9 +192,23 @@ class ProductCreateView(generics.CreateAPIView):
     serializer_class = ProductSerializer
 
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductExportView(ExportView):
+    """View to export all products."""
+
+    resource = "products"
+
+
+class ProductBulkCreateView(BulkCreateView):
+    """View to create many products at once."""
+
+    serializer_class = ProductSerializer
+    cache_tags = ("product:list",)
+
+
+class ProductDetailView(ConditionalGetMixin, CachedResponseMixin, AsyncRetrieveMixin, generics.RetrieveAPIView):
     """View to retrieve a specific product."""
 
+    cache_name = "product"
     serializer_class = ProductSerializer
 
     def get_queryset(self):
@@ -88,17 +229,25 @@ class ProductDeleteView(generics.DestroyAPIView):
     queryset = Product.objects.all()
 
 
-class SalesNetworkCellListView(generics.ListAPIView):
+class SalesNetworkCellListView(
+    ValuesReadMixin, ConditionalGetMixin, CachedResponseMixin, AsyncListMixin, generics.ListAPIView
+):
     """View to list sales network cells.
-    Allows filtering by contact's country."""
+    Allows filtering by contact's country and by subtree debt and cell count ranges,
+    searching by name ('?search=') and ordering by subtree debt and cell count."""
 
+    cache_name = "cell"
+    queryset = SalesNetworkCell.objects.all()
     serializer_class = SalesNetworkCellSerializer
+    read_serializer_class = SalesNetworkCellReadSerializer
     pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = ["contact__country"]
-
-    def get_queryset(self):
-        return SalesNetworkCell.objects.all()
+    filter_backends = [DjangoFilterBackend, SearchFilterBackend, OrderingFilter]
+    filterset_fields = {
+        "contact__country": ["exact"],
+        "subtree_debt": ["gte", "lte"],
+        "subtree_cells": ["gte", "lte"],
+    }
+    ordering_fields = ["subtree_debt", "subtree_cells"]
 
 
 class SalesNetworkCellCreateView(generics.CreateAPIView):
@@ -107,13 +256,132 @@ class SalesNetworkCellCreateView(generics.CreateAPIView):
     serializer_class = SalesNetworkCellSerializer
 
 
-class SalesNetworkCellDetailView(generics.RetrieveAPIView):
-    """View to retrieve  a specific sales network cell."""
+class SalesNetworkCellExportView(ExportView):
+    """View to export all sales network cells with their contact and products.
+    Allows filtering by contact's country."""
+
+    resource = "cells"
+    filterset_fields = ["contact__country"]
+
+
+class SalesNetworkCellBulkCreateView(BulkCreateView):
+    """View to create many sales network cells at once.
+    Suppliers must already exist, they are loaded with one query for the whole batch."""
 
     serializer_class = SalesNetworkCellSerializer
+    # Supplier rollups change as well
+    cache_tags = ("cell:all",)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        supplier_ids = set()
+        if isinstance(self.request.data, list):
+            for item in self.request.data:
+                try:
+                    supplier_ids.add(int(item["supplier"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        context["prefetched"] = {"supplier": SalesNetworkCell.objects.in_bulk(supplier_ids)}
+        return context
+
+    def build_instance(self, validated_data):
+        instance = super().build_instance(validated_data)
+        if instance.hierarchy_name not in SalesNetworkCell.LEVEL_NAMES:
+            raise ValidationError({"hierarchy_name": ["This field is required."]})
+        instance.apply_hierarchy_rules()
+        instance.update_path()
+        instance.reset_rollups()
+        return instance
+
+    def perform_bulk_create(self, instances):
+        created = super().perform_bulk_create(instances)
+        totals = defaultdict(lambda: [Decimal(0), 0])
+        for cell in created:
+            for pk in cell.path_ids(cell.path):
+                totals[pk][0] += cell.subtree_debt
+                totals[pk][1] += 1
+        SalesNetworkCell.objects.add_to_rollups(totals)
+        return created
+
+
+class SalesNetworkCellDetailView(
+    ValuesReadMixin, ConditionalGetMixin, CachedResponseMixin, AsyncRetrieveMixin, generics.RetrieveAPIView
+):
+    """View to retrieve  a specific sales network cell."""
 
-    def get_queryset(self):
-        return SalesNetworkCell.objects.all()
+    cache_name = "cell"
+    queryset = SalesNetworkCell.objects.all()
+    serializer_class = SalesNetworkCellSerializer
+    read_serializer_class = SalesNetworkCellReadSerializer
+
+
+class SalesNetworkCellHierarchyMixin:
+    """Return part of the supply chain of a cell with one recursive query.
+    '?depth=' limits how many levels are walked and '?output=nested' returns
+    nested 'children' instead of a flat list ordered by depth.
+    Views define 'get_cells(pk, depth)', returning the cells walked from the cell 'pk' ordered by depth,
+    and 'nest(data)', returning the nested representation of the serialized cells."""
+
+    serializer_class = SalesNetworkCellTreeSerializer
+    max_depth = 50
+    outputs = ("flat", "nested")
+
+    def get_depth(self):
+        try:
+            depth = int(self.request.query_params.get("depth", self.max_depth))
+        except ValueError:
+            raise ValidationError({"depth": "A valid integer is required."})
+        if not 0 <= depth <= self.max_depth:
+            raise ValidationError({"depth": f"Ensure this value is between 0 and {self.max_depth}."})
+        return depth
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "flat")
+        if output not in self.outputs:
+            raise ValidationError({"output": f"Expected one of: {', '.join(self.outputs)}."})
+
+        cells, seen = [], set()
+        for cell in self.get_cells(kwargs["pk"], self.get_depth()):
+            # Supplier links may form a cycle, which repeats cells until the depth limit
+            if cell.pk not in seen:
+                seen.add(cell.pk)
+                cells.append(cell)
+        if not cells:
+            raise NotFound()
+
+        data = self.get_serializer(cells, many=True).data
+        return Response(self.nest(data) if output == "nested" else data)
+
+
+class SalesNetworkCellChainView(SalesNetworkCellHierarchyMixin, generics.GenericAPIView):
+    """View to retrieve the upstream supplier chain of a cell, starting with the cell itself.
+    The nested output starts from the top supplier."""
+
+    def get_cells(self, pk, depth):
+        return SalesNetworkCell.objects.ancestors_of(pk, depth)
+
+    def nest(self, data):
+        child = None
+        for item in data:
+            item["children"] = [child] if child else []
+            child = item
+        return child
+
+
+class SalesNetworkCellTreeView(SalesNetworkCellHierarchyMixin, generics.GenericAPIView):
+    """View to retrieve the downstream subtree of a cell, e.g. everything supplied by a factory."""
+
+    def get_cells(self, pk, depth):
+        return SalesNetworkCell.objects.descendants_of(pk, depth)
+
+    def nest(self, data):
+        by_id = {}
+        for item in data:
+            item["children"] = []
+            by_id[item["id"]] = item
+        for item in data[1:]:
+            by_id[item["supplier"]]["children"].append(item)
+        return data[0]
 
 
 class SalesNetworkCellDestroyView(generics.DestroyAPIView):
@@ -129,36 +397,119 @@ class SalesNetworkCellUpdateView(generics.UpdateAPIView):
     serializer_class = SalesNetworkCellSerializer
 
     def get_queryset(self):
-        return SalesNetworkCell.objects.all()
+        return SalesNetworkCell.objects.with_related()
+
+    def get_locked_object(self):
+        """Fetch the cell with its contact and supplier, locking its row until the transaction ends.
+        Products are not prefetched: they are loaded after the write for the response."""
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).select_for_update(of=("self",))
+        obj = generics.get_object_or_404(queryset, pk=self.kwargs["pk"])
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    @staticmethod
+    def validate_contact(instance, contact_id):
+        """Return the contact to link, checked with one query (with the cell it may already belong to)."""
+        try:
+            contact = Contact.objects.select_related("salesnetworkcell").filter(id=contact_id).first()
+        except (TypeError, ValueError):
+            contact = None
+        if contact is None:
+            raise ValidationError({"contact": "Invalid contact ID."})
+        owner = getattr(contact, "salesnetworkcell", None)
+        if owner is not None and owner.pk != instance.pk:
+            raise ValidationError({"contact": "This contact already belongs to another cell."})
+        return contact
+
+    @staticmethod
+    def validate_products(product_ids):
+        """Return the product ids to add, checked with one query."""
+        if not isinstance(product_ids, (list, tuple)):
+            product_ids = [product_ids]
+        ids, invalid_ids = [], []
+        for value in product_ids:
+            try:
+                ids.append(int(value))
+            except (TypeError, ValueError):
+                invalid_ids.append(value)
+        existing_ids = set(Product.objects.filter(id__in=ids).values_list("id", flat=True))
+        invalid_ids += [pk for pk in ids if pk not in existing_ids]
+        if invalid_ids:
+            raise ValidationError({"products": f"Invalid product IDs: {', '.join(map(str, invalid_ids))}"})
+        return ids
 
     def update(self, request, *args, **kwargs):
-        """Override the update method to prevent updating the 'debt' field via put or patch request.
-        The 'debt' field can only be updated in the admin panel.
-        Allowing updates to 'contact' and 'products' fields."""
+        """Update the cell in one transaction: one locked fetch, one validation query per relation and one write.
+        New products are linked with a single insert into the through table.
+        The 'debt' field can only be updated in the admin panel."""
         if "debt" in request.data:
             raise ValidationError({"debt": "This field can be updated only in admin panel."})
-        instance = self.get_object()
-
-        # Handle contact update
+        partial = kwargs.pop("partial", False)
         contact_id = request.data.get("contact")
-        if contact_id:
-            try:
-                contact_instance = Contact.objects.get(id=contact_id)
-                instance.contact = contact_instance
-            except Contact.DoesNotExist:
-                raise ValidationError({"contact": "Invalid contact ID."})
-
-        # Handle products update
-        product_ids = request.data.get("products")
-        if product_ids:
-            existing_product_ids = set(Product.objects.filter(id__in=product_ids).values_list("id", flat=True))
-            invalid_ids = set(product_ids) - existing_product_ids
-            if invalid_ids:
-                raise ValidationError({"products": f"Invalid product IDs: {', '.join(map(str, invalid_ids))}"})
-            product_instances = Product.objects.filter(id__in=product_ids)
-            instance.products.add(*product_instances)
-
-        # Save the updated instance
-        instance.save()
-
-        return super().update(request, *args, **kwargs)
+        product_ids = (
+            request.data.getlist("products") if hasattr(request.data, "getlist") else request.data.get("products")
+        )
+
+        with transaction.atomic():
+            instance = self.get_locked_object()
+            contact = self.validate_contact(instance, contact_id) if contact_id else None
+            product_ids = self.validate_products(product_ids) if product_ids else []
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            if contact is not None:
+                serializer.validated_data["contact"] = contact
+            serializer.save()
+            if product_ids:
+                # save() already bumped updated_at and invalidated the cell, so m2m_changed is not needed
+                Through = SalesNetworkCell.products.through
+                Through.objects.bulk_create(
+                    [Through(salesnetworkcell_id=instance.pk, product_id=pk) for pk in product_ids],
+                    ignore_conflicts=True,
+                )
+        return Response(serializer.data)
+
+
+class SearchView(views.APIView):
+    """View to search products, contacts and sales network cells at once ('?q=').
+    Returns the most relevant results of each type, '?types=' restricts the types
+    (comma separated) and '?limit=' the number of results per type."""
+
+    default_limit = 10
+    max_limit = 50
+    targets = {
+        "products": (lambda: Product.objects.all(), ProductSerializer),
+        "contacts": (lambda: Contact.objects.all(), ContactSerializer),
+        "cells": (lambda: SalesNetworkCell.objects.with_related(), SalesNetworkCellSerializer),
+    }
+
+    def get(self, request, *args, **kwargs):
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "This parameter is required."})
+        types = request.query_params.get("types")
+        types = types.split(",") if types else list(self.targets)
+        unknown = set(types) - set(self.targets)
+        if unknown:
+            raise ValidationError({"types": f"Expected some of: {', '.join(self.targets)}."})
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+        if limit <= 0:
+            raise ValidationError({"limit": "Must be a positive integer."})
+
+        results = {}
+        for name in types:
+            get_queryset, serializer_class = self.targets[name]
+            objects = search(get_queryset(), text)[:limit]
+            results[name] = serializer_class(objects, many=True, context={"request": request}).data
+        return Response(results)
+
+
+class CacheStatsView(views.APIView):
+    """View to retrieve the response cache hit and miss counters. Only accessible by admin users."""
+
+    permission_classes = (IsAdmin,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_stats())
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ.setdefault("ASYNC_READ_VIEWS", "True")
+# Requests run their queries in threads that do not outlive them, a persistent connection would never be reused
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
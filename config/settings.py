@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "api",
     "users",
     "corsheaders",
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -48,6 +50,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "api.routers.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -81,9 +84,64 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        # Persistent connections: kept by each thread for DB_CONN_MAX_AGE seconds instead of opened for every
+        # request, and checked before being reused. Disabled by config/asgi.py, see DB_POOL_MAX_SIZE instead.
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True",
+        "OPTIONS": {
+            "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", 5)),
+            # Milliseconds, 0 for no limit
+            "options": f"-c statement_timeout={int(os.getenv('DB_STATEMENT_TIMEOUT', 0))}",
+        },
     }
 }
 
+# Connection pool shared by the threads of a process, needs psycopg 3 (pip install "psycopg[pool]").
+# Broken connections are discarded when returned to the pool.
+if os.getenv("DB_POOL_MAX_SIZE"):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE")),
+        # Seconds to wait for a free connection, and before closing idle connections above min_size
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 600)),
+    }
+
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica-1,replica-2:5433 with the name and credentials of the primary.
+# The safe-method API requests read from them (api.routers), see the README.
+for number, replica in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica_{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+
+# Upper bound of the replication lag in seconds: the reads of a user go to the primary for that long after their
+# writes (signed cookie set by api.routers.ReplicaRoutingMiddleware), and the cached responses of the changed rows
+# are invalidated again after it
+DATABASE_REPLICA_LAG = float(os.getenv("DB_REPLICA_LAG", 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend in production, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+API_CACHE_ALIAS = "default"
+API_CACHE_TIMEOUT = int(os.getenv("API_CACHE_TIMEOUT", 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,7 +165,7 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated", "users.permissions.IsActiveEmployee"],
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
-    "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework_simplejwt.authentication.JWTAuthentication",),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("users.authentication.ClaimsJWTAuthentication",),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
@@ -134,8 +192,26 @@ SPECTACULAR_SETTINGS = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_USER_CLASS": "users.authentication.ClaimsUser",
 }
 
+# In-process cache of the users, whose claims version the authentication compares with the tokens': a status
+# change revokes the tokens in every process within USER_CACHE_TTL seconds
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 30))
+
+# Serve the list and detail endpoints with natively async views, set by config/asgi.py for ASGI servers
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS") == "True"
+
+# Prometheus metrics served at /metrics (api.metrics). With several worker processes, set METRICS_DIR to a directory
+# shared by the workers of the host and emptied when the server starts: each worker writes its metrics there every
+# METRICS_FLUSH_INTERVAL seconds and /metrics adds them up. Scrapes need 'Authorization: Bearer <METRICS_TOKEN>' if set
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Seconds between batched writes of the users' last login time, 0 writes it at each login
+LAST_LOGIN_FLUSH_INTERVAL = float(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", 0))
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .authentication import STATUS_CLAIMS, revoke_tokens
 from .models import User
 
 
@@ -11,3 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         "is_employee",
     )
     search_fields = ("email",)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and {*STATUS_CLAIMS, "is_active"} & set(form.changed_data):
+            revoke_tokens(obj.pk)
@@ -0,0 +1,104 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+
+from .models import User
+
+# User flags copied into the tokens and checked by users.permissions
+STATUS_CLAIMS = ("is_employee", "is_staff")
+# User.claims_version when the token was issued
+VERSION_CLAIM = "claims_version"
+
+
+def set_status_claims(token, user):
+    for claim in STATUS_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token[VERSION_CLAIM] = user.claims_version
+
+
+def revoke_tokens(*user_ids, **changes):
+    """Update the users with the changes, if any, and reject the tokens issued to them so far, whose claims
+    no longer match the users: their claims version is incremented in the same UPDATE. Every process rejects
+    the tokens once its user cache is refreshed, this one as soon as the transaction commits."""
+    User.objects.filter(pk__in=user_ids).update(claims_version=F("claims_version") + 1, **changes)
+
+    def discard():
+        for user_id in user_ids:
+            user_cache.discard(user_id)
+
+    transaction.on_commit(discard)
+
+
+class UserCache:
+    """Short-lived in-process cache of active users by id (as a string, like the token claim), bounded to
+    max_size entries. Each get returns a copy, so a request cannot change the cached instance."""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        user_id, now = str(user_id), time.monotonic()
+        with self.lock:
+            expires, user = self.users.get(user_id, (0, None))
+        if expires < now:
+            user = User.objects.filter(pk=user_id, is_active=True).first()
+            if user is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            with self.lock:
+                self.users[user_id] = (now + self.ttl, user)
+                self.users.move_to_end(user_id)
+                while len(self.users) > self.max_size:
+                    self.users.popitem(last=False)
+        return copy.copy(user)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.users.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+
+user_cache = UserCache(
+    ttl=getattr(settings, "USER_CACHE_TTL", 30), max_size=getattr(settings, "USER_CACHE_SIZE", 1000)
+)
+
+
+class ClaimsUser(TokenUser):
+    """User of a request authenticated by ClaimsJWTAuthentication. The status flags are the token claims,
+    views that need the full User get it from 'user', loaded through the in-process user cache."""
+
+    @cached_property
+    def is_employee(self):
+        return self.token.get("is_employee", False)
+
+    @cached_property
+    def user(self):
+        return user_cache.get(self.id)
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWT authentication authorizing from the token claims. Tokens issued before a status change of their
+    user (see revoke_tokens) or to inactive users are rejected, the user being read from the user cache,
+    so at most once per USER_CACHE_TTL seconds and process."""
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if any(claim not in validated_token for claim in (*STATUS_CLAIMS, VERSION_CLAIM)):
+            raise InvalidToken("Token contained no status claims")
+        if validated_token[VERSION_CLAIM] != user.user.claims_version:
+            raise AuthenticationFailed("Token was revoked after a status change", code="token_revoked")
+        return user
@@ -0,0 +1,64 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+class LastLoginBuffer:
+    """Collects the last login time of each user and writes them with one bulk update every
+    'interval' seconds from a background thread, instead of one UPDATE per login."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, user_id, at):
+        with self.lock:
+            self.pending[user_id] = at
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="last-login-flush", daemon=True)
+                self.thread.start()
+
+    def flush(self):
+        """Write the pending last login times, return the number of users updated."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        users = [User(pk=user_id, last_login=at) for user_id, at in pending.items()]
+        User.objects.bulk_update(users, ["last_login"], batch_size=500)
+        return len(users)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write last login times")
+            finally:
+                connection.close()
+
+
+last_login_buffer = LastLoginBuffer(interval=getattr(settings, "LAST_LOGIN_FLUSH_INTERVAL", 0))
+atexit.register(last_login_buffer.flush)
+
+
+def record_login(user):
+    """Set the user's last login time with a write of that column only, or in the next batch
+    when LAST_LOGIN_FLUSH_INTERVAL is set."""
+    user.last_login = timezone.now()
+    if last_login_buffer.interval:
+        last_login_buffer.add(user.pk, user.last_login)
+    else:
+        user.save(update_fields=["last_login"])
@@ -0,0 +1,81 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users.logins import last_login_buffer
+from users.models import User
+from users.views import UserTokenObtainPairView
+
+PASSWORD = "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the login throughput of the token endpoint: logins per second, latency percentiles and queries "
+        "per login. Throwaway users are created in a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--users", type=int, default=20, help="Number of distinct users logging in.")
+        parser.add_argument(
+            "--fast-hasher",
+            action="store_true",
+            help="Hash passwords with MD5 to measure the database cost without the password hashing.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        hashers = ["django.contrib.auth.hashers.MD5PasswordHasher"] if options["fast_hasher"] else None
+        with override_settings(**({"PASSWORD_HASHERS": hashers} if hashers else {})), transaction.atomic():
+            results = self.run(options)
+            transaction.set_rollback(True)
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{results['logins']} logins in {results['seconds']:.2f}s: {results['logins_per_second']:.1f} logins/s, "
+            f"p50 {results['p50_ms']:.1f}ms, p99 {results['p99_ms']:.1f}ms, "
+            f"{results['queries_per_login']:.1f} queries per login"
+        )
+
+    def run(self, options):
+        users = [User(email=f"benchmark-{i}@example.com") for i in range(options["users"])]
+        for user in users:
+            user.set_password(PASSWORD)
+        User.objects.bulk_create(users)
+
+        view = UserTokenObtainPairView.as_view()
+        factory = RequestFactory()
+        url = reverse("users:token_obtain_pair")
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for i in range(options["logins"]):
+                data = {"email": users[i % len(users)].email, "password": PASSWORD}
+                request = factory.post(url, data, content_type="application/json")
+                before = time.perf_counter()
+                response = view(request)
+                latencies.append(time.perf_counter() - before)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Login failed with status {response.status_code}: {response.data}")
+            seconds = time.perf_counter() - started
+            last_login_buffer.flush()
+
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            "logins": len(latencies),
+            "seconds": seconds,
+            "logins_per_second": len(latencies) / seconds,
+            "p50_ms": quantiles[49] * 1000,
+            "p99_ms": quantiles[98] * 1000,
+            "queries_per_login": len(queries) / len(latencies),
+            "batched_last_login": bool(last_login_buffer.interval),
+            "fast_hasher": options["fast_hasher"],
+        }
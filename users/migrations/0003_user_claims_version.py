@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="claims_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
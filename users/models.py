@@ -1,11 +1,14 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
 
 
 class User(AbstractUser):
     username = None
     email = models.EmailField(unique=True)
     is_employee = models.BooleanField(default=False, verbose_name="Is employee")
+    # Copied into the tokens and incremented when the status claims change, see users.authentication
+    claims_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name = "User"
@@ -13,6 +16,19 @@ class User(AbstractUser):
         ordering = [
             "email",
         ]
+        # keyset pagination by email and prefix filtering ('varchar_pattern_ops' on PostgreSQL, whose default
+        # collation cannot serve LIKE 'prefix%'), for all users and, partially, for employees only
+        indexes = [
+            models.Index(fields=["email", "id"], name="user_keyset_idx"),
+            models.Index(fields=["email", "id"], condition=Q(is_employee=True), name="employee_keyset_idx"),
+            models.Index(fields=["email"], opclasses=["varchar_pattern_ops"], name="user_email_prefix_idx"),
+            models.Index(
+                fields=["email"],
+                opclasses=["varchar_pattern_ops"],
+                condition=Q(is_employee=True),
+                name="employee_email_prefix_idx",
+            ),
+        ]
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
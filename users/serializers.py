@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 
+from .authentication import set_status_claims
 from .models import User
 
 
@@ -25,6 +28,37 @@ class EmployeeStatusUpdateSerializer(serializers.ModelSerializer):
         return data
 
 
+class UserIdentifiersSerializer(serializers.Serializer):
+    """Users identified by id and/or email."""
+
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    emails = serializers.ListField(child=serializers.EmailField(), required=False, default=list)
+
+
+class EmployeeStatusBulkUpdateSerializer(serializers.Serializer):
+    """Serializer for promoting and demoting many users at once."""
+
+    max_identifiers = 1000
+
+    promote = UserIdentifiersSerializer(required=False, default=dict)
+    demote = UserIdentifiersSerializer(required=False, default=dict)
+
+    def validate(self, data):
+        promote, demote = data["promote"], data["demote"]
+        count = sum(len(group.get(key, [])) for group in (promote, demote) for key in ("user_ids", "emails"))
+        if not count:
+            raise serializers.ValidationError("Provide at least one user id or email to promote or demote.")
+        if count > self.max_identifiers:
+            raise serializers.ValidationError(f"At most {self.max_identifiers} users can be updated at once.")
+        for key in ("user_ids", "emails"):
+            both = set(promote.get(key, [])) & set(demote.get(key, []))
+            if both:
+                raise serializers.ValidationError(
+                    f"Cannot both promote and demote: {', '.join(map(str, sorted(both)))}."
+                )
+        return data
+
+
 class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
     """Custom serializer for obtaining JWT token with additional user information."""
 
@@ -33,6 +67,20 @@ class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
         token = super().get_token(user)
 
         token["email"] = user.email
-        token["password"] = user.password
+        set_status_claims(token, user)
 
         return token
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh serializer setting the current status of the user in the new access token,
+    instead of the claims copied from the refresh token which may predate a status change."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user = User.objects.filter(pk=refresh.get(api_settings.USER_ID_CLAIM)).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        access = refresh.access_token
+        set_status_claims(access, user)
+        return {"access": str(access)}
@@ -1,7 +1,21 @@
+import json
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
+from users.authentication import ClaimsUser, revoke_tokens, user_cache
+from users.logins import last_login_buffer
 from users.models import User
 
 
@@ -45,3 +59,283 @@ class UserTestCase(APITestCase):
         data = {"user_id": 9}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    """Requests are authorized from the token claims, without loading the user."""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        # the ids of the users are reused by the next tests
+        self.addCleanup(user_cache.clear)
+        self.admin_user = User.objects.create(email="admin@mail.com", is_staff=True, is_employee=True)
+        self.user = User.objects.create(email="test@mail.com")
+        self.user.set_password("testpassword")
+        self.user.save()
+
+    def login(self, email="test@mail.com", password="testpassword"):
+        response = self.client.post(reverse("users:token_obtain_pair"), {"email": email, "password": password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def get_products(self, access):
+        return self.client.get(reverse("api:product-list"), HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_token_claims(self):
+        token = AccessToken(self.login()["access"])
+        self.assertEqual(token["email"], "test@mail.com")
+        self.assertIs(token["is_employee"], False)
+        self.assertIs(token["is_staff"], False)
+        self.assertNotIn("password", token.payload)
+
+    def test_user_is_loaded_once_per_cache_ttl(self):
+        self.user.is_employee = True
+        self.user.save()
+        access = self.login()["access"]
+        for expected in (1, 0):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get_products(access)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len([query for query in queries if "users_user" in query["sql"]]), expected)
+
+        response = self.client.get(reverse("users:users_list"), HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_token_without_status_claims_is_rejected(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_products(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_status_change_revokes_tokens(self):
+        tokens = self.login()
+        self.assertEqual(self.get_products(tokens["access"]).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("users:employee_status_update"), {"email": "test@mail.com"})
+        self.client.force_authenticate(user=None)
+        response = self.get_products(tokens["access"])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["code"], "token_revoked")
+
+        response = self.client.post(reverse("users:token_refresh"), {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIs(AccessToken(response.data["access"])["is_employee"], True)
+        self.assertEqual(self.get_products(response.data["access"]).status_code, status.HTTP_200_OK)
+
+    def test_revocation_by_another_process(self):
+        self.user.is_employee = True
+        self.user.save()
+        access = self.login()["access"]
+        self.assertEqual(self.get_products(access).status_code, status.HTTP_200_OK)
+        # the user cache of this process is not told
+        User.objects.filter(pk=self.user.pk).update(is_employee=False, claims_version=F("claims_version") + 1)
+        self.assertEqual(self.get_products(access).status_code, status.HTTP_200_OK)
+        later = time.monotonic() + user_cache.ttl + 1
+        with mock.patch("users.authentication.time.monotonic", return_value=later):
+            self.assertEqual(self.get_products(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_inactive_user_is_rejected(self):
+        access = self.login()["access"]
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get_products(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rejects_inactive_users(self):
+        refresh = self.login()["refresh"]
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(reverse("users:token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_cache(self):
+        claims_user = ClaimsUser(AccessToken(self.login()["access"]))
+        with self.assertNumQueries(1):
+            self.assertEqual(claims_user.user, self.user)
+            self.assertEqual(ClaimsUser(claims_user.token).user.email, "test@mail.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_tokens(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(ClaimsUser(claims_user.token).user.claims_version, 1)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoginTests(APITestCase):
+    """A login costs the authentication query and at most one write of the last login time."""
+
+    def setUp(self):
+        self.user = User.objects.create(email="test@mail.com")
+        self.user.set_password("testpassword")
+        self.user.save()
+        self.url = reverse("users:token_obtain_pair")
+        self.data = {"email": "test@mail.com", "password": "testpassword"}
+
+    def test_login_writes_last_login_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 2)
+        update = queries[1]["sql"]
+        self.assertTrue(update.startswith("UPDATE"))
+        self.assertIn("last_login", update)
+        self.assertNotIn("password", update)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_invalid_credentials(self):
+        response = self.client.post(self.url, {"email": "test@mail.com", "password": "wrong"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(self.url, {"email": "unknown@mail.com", "password": "testpassword"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_batched_last_login(self):
+        # no background thread, the batch is flushed by the test
+        with (
+            mock.patch.object(last_login_buffer, "interval", 60),
+            mock.patch.object(last_login_buffer, "thread", mock.Mock()),
+        ):
+            with self.assertNumQueries(1):
+                response = self.client.post(self.url, self.data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.user.refresh_from_db()
+            self.assertIsNone(self.user.last_login)
+            with self.assertNumQueries(1):
+                self.assertEqual(last_login_buffer.flush(), 1)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_login", logins=5, users=2, fast_hasher=True, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual(results["logins"], 5)
+        self.assertEqual(results["queries_per_login"], 2)
+        self.assertFalse(User.objects.filter(email__startswith="benchmark-").exists())
+
+
+class EmployeeStatusBulkUpdateTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        # the ids of the users are reused by the next tests
+        self.addCleanup(user_cache.clear)
+        self.admin_user = User.objects.create(email="admin@mail.com", is_staff=True, is_employee=True)
+        self.employees = [User.objects.create(email=f"employee{i}@mail.com", is_employee=True) for i in range(3)]
+        self.users = [User.objects.create(email=f"user{i}@mail.com") for i in range(3)]
+        self.url = reverse("users:employee_status_bulk_update")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def post(self, data):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data, format="json")
+        return response, [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+
+    def test_promote_and_demote_in_one_update(self):
+        data = {
+            "promote": {"user_ids": [self.users[0].pk], "emails": ["user1@mail.com", "employee2@mail.com"]},
+            "demote": {"user_ids": [self.employees[0].pk, self.users[2].pk], "emails": ["employee1@mail.com"]},
+        }
+        response, updates = self.post(data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(response.data["promoted"], [self.users[0].pk, self.users[1].pk])
+        self.assertEqual(response.data["demoted"], [self.employees[0].pk, self.employees[1].pk])
+        self.assertEqual(
+            set(User.objects.filter(is_employee=True).values_list("email", flat=True)),
+            {"admin@mail.com", "employee2@mail.com", "user0@mail.com", "user1@mail.com"},
+        )
+
+    def test_not_found_identifiers_are_reported(self):
+        data = {"promote": {"user_ids": [self.users[0].pk, 9999], "emails": ["missing@mail.com"]}}
+        response, updates = self.post(data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["promoted"], [self.users[0].pk])
+        self.assertEqual(response.data["not_found"], {"user_ids": [9999], "emails": ["missing@mail.com"]})
+
+    def test_unchanged_users_are_not_written(self):
+        response, updates = self.post({"promote": {"emails": ["employee0@mail.com"]}})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["promoted"], [])
+        self.assertEqual(updates, [])
+
+    def test_invalid_requests(self):
+        user = self.users[0]
+        for data in (
+            {},
+            {"promote": {"user_ids": []}},
+            {"promote": {"user_ids": [user.pk]}, "demote": {"user_ids": [user.pk]}},
+            {"promote": {"user_ids": [user.pk]}, "demote": {"emails": [user.email]}},
+            {"promote": {"emails": ["not an email"]}},
+        ):
+            response, updates = self.post(data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+            self.assertEqual(updates, [])
+
+    def test_admin_only(self):
+        self.client.force_authenticate(user=self.employees[0])
+        response, updates = self.post({"promote": {"user_ids": [self.users[0].pk]}})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_tokens_of_updated_users_are_revoked(self):
+        employee, user = self.employees[0], self.users[0]
+        user_cache.get(employee.pk)
+        self.post({"promote": {"user_ids": [user.pk]}, "demote": {"user_ids": [employee.pk]}})
+        versions = dict(User.objects.values_list("pk", "claims_version"))
+        self.assertEqual(versions[employee.pk], 1)
+        self.assertEqual(versions[user.pk], 1)
+        self.assertEqual(versions[self.employees[1].pk], 0)
+        self.assertNotIn(str(employee.pk), user_cache.users)
+
+
+class UserListingTests(APITestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create(email="admin@mail.com", is_staff=True, is_employee=True)
+        self.client.force_authenticate(user=self.admin_user)
+        for i in range(25):
+            User.objects.create(email=f"employee{i:02}@mail.com", is_employee=True)
+            User.objects.create(email=f"user{i:02}@mail.com")
+
+    def list_all(self, url, params=None):
+        emails, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            emails += [user["email"] for user in response.data["results"]]
+            pages += 1
+            if not response.data["next"]:
+                return emails, pages
+            response = self.client.get(response.data["next"])
+
+    def test_employees_cursor_pagination(self):
+        emails, pages = self.list_all(reverse("users:employees_list"))
+        self.assertEqual(emails, ["admin@mail.com"] + [f"employee{i:02}@mail.com" for i in range(25)])
+        self.assertEqual(pages, 2)
+
+    def test_users_cursor_pagination(self):
+        emails, pages = self.list_all(reverse("users:users_list"), {"page_size": 10})
+        self.assertEqual(len(emails), 51)
+        self.assertEqual(emails, sorted(emails))
+        self.assertEqual(pages, 6)
+
+    def test_email_prefix_filter(self):
+        emails, pages = self.list_all(reverse("users:employees_list"), {"email__startswith": "employee1"})
+        self.assertEqual(emails, [f"employee{i}@mail.com" for i in range(10, 20)])
+        emails, pages = self.list_all(reverse("users:users_list"), {"email__startswith": "user2"})
+        self.assertEqual(emails, [f"user{i}@mail.com" for i in range(20, 25)])
+
+    @skipUnless(connection.vendor == "postgresql", "index plans are checked on PostgreSQL")
+    def test_employee_listing_uses_partial_indexes(self):
+        def plan(queryset):
+            with transaction.atomic(), connection.cursor() as cursor:
+                # the few employees of the test would rather be sorted after a bitmap scan
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("SET LOCAL enable_bitmapscan = off")
+                return queryset.explain()
+
+        # employees are a small part of the users, with statistics that say so whatever the previous tests left
+        User.objects.bulk_create(User(email=f"employee1{i:04}-former@mail.com") for i in range(2000))
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {User._meta.db_table}")
+        employees = User.objects.filter(is_employee=True).order_by("email", "id")
+        self.assertIn("employee_keyset_idx", plan(employees[:20]))
+        # with the C collation the keyset index serves LIKE 'prefix%' as well
+        prefix_plan = plan(employees.filter(email__startswith="employee1"))
+        self.assertRegex(prefix_plan, r"employee_(email_prefix|keyset)_idx")
+        self.assertIn("Index Cond", prefix_plan)
@@ -1,14 +1,16 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
 
+from api.async_views import read_view
 from users.apps import UsersConfig
 
 from .views import (
     EmployeeListAPIView,
+    EmployeeStatusBulkUpdateAPIView,
     EmployeeStatusUpdateAPIView,
     UserCreateAPIView,
     UsersListAPIView,
     UserTokenObtainPairView,
+    UserTokenRefreshView,
 )
 
 app_name = UsersConfig.name
@@ -16,8 +18,13 @@ app_name = UsersConfig.name
 urlpatterns = [
     path("register/", UserCreateAPIView.as_view(), name="register"),
     path("login/", UserTokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-    path("employees/", EmployeeListAPIView.as_view(), name="employees_list"),
-    path("", UsersListAPIView.as_view(), name="users_list"),
+    path("token/refresh/", UserTokenRefreshView.as_view(), name="token_refresh"),
+    path("employees/", read_view(EmployeeListAPIView), name="employees_list"),
+    path("", read_view(UsersListAPIView), name="users_list"),
     path("employee/status/update/", EmployeeStatusUpdateAPIView.as_view(), name="employee_status_update"),
+    path(
+        "employee/status/bulk-update/",
+        EmployeeStatusBulkUpdateAPIView.as_view(),
+        name="employee_status_bulk_update",
+    ),
 ]
@@ -1,11 +1,33 @@
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
 from rest_framework import generics, views
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from api.async_views import AsyncListMixin
+from api.paginators import KeysetPagination
+
+from .authentication import revoke_tokens
+from .logins import record_login
 from .models import User
 from .permissions import IsAdmin
-from .serializers import EmployeeStatusUpdateSerializer, UserSerializer, UserTokenObtainPairSerializer
+from .serializers import (
+    EmployeeStatusBulkUpdateSerializer,
+    EmployeeStatusUpdateSerializer,
+    UserSerializer,
+    UserTokenObtainPairSerializer,
+    UserTokenRefreshSerializer,
+)
+
+
+class UserPagination(KeysetPagination):
+    """Cursor pagination of users, '?cursor=' is set by the 'next' and 'previous' links."""
+
+    page_size = 20
+    max_page_size = 100
 
 
 class UserCreateAPIView(generics.CreateAPIView):
@@ -27,7 +49,8 @@ class UserCreateAPIView(generics.CreateAPIView):
 
 
 class EmployeeStatusUpdateAPIView(views.APIView):
-    """API view to update the employee status of a user."""
+    """API view to update the employee status of a user.
+    The tokens issued to the user before the change are revoked, as their claims are outdated."""
 
     serializer_class = EmployeeStatusUpdateSerializer
     permission_classes = (IsAdmin,)
@@ -44,6 +67,7 @@ class EmployeeStatusUpdateAPIView(views.APIView):
             else:
                 user.is_employee = True
                 user.save()
+                revoke_tokens(user.pk)
                 return Response({"status": "Employee status updated successfully"})
         elif email:
             try:
@@ -53,34 +77,101 @@ class EmployeeStatusUpdateAPIView(views.APIView):
             else:
                 user.is_employee = True
                 user.save()
+                revoke_tokens(user.pk)
                 return Response({"status": "Employee status updated successfully"})
         return Response({"error": "Please provide either user_id or email"}, status=400)
 
 
-class UsersListAPIView(generics.ListAPIView):
-    """API view to list all users. Only accessible by admin users."""
+class EmployeeStatusBulkUpdateAPIView(generics.GenericAPIView):
+    """API view to promote and demote many users at once, identified by ids and/or emails.
+    Both are applied with a single UPDATE, only to the users whose status changes, and their tokens are revoked.
+    Identifiers matching no user are reported."""
+
+    serializer_class = EmployeeStatusBulkUpdateSerializer
+    permission_classes = (IsAdmin,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        groups = {
+            True: serializer.validated_data["promote"],
+            False: serializer.validated_data["demote"],
+        }
+        user_ids = {pk for group in groups.values() for pk in group.get("user_ids", [])}
+        emails = {email for group in groups.values() for email in group.get("emails", [])}
+
+        with transaction.atomic():
+            users = list(
+                User.objects.select_for_update()
+                .filter(Q(pk__in=user_ids) | Q(email__in=emails))
+                .values_list("pk", "email", "is_employee")
+            )
+            targets = {}
+            for pk, email, is_employee in users:
+                wanted = {
+                    status
+                    for status, group in groups.items()
+                    if pk in group.get("user_ids", []) or email in group.get("emails", [])
+                }
+                if len(wanted) > 1:
+                    raise ValidationError({"non_field_errors": [f"Cannot both promote and demote {email}."]})
+                if wanted != {is_employee}:
+                    targets[pk] = wanted.pop()
+            promoted = sorted(pk for pk, status in targets.items() if status)
+            demoted = sorted(pk for pk, status in targets.items() if not status)
+            if targets:
+                revoke_tokens(
+                    *targets, is_employee=Case(When(pk__in=promoted, then=Value(True)), default=Value(False))
+                )
+
+        return Response(
+            {
+                "promoted": promoted,
+                "demoted": demoted,
+                "not_found": {
+                    "user_ids": sorted(user_ids - {pk for pk, email, is_employee in users}),
+                    "emails": sorted(emails - {email for pk, email, is_employee in users}),
+                },
+            }
+        )
+
+
+class UsersListAPIView(AsyncListMixin, generics.ListAPIView):
+    """API view to list all users by email with cursor pagination. Only accessible by admin users.
+    Allows filtering by email prefix ('?email__startswith=')."""
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (IsAdmin,)
+    pagination_class = UserPagination
+    filterset_fields = {"email": ["startswith"]}
 
 
-class EmployeeListAPIView(generics.ListAPIView):
-    """API view to list all employees. Only accessible by admin users."""
+class EmployeeListAPIView(UsersListAPIView):
+    """API view to list all employees by email with cursor pagination. Only accessible by admin users.
+    Allows filtering by email prefix ('?email__startswith=')."""
 
     queryset = User.objects.filter(is_employee=True)
-    serializer_class = UserSerializer
-    permission_classes = (IsAdmin,)
 
 
 class UserTokenObtainPairView(TokenObtainPairView):
-    """Custom view to obtain JWT token with additional user information."""
+    """Custom view to obtain JWT token with additional user information.
+    A login costs the authentication query and the write of the last login time (see users.logins)."""
 
     serializer_class = UserTokenObtainPairSerializer
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        user = User.objects.get(email=request.data["email"])
-        user.save()
-        return response
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        record_login(serializer.user)
+        return Response(serializer.validated_data)
+
+
+class UserTokenRefreshView(TokenRefreshView):
+    """Custom view to refresh JWT access tokens with the current user status."""
+
+    serializer_class = UserTokenRefreshSerializer